@@ -0,0 +1,29 @@
+'''
+Search backends, which all find the lines within notes files that
+match a pattern, so that the engine used to search the notes can
+be chosen in the config
+'''
+
+from shorthand.backends.grep import GrepBackend
+from shorthand.backends.ripgrep import RipgrepBackend
+from shorthand.backends.python import PythonBackend
+
+
+BACKENDS = ['grep', 'ripgrep', 'python']
+
+
+def get_backend(notes_config):
+    '''Get the search backend selected by the `search_backend` in a
+    notes config, which defaults to grep
+    '''
+
+    backend_name = notes_config.get('search_backend', 'grep')
+    if backend_name == 'grep':
+        return GrepBackend(notes_config.get('grep_path', 'grep'))
+    elif backend_name == 'ripgrep':
+        return RipgrepBackend(notes_config.get('ripgrep_path', 'rg'))
+    elif backend_name == 'python':
+        return PythonBackend()
+    else:
+        raise ValueError(f'Unknown search backend {backend_name}. Valid '
+                         f'options are: {", ".join(BACKENDS)}')
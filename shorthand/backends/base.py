@@ -0,0 +1,121 @@
+'''
+Interface shared by all search backends
+'''
+
+import re
+import logging
+
+from shorthand.utils.patterns import translate_grep_pattern
+
+
+log = logging.getLogger(__name__)
+
+
+def compile_pattern(pattern, syntax='perl', case_sensitive=True):
+    '''Compile a pattern in the given syntax into a Python regex
+
+    `syntax` is either `perl` for Perl compatible patterns, which
+        are used as is, or `basic` for grep basic regular expressions
+    '''
+
+    if syntax == 'basic':
+        pattern = translate_grep_pattern(pattern)
+    elif syntax != 'perl':
+        raise ValueError(f'Unknown pattern syntax {syntax}')
+
+    flags = 0
+    if not case_sensitive:
+        flags = re.IGNORECASE
+    return re.compile(pattern, flags)
+
+
+def filter_matches(matches, filters=None, excludes=None, syntax='perl',
+                   case_sensitive=True):
+    '''Lazily filter matches down to those whose line matches all of
+    the `filters` patterns and none of the `excludes` patterns
+    '''
+
+    filter_regexes = [compile_pattern(filter_pattern, syntax,
+                                      case_sensitive)
+                      for filter_pattern in filters or []]
+    exclude_regexes = [compile_pattern(exclude_pattern, syntax,
+                                       case_sensitive)
+                       for exclude_pattern in excludes or []]
+
+    for match in matches:
+        line = match['line']
+        if not all([regex.search(line) for regex in filter_regexes]):
+            continue
+        if any([regex.search(line) for regex in exclude_regexes]):
+            continue
+        yield match
+
+
+class SearchBackend(object):
+    """Finds the lines within notes files which match a pattern
+
+    Subclasses implement `search` to find the lines matching a single
+    pattern, and may implement `iter_search` to find them lazily. Any
+    further filters are applied to the lines found
+    """
+
+    def find_lines(self, directory, pattern, context_after=0,
+                   case_sensitive=True, syntax='perl', filters=None,
+                   excludes=None):
+        '''Find all lines within notes files under a directory which match
+        a pattern. Returns a list of matches of the form:
+        {
+            "file_path": "/full/path/to/file.note",
+            "line_number": "12",
+            "line": "Content of the matching line",
+            "context_after": ["Content of the following line"]
+        }
+
+        `context_after` is the number of lines following each match
+            to include with it
+        `case_sensitive` toggles whether all patterns are matched
+            case sensitive
+        `syntax` is the syntax of all patterns, either `perl` or `basic`
+        `filters` are further patterns which a line must also match
+        `excludes` are patterns which a line must not match
+        '''
+
+        matches = self.search(directory, pattern,
+                              context_after=context_after,
+                              case_sensitive=case_sensitive,
+                              syntax=syntax)
+        return list(filter_matches(matches, filters, excludes, syntax,
+                                   case_sensitive))
+
+    def iter_lines(self, directory, pattern, context_after=0,
+                   case_sensitive=True, syntax='perl', filters=None,
+                   excludes=None):
+        '''Lazily find the lines within notes files under a directory
+        which match a pattern, taking the same arguments and yielding
+        matches of the same form as `find_lines`. Backends which can
+        search lazily stop searching when the caller stops iterating
+        '''
+
+        matches = self.iter_search(directory, pattern,
+                                   context_after=context_after,
+                                   case_sensitive=case_sensitive,
+                                   syntax=syntax)
+        return filter_matches(matches, filters, excludes, syntax,
+                              case_sensitive)
+
+    def search(self, directory, pattern, context_after=0,
+               case_sensitive=True, syntax='perl'):
+        '''Find all lines within notes files under a directory which
+        match a single pattern, in the same form as `find_lines`
+        '''
+        raise NotImplementedError
+
+    def iter_search(self, directory, pattern, context_after=0,
+                    case_sensitive=True, syntax='perl'):
+        '''Lazily find the lines matching a single pattern. By default
+        this runs the full search up front
+        '''
+        return iter(self.search(directory, pattern,
+                                context_after=context_after,
+                                case_sensitive=case_sensitive,
+                                syntax=syntax))
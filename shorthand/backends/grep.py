@@ -0,0 +1,147 @@
+'''
+Search backend which runs grep, or a tool with grep compatible output
+'''
+
+import logging
+from tempfile import TemporaryFile
+from subprocess import Popen, PIPE
+
+from shorthand.backends.base import SearchBackend
+
+
+log = logging.getLogger(__name__)
+
+
+def parse_output(output, context_after=0):
+    '''Parse the output of a search run with null separated file names
+    and line numbers, where matching lines are of the form
+    `path\\0number:content` and context lines are `path\\0number-content`
+    '''
+
+    records = []
+    for output_line in output.decode('utf-8', errors='replace').split('\n'):
+        if '\0' not in output_line:
+            # Blank lines and `--` separators between groups of context
+            continue
+        file_path, numbered_line = output_line.split('\0', 1)
+        if not numbered_line:
+            continue
+        for separator_idx, character in enumerate(numbered_line):
+            if not character.isdigit():
+                break
+        records.append({
+            'file_path': file_path,
+            'line_number': numbered_line[:separator_idx],
+            'is_match': numbered_line[separator_idx] == ':',
+            'line': numbered_line[separator_idx + 1:]
+        })
+
+    matches = []
+    for idx, record in enumerate(records):
+        if not record['is_match']:
+            continue
+
+        # Context lines directly follow their match, which may
+        # itself be printed as a match rather than as context
+        following_lines = []
+        line_number = int(record['line_number'])
+        for next_record in records[idx + 1:idx + 1 + context_after]:
+            if next_record['file_path'] != record['file_path'] or \
+                    int(next_record['line_number']) != line_number + 1:
+                break
+            following_lines.append(next_record['line'])
+            line_number += 1
+
+        matches.append({
+            'file_path': record['file_path'],
+            'line_number': record['line_number'],
+            'line': record['line'],
+            'context_after': following_lines
+        })
+
+    return matches
+
+
+def run_command(command, context_after=0):
+    '''Run a search command to completion and parse all of its output
+    '''
+
+    log.debug(f'Running search command {command}')
+    proc = Popen(command, stdout=PIPE, stderr=PIPE)
+    output, err = proc.communicate()
+    if proc.returncode > 1:
+        log.error(f'{command[0]} failed with {err.decode().strip()}')
+
+    return parse_output(output, context_after)
+
+
+def stream_command(command):
+    '''Run a search command without context lines, yielding each match
+    as soon as it is output. The command is stopped if the caller stops
+    iterating before it has finished
+    '''
+
+    log.debug(f'Streaming search command {command}')
+    # Errors go to a file rather than a pipe, so that a command which
+    # writes a lot of them can't block while stdout is being read
+    with TemporaryFile() as err_file:
+        proc = Popen(command, stdout=PIPE, stderr=err_file)
+        try:
+            for output_line in proc.stdout:
+                yield from parse_output(output_line)
+        finally:
+            proc.stdout.close()
+            if proc.poll() is None:
+                proc.terminate()
+            proc.wait()
+            err_file.seek(0)
+            err = err_file.read()
+    if proc.returncode > 1:
+        log.error(f'{command[0]} failed with {err.decode().strip()}')
+
+
+class GrepBackend(SearchBackend):
+    """Search backend which runs GNU grep. Perl compatible patterns
+    need a grep which supports `-P`
+    """
+
+    def __init__(self, grep_path='grep'):
+        super(GrepBackend, self).__init__()
+        self.grep_path = grep_path
+
+    def get_command(self, directory, pattern, context_after=0,
+                    case_sensitive=True, syntax='perl'):
+        '''Get the grep command to search a directory with
+        '''
+
+        command = [self.grep_path, '-rnZ', '--include=*.note']
+        if syntax == 'perl':
+            command.append('-P')
+        elif syntax == 'basic':
+            command.append('-G')
+        else:
+            raise ValueError(f'Unknown pattern syntax {syntax}')
+        if not case_sensitive:
+            command.append('-i')
+        if context_after:
+            command.extend(['-A', str(context_after)])
+        command.extend(['-e', pattern, directory])
+        return command
+
+    def search(self, directory, pattern, context_after=0,
+               case_sensitive=True, syntax='perl'):
+        command = self.get_command(directory, pattern, context_after,
+                                   case_sensitive, syntax)
+        return run_command(command, context_after)
+
+    def iter_search(self, directory, pattern, context_after=0,
+                    case_sensitive=True, syntax='perl'):
+        if context_after:
+            # Context lines can't be matched up until grep moves on
+            return super(GrepBackend, self).iter_search(
+                directory, pattern, context_after=context_after,
+                case_sensitive=case_sensitive, syntax=syntax)
+        command = self.get_command(directory, pattern,
+                                   case_sensitive=case_sensitive,
+                                   syntax=syntax)
+        return stream_command(command)
@@ -0,0 +1,91 @@
+'''
+Search backend which runs in-process with Python regexes, so that
+it has no external dependencies
+'''
+
+import re
+import logging
+
+from shorthand.backends.base import SearchBackend, compile_pattern
+from shorthand.utils.files import get_notes_files, read_note_lines
+from shorthand.utils.parallel import PARALLEL_SCAN_MIN_FILES, \
+    get_worker_count, get_file_batches, get_scan_pool
+
+
+log = logging.getLogger(__name__)
+
+
+def search_files(full_paths, regex, context_after=0):
+    '''Search a batch of notes files for the lines matching a
+    compiled regex
+    '''
+
+    matches = []
+    for full_path in full_paths:
+        try:
+            lines = read_note_lines(full_path)
+        except FileNotFoundError:
+            continue
+
+        # There is no line after a trailing newline
+        if lines and lines[-1] == '':
+            lines = lines[:-1]
+
+        for idx, line in enumerate(lines):
+            if not regex.search(line):
+                continue
+            matches.append({
+                'file_path': full_path,
+                'line_number': str(idx + 1),
+                'line': line,
+                'context_after': lines[idx + 1:idx + 1 + context_after]
+            })
+
+    return matches
+
+
+class PythonBackend(SearchBackend):
+    """Search backend which reads every notes file and matches
+    lines with Python regexes. Larger notes directories are
+    searched across the same pool of processes as scans
+    """
+
+    def __init__(self, workers=None):
+        super(PythonBackend, self).__init__()
+        self.workers = get_worker_count(workers)
+
+    def search(self, directory, pattern, context_after=0,
+               case_sensitive=True, syntax='perl'):
+        return list(self.iter_search(directory, pattern,
+                                     context_after=context_after,
+                                     case_sensitive=case_sensitive,
+                                     syntax=syntax))
+
+    def iter_search(self, directory, pattern, context_after=0,
+                    case_sensitive=True, syntax='perl'):
+
+        try:
+            regex = compile_pattern(pattern, syntax, case_sensitive)
+        except re.error as e:
+            # The same as grep, an invalid pattern matches nothing
+            log.error(f'Invalid pattern {pattern}: {e}')
+            return
+
+        notes_files = get_notes_files(directory)
+        if self.workers < 2 or len(notes_files) < PARALLEL_SCAN_MIN_FILES:
+            # Files are searched one at a time so that matches are
+            # yielded as soon as each file has been read
+            for full_path in notes_files:
+                yield from search_files([full_path], regex,
+                                        context_after=context_after)
+            return
+
+        batches = get_file_batches(notes_files, self.workers)
+        log.debug(f'Searching {len(notes_files)} notes files in '
+                  f'{directory} with {self.workers} processes')
+
+        # Results come back in the same order as the batches
+        for batch_matches in get_scan_pool(self.workers).map(
+                search_files, batches, [regex] * len(batches),
+                [context_after] * len(batches)):
+            yield from batch_matches
@@ -0,0 +1,66 @@
+'''
+Search backend which runs ripgrep
+'''
+
+import logging
+
+from shorthand.backends.base import SearchBackend
+from shorthand.backends.grep import run_command, stream_command
+from shorthand.utils.patterns import translate_grep_pattern
+
+
+log = logging.getLogger(__name__)
+
+
+class RipgrepBackend(SearchBackend):
+    """Search backend which runs ripgrep. Perl compatible patterns
+    need a ripgrep which is built with PCRE2 support
+    """
+
+    def __init__(self, ripgrep_path='rg'):
+        super(RipgrepBackend, self).__init__()
+        self.ripgrep_path = ripgrep_path
+
+    def get_command(self, directory, pattern, context_after=0,
+                    case_sensitive=True, syntax='perl'):
+        '''Get the ripgrep command to search a directory with
+        '''
+
+        # Search everything that grep would, ignoring any config,
+        # ignore files, or hidden file filtering
+        command = [self.ripgrep_path, '--no-config', '--no-ignore',
+                   '--hidden', '--no-heading', '--with-filename',
+                   '--line-number', '--null', '--glob', '*.note']
+        if syntax == 'perl':
+            command.append('--pcre2')
+        elif syntax == 'basic':
+            # Ripgrep has no basic syntax, but translated patterns
+            # only use syntax which its default engine shares
+            pattern = translate_grep_pattern(pattern)
+        else:
+            raise ValueError(f'Unknown pattern syntax {syntax}')
+        if case_sensitive:
+            command.append('--case-sensitive')
+        else:
+            command.append('--ignore-case')
+        if context_after:
+            command.extend(['--after-context', str(context_after)])
+        command.extend(['-e', pattern, directory])
+        return command
+
+    def search(self, directory, pattern, context_after=0,
+               case_sensitive=True, syntax='perl'):
+        command = self.get_command(directory, pattern, context_after,
+                                   case_sensitive, syntax)
+        return run_command(command, context_after)
+
+    def iter_search(self, directory, pattern, context_after=0,
+                    case_sensitive=True, syntax='perl'):
+        if context_after:
+            return super(RipgrepBackend, self).iter_search(
+                directory, pattern, context_after=context_after,
+                case_sensitive=case_sensitive, syntax=syntax)
+        command = self.get_command(directory, pattern,
+                                   case_sensitive=case_sensitive,
+                                   syntax=syntax)
+        return stream_command(command)
@@ -1,82 +1,115 @@
 import re
 import logging
-from subprocess import Popen, PIPE
+from datetime import datetime
 
+from shorthand.backends import GrepBackend
 from shorthand.todo_tools import get_todos
 from shorthand.question_tools import get_questions
 from shorthand.utils.patterns import DATED_HEADING_PATTERN
+from shorthand.utils.paths import is_in_directory
 
 
 dated_heading_regex = re.compile(DATED_HEADING_PATTERN)
 
+# Calendar event types for each todo status, in the order they are shown
+TODO_EVENT_TYPES = {
+    'incomplete': 'incomplete_todo',
+    'complete': 'completed_todo',
+    'skipped': 'skipped_todo'
+}
+
 
 log = logging.getLogger(__name__)
 
 
-def get_calendar(notes_directory, directory_filter=None, grep_path='grep'):
+def get_calendar(notes_directory, directory_filter=None, grep_path='grep',
+                 elements=None, backend=None, start=None, end=None,
+                 element_index=None, refresh=True):
+    '''Get all dated events within the notes organized by year,
+    month, and day
 
-    events = []
-    calendar = {}
+    If `elements` from a scan of the notes directory are provided
+        then all events are taken from those instead of grep
+    `backend` is the search backend to find events with, which
+        defaults to grep
+    `start` and `end` are inclusive dates of the form `YYYY-MM-DD`
+        which limit the calendar to the events between them
+    If an `element_index` is provided then only the events within the
+        date range are looked up from its calendar view, instead of
+        finding all events and filtering them
+    `refresh` toggles whether the `element_index` checks every notes
+        file for changes first. It can be turned off when the index is
+        kept current by a watcher instead
+    '''
 
-    search_directory = notes_directory
-    if directory_filter:
-        if search_directory[-1] != '/':
-            search_directory += '/'
-        search_directory += directory_filter
+    if element_index is not None:
+        events = element_index.get_calendar_events(
+            start=start, end=end, directory_filter=directory_filter,
+            refresh=refresh)
+    elif elements is not None:
+        current_date_stamp = datetime.now().isoformat()[:10]
+        events = [event for event, start_date
+                  in get_element_events(elements, directory_filter)
+                  if not is_future_todo(start_date, current_date_stamp)]
+    else:
+        events = get_found_events(notes_directory, directory_filter,
+                                  grep_path, backend)
 
-    grep_command = '{grep_path} -Prn "{pattern}" '\
-                   '--include="*.note" {dir}'.format(
-                        grep_path=grep_path,
-                        pattern=DATED_HEADING_PATTERN,
-                        dir=search_directory)
+    return build_calendar(events, start, end)
 
-    proc = Popen(
-        grep_command,
-        stdout=PIPE, stderr=PIPE,
-        shell=True)
-    output, err = proc.communicate()
-    output_lines = output.decode().split('\n')
 
-    # Create events from parsed headings
-    for line in output_lines:
+def build_calendar(events, start=None, end=None):
+    '''Organize events by year, month, and day, leaving out any
+    events which aren't dated or are outside of the date range
+    '''
 
-        if not line.strip():
+    calendar = {}
+    for event in events:
+        event_date = event['date']
+        if not event_date:
+            continue
+        if start and event_date < start:
+            continue
+        if end and event_date > end:
             continue
 
-        split_line = line.split(':', 2)
-        file_path = split_line[0]
-        line_number = split_line[1]
-        heading_raw = split_line[2]
+        event_year = event_date[:4]
+        event_month = event_date[5:7]
+        event_day = event_date[8:]
 
-        heading_match = dated_heading_regex.match(heading_raw)
-        if not heading_match:
-            print('NO MATCH FOUND?!?!')
-        else:
-            heading_text = heading_match.group(3).strip()
-            date = heading_match.group(4).strip()
+        calendar.setdefault(event_year, {})
+        calendar[event_year].setdefault(event_month, {})
+        calendar[event_year][event_month].setdefault(event_day, [])
+        calendar[event_year][event_month][event_day].append(event)
 
-        if notes_directory in file_path:
-            file_path = file_path[len(notes_directory):]
+    return calendar
 
-        split_heading = heading_raw.split(' ', 1)
-        element_id = split_heading[1].replace(' ', '-')
 
-        parsed_heading = {
-            "file_path": file_path,
-            "line_number": line_number,
-            "event": heading_text,
-            "date": date,
-            "element_id": element_id,
-            "type": "section"
-        }
+def is_future_todo(start_date, current_date_stamp):
+    '''Check whether a todo start date is in the future, in which case
+    the todo is left off the calendar
+    '''
+    return bool(start_date) and start_date > current_date_stamp
 
-        events.append(parsed_heading)
+
+def get_found_events(notes_directory, directory_filter=None,
+                     grep_path='grep', backend=None):
+    '''Get all events by searching the notes directory for each type
+    of element with the search backend
+    '''
+
+    events = []
+
+    # Create events from dated headings
+    events.extend(get_dated_headings(notes_directory, directory_filter,
+                                     grep_path, backend))
 
     # Add Incomplet Todos to the calendar view
     completed_todos = get_todos(notes_directory=notes_directory,
                                 todo_status='incomplete',
                                 directory_filter=directory_filter,
-                                query_string=None, grep_path=grep_path)
+                                query_string=None, grep_path=grep_path,
+                                backend=backend)
     for todo in completed_todos:
         parsed_todo = {
             "file_path": todo['file_path'],
@@ -92,7 +125,8 @@ def get_calendar(notes_directory, directory_filter=None, grep_path='grep'):
     completed_todos = get_todos(notes_directory=notes_directory,
                                 todo_status='complete',
                                 directory_filter=directory_filter,
-                                query_string=None, grep_path=grep_path)
+                                query_string=None, grep_path=grep_path,
+                                backend=backend)
     for todo in completed_todos:
         parsed_todo = {
             "file_path": todo['file_path'],
@@ -108,7 +142,8 @@ def get_calendar(notes_directory, directory_filter=None, grep_path='grep'):
     skipped_todos = get_todos(notes_directory=notes_directory,
                               todo_status='skipped',
                               directory_filter=directory_filter,
-                              query_string=None, grep_path=grep_path)
+                              query_string=None, grep_path=grep_path,
+                              backend=backend)
     for todo in skipped_todos:
         parsed_todo = {
             "file_path": todo['file_path'],
@@ -124,7 +159,7 @@ def get_calendar(notes_directory, directory_filter=None, grep_path='grep'):
     questions = get_questions(
         notes_directory=notes_directory,
         question_status='ALL', directory_filter=directory_filter,
-        grep_path=grep_path)
+        grep_path=grep_path, backend=backend)
     for question in questions:
         if question.get('question_date'):
             parsed_question = {
@@ -147,19 +182,133 @@ def get_calendar(notes_directory, directory_filter=None, grep_path='grep'):
             }
             events.append(parsed_answer)
 
-    # Create Calendar from events
-    for event in events:
-        event_date = event['date']
-        if not event_date:
+    return events
+
+
+def get_dated_headings(notes_directory, directory_filter=None,
+                       grep_path='grep', backend=None):
+    '''Get calendar events for all headings which end in a date stamp
+    '''
+
+    if backend is None:
+        backend = GrepBackend(grep_path)
+
+    events = []
+
+    search_directory = notes_directory
+    if directory_filter:
+        if search_directory[-1] != '/':
+            search_directory += '/'
+        search_directory += directory_filter
+
+    matches = backend.find_lines(search_directory, DATED_HEADING_PATTERN)
+
+    # Create events from parsed headings
+    for match in matches:
+
+        file_path = match['file_path']
+        line_number = match['line_number']
+        heading_raw = match['line']
+
+        heading_match = dated_heading_regex.match(heading_raw)
+        if not heading_match:
+            print('NO MATCH FOUND?!?!')
+        else:
+            heading_text = heading_match.group(3).strip()
+            date = heading_match.group(4).strip()
+
+        if notes_directory in file_path:
+            file_path = file_path[len(notes_directory):]
+
+        split_heading = heading_raw.split(' ', 1)
+        element_id = split_heading[1].replace(' ', '-')
+
+        parsed_heading = {
+            "file_path": file_path,
+            "line_number": line_number,
+            "event": heading_text,
+            "date": date,
+            "element_id": element_id,
+            "type": "section"
+        }
+
+        events.append(parsed_heading)
+
+    return events
+
+
+def get_scanned_headings(elements, directory_filter=None):
+    '''Get calendar events for the dated headings found by a
+    scan of the notes directory
+    '''
+
+    events = []
+    for heading in elements['headings']:
+        if not is_in_directory(heading['file_path'], directory_filter):
             continue
+        events.append({
+            "file_path": heading['file_path'],
+            "line_number": heading['line_number'],
+            "event": heading['event'],
+            "date": heading['date'],
+            "element_id": heading['element_id'],
+            "type": "section"
+        })
 
-        event_year = event_date[:4]
-        event_month = event_date[5:7]
-        event_day = event_date[8:]
+    return events
 
-        calendar.setdefault(event_year, {})
-        calendar[event_year].setdefault(event_month, {})
-        calendar[event_year][event_month].setdefault(event_day, [])
-        calendar[event_year][event_month][event_day].append(event)
 
-    return calendar
+def get_element_events(elements, directory_filter=None):
+    '''Get calendar events for all elements found by a scan of the
+    notes directory, in the same order as a search would find them
+
+    Returns a list of `(event, start_date)` pairs, where `start_date`
+    is the start date of the todo which the event is for, so that
+    todos in the future can be left out
+    '''
+
+    events = [(event, None)
+              for event in get_scanned_headings(elements, directory_filter)]
+
+    todo_events = {todo_status: [] for todo_status in TODO_EVENT_TYPES}
+    for todo in elements['todos']:
+        if not is_in_directory(todo['file_path'], directory_filter):
+            continue
+        if todo['status'] == 'incomplete':
+            event_date = todo['start_date']
+        else:
+            event_date = todo['end_date']
+        todo_events[todo['status']].append(({
+            "file_path": todo['file_path'],
+            "line_number": todo['line_number'],
+            "event": todo['todo_text'],
+            "date": event_date,
+            "element_id": "",
+            "type": TODO_EVENT_TYPES[todo['status']]
+        }, todo['start_date']))
+    for todo_status in TODO_EVENT_TYPES:
+        events.extend(todo_events[todo_status])
+
+    for question in elements['questions']:
+        if not is_in_directory(question['file_path'], directory_filter):
+            continue
+        if question.get('question_date'):
+            events.append(({
+                "file_path": question['file_path'],
+                "line_number": question['line_number'],
+                "event": question['question'],
+                "date": question['question_date'],
+                "element_id": "",
+                "type": "question"
+            }, None))
+        if question.get('answer_date'):
+            events.append(({
+                "file_path": question['file_path'],
+                "line_number": str(int(question['line_number']) + 1),
+                "event": question['answer'],
+                "date": question['answer_date'],
+                "element_id": "",
+                "type": "answer"
+            }, None))
+
+    return events
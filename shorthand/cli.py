@@ -7,6 +7,9 @@ from shorthand.utils.config import get_notes_config
 from shorthand.utils.logging import setup_logging
 from shorthand.todo_tools import get_todos
 from shorthand.stamping import stamp_notes
+from shorthand.backends import get_backend
+from shorthand.utils.element_index import ElementIndex
+from shorthand.utils.watcher import NotesWatcher
 
 
 SHORTHAND_CONFIG = get_notes_config()
@@ -29,7 +32,8 @@ def main(args):
     if args.action == 'stamp':
         log.info('Stamping Notes')
         changes = stamp_notes(notes_directory,
-                              grep_path=notes_config['grep_path'])
+                              grep_path=notes_config['grep_path'],
+                              backend=get_backend(notes_config))
         for file in changes.keys():
             print(f'\n<<--{file}-->>')
             for change in changes[file]:
@@ -40,14 +44,55 @@ def main(args):
 
     elif args.action == 'list':
         log.info('Listing Todos')
-        print(get_todos(notes_directory, args.status))
+        print(get_todos(notes_directory, args.status,
+                        grep_path=notes_config['grep_path'],
+                        backend=get_backend(notes_config)))
+
+    elif args.action == 'watch':
+        log.info('Watching Notes')
+        watch_notes(notes_config)
+
+
+def watch_notes(notes_config):
+    """Watch the notes directory until interrupted, stamping and
+    re-indexing only the notes which change
+    """
+
+    notes_directory = notes_config['notes_directory']
+    backend = get_backend(notes_config)
+
+    element_index = None
+    if notes_config.get('element_source') == 'index':
+        element_index = ElementIndex(notes_directory,
+                                     notes_config['cache_directory'])
+
+    def handle_changes(changed_paths):
+        # `changed_paths` is None when anything may have changed
+        changes = stamp_notes(notes_directory,
+                              grep_path=notes_config['grep_path'],
+                              paths=changed_paths, backend=backend)
+        for file, file_changes in changes.items():
+            log.info(f'Stamped {len(file_changes)} elements in {file}')
+        if element_index is not None:
+            element_index.refresh(paths=changed_paths)
+
+    # Catch up on anything which changed while not watching
+    handle_changes(None)
+
+    watcher = NotesWatcher(notes_directory, handle_changes,
+                           debounce_seconds=notes_config.get(
+                               'watch_debounce_seconds', 0.5))
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        log.info('Stopped watching notes')
 
 
 def parse_args():
     """Parse command line arguments"""
     parser = argparse.ArgumentParser()
     parser.add_argument('--action', required=True,
-                        choices=['stamp', 'list'],
+                        choices=['stamp', 'list', 'watch'],
                         help='Action to take')
     parser.add_argument('--status', required=False,
                         choices=['completed', 'incomplete', 'skipped'],
@@ -1,9 +1,11 @@
 import re
-from subprocess import Popen, PIPE
 import logging
 
+from shorthand.backends import GrepBackend
 from shorthand.utils.patterns import DEFINITION_PATTERN
-from shorthand.utils.paths import get_relative_path, get_display_path
+from shorthand.utils.paths import get_relative_path, get_display_path, \
+                                  is_in_directory
+from shorthand.utils.glossary import get_term_key
 
 
 definition_regex = re.compile(DEFINITION_PATTERN)
@@ -12,7 +14,42 @@ definition_regex = re.compile(DEFINITION_PATTERN)
 log = logging.getLogger(__name__)
 
 
-def get_definitions(notes_directory, directory_filter=None, grep_path='grep'):
+def get_definitions(notes_directory, directory_filter=None, grep_path='grep',
+                    elements=None, backend=None, prefix=None, glossary=None):
+    '''Get all definitions within the notes
+
+    If `elements` from a scan of the notes directory are provided
+        then the definitions are taken from those instead of grep
+    `backend` is the search backend to find definitions with, which
+        defaults to grep
+    `prefix` only gets the definitions of terms which start with it,
+        matched case insensitive
+    If a `glossary` is provided then the definitions are looked up
+        from it, sorted by term
+    '''
+
+    if glossary is not None:
+        return glossary.lookup_prefix(prefix or '', directory_filter)
+
+    if elements is not None:
+        definitions = []
+        for definition in elements['definitions']:
+            if not is_in_directory(definition['file_path'], directory_filter):
+                continue
+            if not matches_prefix(definition['term'], prefix):
+                continue
+            definitions.append({
+                "file_path": definition['file_path'],
+                "display_path": get_display_path(definition['file_path'],
+                                                 directory_filter),
+                "line_number": definition['line_number'],
+                "term": definition['term'],
+                "definition": definition['definition']
+            })
+        return definitions
+
+    if backend is None:
+        backend = GrepBackend(grep_path)
 
     definitions = []
 
@@ -22,29 +59,13 @@ def get_definitions(notes_directory, directory_filter=None, grep_path='grep'):
             search_directory += '/'
         search_directory += directory_filter
 
-    grep_command = '{grep_path} -Prn "{pattern}" '\
-                   '--include="*.note" {dir}'.format(
-                        grep_path=grep_path,
-                        pattern=DEFINITION_PATTERN,
-                        dir=search_directory)
+    matches = backend.find_lines(search_directory, DEFINITION_PATTERN)
 
-    log.debug(f'Running grep command {grep_command} to get definitions')
-    proc = Popen(
-        grep_command,
-        stdout=PIPE, stderr=PIPE,
-        shell=True)
-    output, err = proc.communicate()
-    output_lines = output.decode().split('\n')
+    for match in matches:
 
-    for line in output_lines:
-
-        if not line.strip():
-            continue
-
-        split_line = line.split(':', 2)
-        file_path = split_line[0]
-        line_number = split_line[1]
-        definition_raw = split_line[2]
+        file_path = match['file_path']
+        line_number = match['line_number']
+        definition_raw = match['line']
 
         # Return all paths as relative paths within the notes dir
         file_path = get_relative_path(notes_directory, file_path)
@@ -52,12 +73,16 @@ def get_definitions(notes_directory, directory_filter=None, grep_path='grep'):
 
         definition_match = definition_regex.match(definition_raw)
         if not definition_match:
-            log.debug(f'No definition match found for line {line}')
+            log.debug(f'No definition match found for line '
+                      f'{definition_raw}')
         else:
             term = definition_match.group(2)
             term = term.strip().strip(r'{}')
             definition_text = definition_match.group(3)
 
+        if not matches_prefix(term, prefix):
+            continue
+
         parsed_definition = {
             "file_path": file_path,
             "display_path": display_path,
@@ -69,3 +94,26 @@ def get_definitions(notes_directory, directory_filter=None, grep_path='grep'):
         definitions.append(parsed_definition)
 
     return definitions
+
+
+def get_definition(notes_directory, term, directory_filter=None,
+                   grep_path='grep', elements=None, backend=None,
+                   glossary=None):
+    '''Get the definitions of a single term, matched case insensitive,
+    taking the same arguments as `get_definitions`
+    '''
+
+    if glossary is not None:
+        return glossary.lookup(term, directory_filter)
+
+    term_key = get_term_key(term)
+    definitions = get_definitions(notes_directory, directory_filter,
+                                  grep_path, elements, backend, prefix=term)
+    return [definition for definition in definitions
+            if get_term_key(definition['term']) == term_key]
+
+
+def matches_prefix(term, prefix=None):
+    '''Check whether a term starts with a prefix, case insensitive
+    '''
+    return not prefix or get_term_key(term).startswith(get_term_key(prefix))
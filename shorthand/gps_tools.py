@@ -1,9 +1,13 @@
 import re
-from subprocess import Popen, PIPE
+import heapq
 import logging
 
-from shorthand.utils.paths import get_relative_path, get_display_path
+from shorthand.backends import GrepBackend
+from shorthand.utils.paths import get_relative_path, get_display_path, \
+                                  is_in_directory
 from shorthand.utils.patterns import GPS_PATTERN
+from shorthand.utils.location_index import LocationIndex, validate_bounds, \
+                                           is_in_bounds, get_distance
 
 
 gps_regex = re.compile(GPS_PATTERN)
@@ -12,7 +16,49 @@ gps_regex = re.compile(GPS_PATTERN)
 log = logging.getLogger(__name__)
 
 
-def get_locations(notes_directory, directory_filter=None, grep_path='grep'):
+def get_locations(notes_directory, directory_filter=None, grep_path='grep',
+                  elements=None, backend=None, bounds=None,
+                  location_index=None):
+    '''Get all GPS locations within the notes
+
+    If `elements` from a scan of the notes directory are provided
+        then the locations are taken from those instead of grep
+    `backend` is the search backend to find locations with, which
+        defaults to grep
+    `bounds` is a `(south, west, north, east)` bounding box in degrees
+        which only the locations within are returned
+    If a `location_index` is provided then the locations are looked
+        up from it
+    '''
+
+    if location_index is not None:
+        return location_index.get_locations(bounds, directory_filter)
+
+    if bounds is not None:
+        bounds = validate_bounds(bounds)
+
+    if elements is not None:
+        location_items = []
+        for location in elements['locations']:
+            if not is_in_directory(location['file_path'], directory_filter):
+                continue
+            if bounds is not None and not is_in_bounds(
+                    float(location['latitude']),
+                    float(location['longitude']), bounds):
+                continue
+            location_items.append({
+                "latitude": location['latitude'],
+                "longitude": location['longitude'],
+                "name": location['name'],
+                'file_path': location['file_path'],
+                'display_path': get_display_path(location['file_path'],
+                                                 directory_filter),
+                'line_number': location['line_number'],
+            })
+        return location_items
+
+    if backend is None:
+        backend = GrepBackend(grep_path)
 
     location_items = []
 
@@ -22,29 +68,13 @@ def get_locations(notes_directory, directory_filter=None, grep_path='grep'):
             search_directory += '/'
         search_directory += directory_filter
 
-    grep_command = '{grep_path} -Prn "{pattern}" '\
-                   '--include="*.note" {dir}'.format(
-                        grep_path=grep_path,
-                        pattern=GPS_PATTERN,
-                        dir=search_directory)
-    log.debug(f'Running grep command {grep_command} to get locations')
+    matches = backend.find_lines(search_directory, GPS_PATTERN)
 
-    proc = Popen(
-        grep_command,
-        stdout=PIPE, stderr=PIPE,
-        shell=True)
-    output, err = proc.communicate()
-    output_lines = output.decode().split('\n')
+    for match in matches:
 
-    for line in output_lines:
-
-        if not line.strip():
-            continue
-
-        split_line = line.split(':', 2)
-        file_path = split_line[0].strip()
-        line_number = split_line[1].strip()
-        match_content = split_line[2].strip()
+        file_path = match['file_path']
+        line_number = match['line_number']
+        match_content = match['line'].strip()
 
         locations = gps_regex.findall(match_content)
 
@@ -55,6 +85,9 @@ def get_locations(notes_directory, directory_filter=None, grep_path='grep'):
         for match in locations:
             log.debug('Got Match')
             log.debug(match)
+            if bounds is not None and not is_in_bounds(
+                    float(match[1]), float(match[3]), bounds):
+                continue
             extracted_location = {
                 "latitude": match[1],
                 "longitude": match[3],
@@ -69,3 +102,50 @@ def get_locations(notes_directory, directory_filter=None, grep_path='grep'):
     log.debug(location_items)
 
     return location_items
+
+
+def get_nearest_locations(notes_directory, latitude, longitude, count=10,
+                          directory_filter=None, grep_path='grep',
+                          elements=None, backend=None, location_index=None):
+    '''Get the `count` GPS locations nearest to a point, closest first,
+    with the `distance` to each in kilometers. Takes the same arguments
+    as `get_locations`
+    '''
+
+    latitude = float(latitude)
+    longitude = float(longitude)
+    if count < 1:
+        raise ValueError(f'Invalid location count {count}')
+
+    if location_index is not None:
+        return location_index.get_nearest(latitude, longitude, count,
+                                          directory_filter)
+
+    locations = get_locations(notes_directory, directory_filter, grep_path,
+                              elements, backend)
+    for location in locations:
+        location['distance'] = get_distance(
+            latitude, longitude,
+            float(location['latitude']), float(location['longitude']))
+
+    return heapq.nsmallest(count, locations,
+                           key=lambda location: location['distance'])
+
+
+def get_location_clusters(notes_directory, zoom, directory_filter=None,
+                          grep_path='grep', elements=None, backend=None,
+                          bounds=None, location_index=None):
+    '''Get the GPS locations grouped into clusters for a zoom level of
+    a map, as described by `LocationIndex.get_clusters`. Takes the same
+    arguments as `get_locations`
+
+    Clusters are only cached when a `location_index` is provided
+    '''
+
+    if location_index is None:
+        location_index = LocationIndex()
+        location_index.load({'locations': get_locations(
+            notes_directory, directory_filter, grep_path, elements,
+            backend)})
+
+    return location_index.get_clusters(zoom, bounds, directory_filter)
@@ -1,76 +1,271 @@
-from subprocess import Popen, PIPE
 import logging
 
-from shorthand.utils.patterns import RECORD_SET_PATTERN, escape_for_cli
-from shorthand.utils.rec import load_from_string
+from shorthand.backends import GrepBackend
+from shorthand.utils.patterns import RECORD_SET_PATTERN
+from shorthand.utils.rec import load_from_lines
+from shorthand.utils.files import open_note_buffer, iter_buffer_lines, \
+                                  find_line_offset, is_line_offset
 from shorthand.utils.paths import get_relative_path, get_display_path, \
-                                  get_full_path
+                                  get_full_path, is_in_directory
 
 
 log = logging.getLogger(__name__)
 
 
+RECORD_SET_START = '```rec-data'
+RECORD_SET_END = '```'
+
+# Record sets at least this large are loaded into columnar storage
+COLUMNAR_MIN_BYTES = 64 * 1024
+
+PARSE_FORMATS = ['json', 'json_lines', 'csv', 'rec']
+# Streamed record sets are sent in chunks of about this many characters
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def iter_chunks(parts, chunk_size=STREAM_CHUNK_SIZE):
+    '''Join many small strings into chunks of at least `chunk_size`
+    characters, apart from the last chunk
+    '''
+
+    chunk_parts = []
+    chunk_length = 0
+    for part in parts:
+        chunk_parts.append(part)
+        chunk_length += len(part)
+        if chunk_length >= chunk_size:
+            yield ''.join(chunk_parts)
+            chunk_parts = []
+            chunk_length = 0
+    if chunk_parts:
+        yield ''.join(chunk_parts)
+
+
+def get_record_set_lines(notes_directory, file_path, line_number,
+                         start_offset=None):
+    '''Get the raw lines within a record set, without the fences
+    around it
+
+    `start_offset` is the byte offset of the start of the record set
+        from the catalog returned by `get_record_sets`, which is
+        seeked to directly instead of finding the line. It must still
+        be the start of `line_number`, so that an offset from before
+        the note changed can't load a different record set
+    '''
+
+    # Get full path if only a relative path is supplied
+    if notes_directory not in file_path:
+        file_path = get_full_path(notes_directory, file_path)
+
+    # Only read the file from the start of the record set onwards
+    record_set_lines = []
+    is_content = False
+    with open_note_buffer(file_path) as note_buffer:
+        if start_offset is None:
+            offset = find_line_offset(note_buffer, line_number)
+        else:
+            offset = int(start_offset)
+            if not is_line_offset(note_buffer, offset, line_number):
+                raise ValueError(f'Offset {offset} is not the start of '
+                                 f'line {line_number}')
+        for _, raw_line in iter_buffer_lines(note_buffer, offset):
+            line = raw_line.decode('utf-8', errors='replace')
+            if not is_content and line != RECORD_SET_START:
+                raise ValueError(f'Found unexpected line "{line}"')
+            elif not is_content:
+                is_content = True
+            elif line != RECORD_SET_END:
+                record_set_lines.append(line)
+            else:
+                break
+    return record_set_lines
+
+
+def load_record_set(record_set_lines):
+    '''Load a record set from its raw lines, using columnar storage
+    for large record sets
+    '''
+    record_set_size = sum(len(line) + 1 for line in record_set_lines)
+    columnar = record_set_size >= COLUMNAR_MIN_BYTES
+    return load_from_lines(record_set_lines, columnar=columnar)
+
+
 def get_record_set(notes_directory, file_path, line_number, parse=True,
-                   parse_format='json', include_config=False):
+                   parse_format='json', include_config=False,
+                   start_offset=None, stream=False, select=None,
+                   fields=None):
     '''Get the full contents of a record set
     If `parse` is set to False then the record set
         contents are returned as a string
     If `parse` is set to True then the record set
         contents are loaded and returned in the specified
-        format. Valid formats are `json` and `csv`
+        format. Valid formats are `json`, `json_lines`, `csv`
+        and `rec`
+    `include_config` returns a dictionary of the parsed records along
+        with the config and fields of the record set instead, which is
+        only supported by the `json` format
+    `start_offset` is the byte offset of the start of the record set
+        from the catalog returned by `get_record_sets`, which is
+        seeked to directly instead of counting lines
+    `stream` returns the parsed record set as a generator of chunks
+        rather than a single string, so that large record sets never
+        need to be serialized all at once. The record set is still
+        loaded up front so that any errors are raised immediately.
+        Ignored when `include_config` is set
+    `select` is a recsel style selection expression, such as
+        `Temp >= 40 && Location = 'Austin, TX'`, which only returns
+        the matching records
+    `fields` is a list of fields to project each record down to
     '''
 
     # Validate inputs
-    if parse and parse_format not in ['json', 'csv']:
+    if parse and parse_format not in PARSE_FORMATS:
         raise ValueError(f'Unknown parse format {parse_format}')
+    if parse and include_config and parse_format != 'json':
+        raise ValueError(f'Config can only be included with the json '
+                         f'format, not {parse_format}')
 
-    # Get full path if only a relative path is supplied
-    if notes_directory not in file_path:
-        file_path = get_full_path(notes_directory, file_path)
+    record_set_lines = get_record_set_lines(notes_directory, file_path,
+                                            line_number, start_offset)
+    if not parse:
+        return '\n'.join(record_set_lines)
 
-    record_set_lines = []
-    is_content = False
-    with open(file_path, 'r') as f:
-        file_data = f.read()
-    for idx, line in enumerate(file_data.split('\n')):
-        if idx + 1 < line_number:
-            continue
-        elif idx + 1 == line_number and line != '```rec-data':
-            raise ValueError(f'Found unexpected line "{line}"')
-        elif idx + 1 == line_number and line == '```rec-data':
-            is_content = True
-        elif is_content and line != '```':
-            record_set_lines.append(line)
+    record_set = load_record_set(record_set_lines)
+    # The raw lines aren't needed while the output is serialized
+    del record_set_lines
+
+    records = record_set.select(select, fields)
+    if fields is None:
+        fields = record_set.get_fields()
+
+    if parse_format == 'json' and include_config:
+        output = {
+            'records': list(records),
+            'config': record_set.get_config(),
+            'fields': fields
+        }
+        return output
+
+    if parse_format == 'json':
+        parts = record_set.iter_json(records=records)
+    elif parse_format == 'json_lines':
+        parts = record_set.iter_json_lines(records=records)
+    elif parse_format == 'csv':
+        parts = record_set.iter_csv(records=records, fields=fields)
+    else:
+        parts = record_set.iter_rec(records=records)
+
+    if stream:
+        return iter_chunks(parts)
+    return ''.join(parts)
+
+
+def get_record_set_aggregates(notes_directory, file_path, line_number,
+                              aggregations, group_by=None, select=None,
+                              start_offset=None):
+    '''Aggregate the records of a record set into summary values, such
+    as `['count', 'sum(Amount)', 'p90(Amount)']`, optionally grouped by
+    a list of fields and only over the records matching a `select`
+    expression. Returns one row for each group, as described by
+    `RecordSet.aggregate`
+    '''
+
+    if not aggregations:
+        raise ValueError('No aggregations specified')
+
+    record_set = load_record_set(get_record_set_lines(
+        notes_directory, file_path, line_number, start_offset))
+    return record_set.aggregate(aggregations, group_by=group_by,
+                                expression=select)
+
+
+def get_record_set_summary(note_buffer, start_offset):
+    '''Summarize the record set which starts at an offset within the
+    raw content of a note, without loading or validating it, as:
+    {
+        "start_offset": <offset of the opening fence>,
+        "end_offset": <offset just past the closing fence>,
+        "name": <name from the `%rec` config, if any>,
+        "fields": [<fields used by the records, in order of first use>],
+        "record_count": <number of records>
+    }
+    '''
+
+    name = None
+    fields = []
+    record_count = 0
+    in_record = False
+    end_offset = len(note_buffer)
+    for idx, (offset, raw_line) in enumerate(
+            iter_buffer_lines(note_buffer, start_offset)):
+        line = raw_line.decode('utf-8', errors='replace')
+        if idx == 0:
+            if line != RECORD_SET_START:
+                raise ValueError(f'Found unexpected line "{line}"')
             continue
-        elif is_content and line == '```':
-            is_content = False
+        if line == RECORD_SET_END:
+            end_offset = min(offset + len(raw_line) + 1, len(note_buffer))
             break
-        else:
-            raise ValueError('Found a bug in record set parsing logic!')
-    record_set_raw = '\n'.join(record_set_lines)
-    if parse:
-        record_set = load_from_string(record_set_raw)
-        if parse_format == 'json':
-            if include_config:
-                output = {
-                    'records': list(record_set.all()),
-                    'config': record_set.get_config(),
-                    'fields': record_set.get_fields()
-                }
-                return output
-            output = record_set.get_json()
-            return output
-        elif parse_format == 'csv':
-            output = record_set.get_csv()
-            return output
-    else:
-        return record_set_raw
 
+        if not line.strip():
+            in_record = False
+        elif line[0] in ['#', '+']:
+            continue
+        elif line[0] == '%':
+            if line.startswith('%rec:') and name is None:
+                name_parts = line[5:].split()
+                if name_parts:
+                    name = name_parts[0]
+        elif ':' in line:
+            if not in_record:
+                in_record = True
+                record_count += 1
+            field_name = line.split(':', 1)[0].strip()
+            if field_name not in fields:
+                fields.append(field_name)
+
+    return {
+        'start_offset': start_offset,
+        'end_offset': end_offset,
+        'name': name,
+        'fields': fields,
+        'record_count': record_count
+    }
 
-def get_record_sets(notes_directory, directory_filter=None, grep_path='grep'):
-    '''List all record sets within a specified directory
+
+def get_record_sets(notes_directory, directory_filter=None, grep_path='grep',
+                    elements=None, backend=None):
+    '''List all record sets within a specified directory, along with
+    the byte offsets of each record set within its note and the
+    summary from `get_record_set_summary`
+
+    If `elements` from a scan of the notes directory are provided
+        then the record sets are taken from those instead of grep
+    `backend` is the search backend to find record sets with, which
+        defaults to grep
     '''
 
+    if elements is not None:
+        record_sets = []
+        for record_set in elements['record_sets']:
+            if not is_in_directory(record_set['file_path'], directory_filter):
+                continue
+            record_sets.append({
+                "file_path": record_set['file_path'],
+                "line_number": record_set['line_number'],
+                "display_path": get_display_path(record_set['file_path'],
+                                                 directory_filter),
+                "start_offset": record_set['start_offset'],
+                "end_offset": record_set['end_offset'],
+                "name": record_set['name'],
+                "fields": record_set['fields'],
+                "record_count": record_set['record_count']
+            })
+        return record_sets
+
+    if backend is None:
+        backend = GrepBackend(grep_path)
+
     record_sets = []
 
     search_directory = notes_directory
@@ -79,31 +274,14 @@ def get_record_sets(notes_directory, directory_filter=None, grep_path='grep'):
             search_directory += '/'
         search_directory += directory_filter
 
-    grep_command = '{grep_path} -Prn "{pattern}" '\
-                   '--include="*.note" {dir}'.format(
-                        grep_path=grep_path,
-                        pattern=escape_for_cli(RECORD_SET_PATTERN),
-                        dir=search_directory)
-
-    log.debug(f'Running grep command {grep_command} to get record sets')
+    matches = backend.find_lines(search_directory, RECORD_SET_PATTERN)
 
-    proc = Popen(
-        grep_command,
-        stdout=PIPE, stderr=PIPE,
-        shell=True)
-    output, err = proc.communicate()
-    output_lines = output.decode().split('\n')
+    for match in matches:
 
-    for line in output_lines:
+        full_path = match['file_path']
+        line_number = match['line_number']
 
-        if not line.strip():
-            continue
-
-        split_line = line.split(':', 2)
-        file_path = split_line[0]
-        line_number = split_line[1]
-
-        file_path = get_relative_path(notes_directory, file_path)
+        file_path = get_relative_path(notes_directory, full_path)
         display_path = get_display_path(file_path, directory_filter)
 
         parsed_record_set = {
@@ -112,6 +290,11 @@ def get_record_sets(notes_directory, directory_filter=None, grep_path='grep'):
             "display_path": display_path
         }
 
+        with open_note_buffer(full_path) as note_buffer:
+            start_offset = find_line_offset(note_buffer, int(line_number))
+            parsed_record_set.update(
+                get_record_set_summary(note_buffer, start_offset))
+
         record_sets.append(parsed_record_set)
 
     return record_sets
@@ -2,6 +2,7 @@ import shlex
 import logging
 from subprocess import Popen, PIPE
 
+from shorthand.backends import GrepBackend
 from shorthand.utils.paths import get_full_path, get_relative_path
 
 
@@ -125,7 +126,8 @@ def filename_search(notes_directory, prefer_recent_files=True,
 
 
 def search_notes(notes_directory, query_string, type=None,
-                 case_sensitive=False, grep_path='grep'):
+                 case_sensitive=False, grep_path='grep', search_index=None,
+                 rank=False, limit=None, backend=None, refresh=True):
     '''Perform a full-text search through all notes and return
     matching lines with metadata
 
@@ -135,62 +137,57 @@ def search_notes(notes_directory, query_string, type=None,
     "type" is the type of objects to search (todos, questions, etc.)
     "case_sensitive" toggles whether or not the match is case
         sensitive
+    "search_index" is an optional `SearchIndex` or `TrigramIndex`
+        to answer the query from instead of searching the notes
+        directory. Queries run against a `SearchIndex` match whole
+        words and additionally support a `NEAR/k` operator between
+        two terms or phrases, while a `TrigramIndex` gives the same
+        results as grep
+    "rank" orders results by BM25 relevance, best first. Requires
+        a `SearchIndex`
+    "limit" returns at most this many results, while the count
+        still reflects every match. With ranking this is the top
+        results by relevance
+    "backend" is the search backend to search with when there is
+        no search index, which defaults to grep
+    "refresh" toggles whether the search index checks every notes
+        file for changes before searching. It can be turned off when
+        the index is kept current by a watcher instead
     '''
 
+    if rank and search_index is None:
+        raise ValueError('Ranked search requires a search index')
+
+    if search_index is not None:
+        if not query_string.strip():
+            return []
+        return search_index.search(query_string,
+                                   case_sensitive=case_sensitive,
+                                   refresh=refresh, rank=rank, limit=limit)
+
     query_components = shlex.split(query_string)
 
     # Early exit for empty query
     if not query_components:
         return []
 
-    # Add safe handling of quoted phrases
-    safe_components = []
-    for component in query_components:
-        if component[0] == '"' and component[-1] == '"':
-            safe_components.append(component[1:-1])
-        else:
-            safe_components.append(component)
-
-    grep_mode = '-rn'
-    grep_filter_mode = ''
-    if not case_sensitive:
-        grep_mode += 'i'
-        grep_filter_mode += ' -i'
-
-    grep_command = '{grep_path} {mode} "{pattern}" '\
-                   '--include="*.note" {dir}'.format(
-                        grep_path=grep_path,
-                        mode=grep_mode,
-                        pattern=query_components[0],
-                        dir=notes_directory)
-
-    for additional_filter in query_components[1:]:
-        new_filter = ' | {grep_path}{mode} "{pattern}"'.format(
-                        grep_path=grep_path,
-                        mode=grep_filter_mode,
-                        pattern=additional_filter)
-        grep_command = grep_command + new_filter
-
-    log.debug(f'Running command {grep_command} to get search results')
-
-    proc = Popen(
-        grep_command,
-        stdout=PIPE, stderr=PIPE,
-        shell=True)
-    output, err = proc.communicate()
-    output_lines = output.decode().split('\n')
+    if backend is None:
+        backend = GrepBackend(grep_path)
 
-    search_results = []
+    # Each query component is a grep basic regex which
+    # must match somewhere within the line
+    matches = backend.find_lines(notes_directory, query_components[0],
+                                 case_sensitive=case_sensitive,
+                                 syntax='basic',
+                                 filters=query_components[1:])
 
-    for line in output_lines:
+    search_results = []
 
-        if not line.strip():
-            continue
+    for match in matches:
 
-        split_line = line.split(':', 2)
-        file_path = split_line[0].strip()
-        line_number = split_line[1].strip()
-        match_content = split_line[2].strip()
+        file_path = match['file_path']
+        line_number = match['line_number']
+        match_content = match['line'].strip()
 
         # Return all paths as relative paths within the notes dir
         if notes_directory in file_path:
@@ -204,9 +201,13 @@ def search_notes(notes_directory, query_string, type=None,
 
         search_results.append(processed_line)
 
+    result_count = len(search_results)
+    if limit is not None:
+        search_results = search_results[:limit]
+
     return {
         "items": search_results,
-        "count": len(search_results)
+        "count": result_count
     }
 
 
@@ -1,22 +1,30 @@
+import os
 import re
 import logging
 from datetime import datetime
-from subprocess import Popen, PIPE
 
+from shorthand.backends import GrepBackend
 from shorthand.utils.patterns import CATCH_ALL_PATTERN, \
     VALID_INCOMPLETE_PATTERN, VALID_COMPLETE_PATTERN, \
     UNFINISHED_UNSTAMPED_PATTERN, FINISHED_START_STAMPED_PATTERN, \
-    FINISHED_UNSTAMPED_PATTERN, TODAY_GREP, TODAY_LINE_PATTERN, \
+    FINISHED_UNSTAMPED_PATTERN, TODAY_LINE_PATTERN, \
     ALL_QUESTIONS, UNSTAMPED_QUESTION, STAMPED_QUESTION, \
     ANSWER_PATTERN, UNSTAMPED_ANSWER, STAMPED_ANSWER
+from shorthand.utils.paths import get_full_path
 
 
 log = logging.getLogger(__name__)
 
 
+def get_matched_filenames(matches):
+    '''Get the unique set of files which a list of matches are in
+    '''
+    return sorted(set([match['file_path'] for match in matches]))
+
+
 def stamp_notes(notes_directory, stamp_todos=True, stamp_today=True,
                 stamp_questions=True, stamp_answers=True,
-                grep_path='grep'):
+                grep_path='grep', paths=None, backend=None):
     '''Stamp notes for the purpose of inserting date stamps
     as a convenience feature. This function makes the following
     replacements:
@@ -54,6 +62,13 @@ def stamp_notes(notes_directory, stamp_todos=True, stamp_today=True,
         @ This is a sample
         @ (2020-01-01) This is a sample
 
+    If `paths` are specified then only those files are stamped, and
+    no search of the notes directory is run. Files are only written
+    to if there is something in them to stamp
+
+    `backend` is the search backend to find elements to stamp with,
+    which defaults to grep
+
     This function returns a changes object of the form:
     {
         "/file/path/1": [
@@ -78,34 +93,28 @@ def stamp_notes(notes_directory, stamp_todos=True, stamp_today=True,
     log.info('Stamping notes')
     changes = {}
 
+    if backend is None:
+        backend = GrepBackend(grep_path)
+
+    if paths is not None:
+        paths = [get_full_path(notes_directory, path)
+                 for path in paths
+                 if path[-5:] == '.note' and
+                 os.path.exists(get_full_path(notes_directory, path))]
+
     # Stamp start and end dates for todo elements
-    if stamp_todos:
-        grep_command = '{grep_path} -Pr "{pattern}" '\
-                       '--include="*.note" {directory} | '\
-                       '{grep_path} -Pv "{filter_1}" | '\
-                       '{grep_path} -Pv "{filter_2}"'.format(
-                            grep_path=grep_path,
-                            pattern=CATCH_ALL_PATTERN,
-                            directory=notes_directory,
-                            filter_1=VALID_INCOMPLETE_PATTERN,
-                            filter_2=VALID_COMPLETE_PATTERN)
-
-        log.debug(f'running grep command "{grep_command}" '
-                  f'to get todos to stamp')
-
-        proc = Popen(grep_command,
-                     stdout=PIPE, stderr=PIPE,
-                     shell=True)
-        output, err = proc.communicate()
-
-        output_lines = output.decode().split('\n')
-        matched_filenames = [line.split(':')[0] for line in output_lines
-                             if line.strip()]
-        matched_filenames = list(set(matched_filenames))
+    if stamp_todos and paths is not None:
+        matched_filenames = paths
+    elif stamp_todos:
+        matches = backend.find_lines(
+            notes_directory, CATCH_ALL_PATTERN,
+            excludes=[VALID_INCOMPLETE_PATTERN, VALID_COMPLETE_PATTERN])
+        matched_filenames = get_matched_filenames(matches)
         if matched_filenames:
             log.info(f'Found unstamped todos in files '
                      f'{", ".join(matched_filenames)}')
 
+    if stamp_todos:
         # Compile regexes for replacing lines
         unfinished_unstamped_regex = re.compile(
             UNFINISHED_UNSTAMPED_PATTERN)
@@ -119,6 +128,7 @@ def stamp_notes(notes_directory, stamp_todos=True, stamp_today=True,
             with open(filename, 'r') as file_object:
 
                 stamped_content = []
+                file_changed = False
 
                 for line_number, line in enumerate(file_object):
 
@@ -132,6 +142,7 @@ def stamp_notes(notes_directory, stamp_todos=True, stamp_today=True,
                         log.info(f'Writing stamped unfinished '
                                  f'todo "{new_line.rstrip()}"')
                         stamped_content.append(new_line)
+                        file_changed = True
 
                         change_details = {
                             "type": "incomplete_todo",
@@ -152,6 +163,7 @@ def stamp_notes(notes_directory, stamp_todos=True, stamp_today=True,
                         log.info(f'Writing stamped finished '
                                  f'todo "{new_line.rstrip()}"')
                         stamped_content.append(new_line)
+                        file_changed = True
 
                         change_details = {
                             "type": "finished_todo",
@@ -173,6 +185,7 @@ def stamp_notes(notes_directory, stamp_todos=True, stamp_today=True,
                         log.info(f'Writing stamped finished '
                                  f'todo "{new_line.rstrip()}"')
                         stamped_content.append(new_line)
+                        file_changed = True
 
                         change_details = {
                             "type": "finished_todo",
@@ -187,31 +200,22 @@ def stamp_notes(notes_directory, stamp_todos=True, stamp_today=True,
                         # no to-dos -or- correctly formatted already
                         stamped_content.append(line)
 
+            if not file_changed:
+                continue
+
             with open(filename, 'w') as write_file_object:
                 log.debug(f'Saving changes in file {filename}')
                 write_file_object.write(''.join(stamped_content))
 
     # Replace placeholders for `\today` helper
-    if stamp_today:
-        today_grep_command = '{grep_path} -r {pattern} --include="*.note" ' \
-                             '{directory}'.format(
-                                grep_path=grep_path,
-                                pattern=TODAY_GREP,
-                                directory=notes_directory)
-
-        log.debug(f'running grep command "{grep_command}" '
-                  f'to get `\\today`s to replace')
-        today_proc = Popen(today_grep_command,
-                           stdout=PIPE, stderr=PIPE,
-                           shell=True)
-        today_output, err = today_proc.communicate()
-
-        today_output_lines = today_output.decode().split('\n')
-        today_matched_filenames = [line.split(':')[0]
-                                   for line in today_output_lines
-                                   if line.strip()]
-        today_matched_filenames = list(set(today_matched_filenames))
+    if stamp_today and paths is not None:
+        today_matched_filenames = paths
+    elif stamp_today:
+        today_matches = backend.find_lines(notes_directory,
+                                           TODAY_LINE_PATTERN)
+        today_matched_filenames = get_matched_filenames(today_matches)
 
+    if stamp_today:
         today_placeholder_regex = re.compile(TODAY_LINE_PATTERN)
 
         for filename in today_matched_filenames:
@@ -219,6 +223,7 @@ def stamp_notes(notes_directory, stamp_todos=True, stamp_today=True,
             with open(filename, 'r') as file_object:
 
                 stamped_content = []
+                file_changed = False
 
                 for line_number, line in enumerate(file_object):
 
@@ -232,6 +237,7 @@ def stamp_notes(notes_directory, stamp_todos=True, stamp_today=True,
                         log.info(f'Replaced today placeholder '
                                  f'"{new_line.rstrip()}"')
                         stamped_content.append(new_line)
+                        file_changed = True
 
                         change_details = {
                             "type": "date_placeholder",
@@ -246,35 +252,24 @@ def stamp_notes(notes_directory, stamp_todos=True, stamp_today=True,
                         # no today placeholders
                         stamped_content.append(line)
 
+            if not file_changed:
+                continue
+
             with open(filename, 'w') as write_file_object:
                 log.debug(f'Saving changes in file {filename}')
                 write_file_object.write(''.join(stamped_content))
 
     # Stamp Questions
-    if stamp_questions:
-
-        unstamped_questions_grep_command = '{grep_path} -Pr '\
-                        '"{question_pattern}" --include="*.note" '\
-                        '{directory} | {grep_path} -Pv '\
-                        '"{stamped_question_pattern}"'.format(
-                            grep_path=grep_path,
-                            question_pattern=ALL_QUESTIONS,
-                            stamped_question_pattern=STAMPED_QUESTION,
-                            directory=notes_directory)
-
-        log.debug(f'running grep command "{unstamped_questions_grep_command}" '
-                  f'to get unstamped questions')
-        questions_proc = Popen(unstamped_questions_grep_command,
-                               stdout=PIPE, stderr=PIPE,
-                               shell=True)
-
-        questions_output, err = questions_proc.communicate()
-        questions_output_lines = questions_output.decode().split('\n')
-        questions_matched_filenames = [line.split(':')[0]
-                                       for line in questions_output_lines
-                                       if line.strip()]
-        questions_matched_filenames = list(set(questions_matched_filenames))
+    if stamp_questions and paths is not None:
+        questions_matched_filenames = paths
+    elif stamp_questions:
+        questions_matches = backend.find_lines(notes_directory,
+                                               ALL_QUESTIONS,
+                                               excludes=[STAMPED_QUESTION])
+        questions_matched_filenames = get_matched_filenames(
+            questions_matches)
 
+    if stamp_questions:
         unstamped_question_regex = re.compile(UNSTAMPED_QUESTION)
 
         for filename in questions_matched_filenames:
@@ -282,6 +277,7 @@ def stamp_notes(notes_directory, stamp_todos=True, stamp_today=True,
             with open(filename, 'r') as file_object:
 
                 stamped_content = []
+                file_changed = False
 
                 for line_number, line in enumerate(file_object):
 
@@ -295,6 +291,7 @@ def stamp_notes(notes_directory, stamp_todos=True, stamp_today=True,
                         log.info(f'Writing stamped question '
                                  f'"{new_line.rstrip()}"')
                         stamped_content.append(new_line)
+                        file_changed = True
 
                         change_details = {
                             "type": "question",
@@ -309,34 +306,22 @@ def stamp_notes(notes_directory, stamp_todos=True, stamp_today=True,
                         # no today placeholders
                         stamped_content.append(line)
 
+            if not file_changed:
+                continue
+
             with open(filename, 'w') as write_file_object:
                 log.debug(f'Saving changes in file {filename}')
                 write_file_object.write(''.join(stamped_content))
 
     # Stamp Answers
-    if stamp_answers:
-
-        unstamped_answers_grep_command = '{grep_path} -Pr "{answer_pattern}" '\
-                        '--include="*.note" {directory} | '\
-                        '{grep_path} -Pv "{stamped_answer_pattern}"'.format(
-                            grep_path=grep_path,
-                            answer_pattern=ANSWER_PATTERN,
-                            stamped_answer_pattern=STAMPED_ANSWER,
-                            directory=notes_directory)
-
-        log.debug(f'running grep command "{unstamped_answers_grep_command}" '
-                  f'to get unstamped answers')
-        answers_proc = Popen(unstamped_answers_grep_command,
-                             stdout=PIPE, stderr=PIPE,
-                             shell=True)
-
-        answers_output, err = answers_proc.communicate()
-        answers_output_lines = answers_output.decode().split('\n')
-        answers_matched_filenames = [line.split(':')[0]
-                                     for line in answers_output_lines
-                                     if line.strip()]
-        answers_matched_filenames = list(set(answers_matched_filenames))
+    if stamp_answers and paths is not None:
+        answers_matched_filenames = paths
+    elif stamp_answers:
+        answers_matches = backend.find_lines(notes_directory, ANSWER_PATTERN,
+                                             excludes=[STAMPED_ANSWER])
+        answers_matched_filenames = get_matched_filenames(answers_matches)
 
+    if stamp_answers:
         unstamped_answer_regex = re.compile(UNSTAMPED_ANSWER)
 
         for filename in answers_matched_filenames:
@@ -344,6 +329,7 @@ def stamp_notes(notes_directory, stamp_todos=True, stamp_today=True,
             with open(filename, 'r') as file_object:
 
                 stamped_content = []
+                file_changed = False
 
                 for line_number, line in enumerate(file_object):
 
@@ -357,6 +343,7 @@ def stamp_notes(notes_directory, stamp_todos=True, stamp_today=True,
                         log.info(f'Writing stamped answer '
                                  f'"{new_line.rstrip()}"')
                         stamped_content.append(new_line)
+                        file_changed = True
 
                         change_details = {
                             "type": "answer",
@@ -371,6 +358,9 @@ def stamp_notes(notes_directory, stamp_todos=True, stamp_today=True,
                         # no today placeholders
                         stamped_content.append(line)
 
+            if not file_changed:
+                continue
+
             with open(filename, 'w') as write_file_object:
                 log.debug(f'Saving changes in file {filename}')
                 write_file_object.write(''.join(stamped_content))
@@ -1,8 +1,9 @@
 import re
-from subprocess import Popen, PIPE
 import logging
 
+from shorthand.backends import GrepBackend
 from shorthand.utils.patterns import TAG_PATTERN, TAG_FILTER
+from shorthand.utils.paths import is_in_directory
 
 
 tag_regex = re.compile(TAG_PATTERN)
@@ -11,7 +12,57 @@ tag_regex = re.compile(TAG_PATTERN)
 log = logging.getLogger(__name__)
 
 
-def get_tags(notes_directory, directory_filter=None, grep_path='grep'):
+def get_tags(notes_directory, directory_filter=None, grep_path='grep',
+             elements=None, backend=None, element_index=None,
+             refresh=True):
+    '''Get the unique set of tags used within the notes
+
+    If `elements` from a scan of the notes directory are provided
+        then the tags are taken from those instead of grep
+    `backend` is the search backend to find tags with, which
+        defaults to grep
+    If an `element_index` is provided then the tags are listed from
+        its tag index
+    `refresh` toggles whether the `element_index` checks every notes
+        file for changes first. It can be turned off when the index is
+        kept current by a watcher instead
+    '''
+
+    if element_index is not None:
+        return sorted(element_index.get_tag_counts(directory_filter,
+                                                   refresh=refresh))
+
+    return clean_tags(get_raw_tags(notes_directory, directory_filter,
+                                   grep_path, elements, backend))
+
+
+def get_tag_counts(notes_directory, directory_filter=None, grep_path='grep',
+                   elements=None, backend=None, element_index=None,
+                   refresh=True):
+    '''Get the number of times that each tag is used within the notes,
+    taking the same arguments as `get_tags`
+    '''
+
+    if element_index is not None:
+        return element_index.get_tag_counts(directory_filter,
+                                            refresh=refresh)
+
+    return count_tags(get_raw_tags(notes_directory, directory_filter,
+                                   grep_path, elements, backend))
+
+
+def get_raw_tags(notes_directory, directory_filter=None, grep_path='grep',
+                 elements=None, backend=None):
+    '''Get every use of a tag within the notes, before being cleaned
+    '''
+
+    if elements is not None:
+        return [tag['tag']
+                for tag in elements['tags']
+                if is_in_directory(tag['file_path'], directory_filter)]
+
+    if backend is None:
+        backend = GrepBackend(grep_path)
 
     tag_items = []
 
@@ -21,42 +72,51 @@ def get_tags(notes_directory, directory_filter=None, grep_path='grep'):
             search_directory += '/'
         search_directory += directory_filter
 
-    grep_command = '{grep_path} -Pr "{pattern}" '\
-                   '--include="*.note" {dir}'.format(
-                        grep_path=grep_path,
-                        pattern=TAG_FILTER,
-                        dir=search_directory)
-    log.debug(f'Running grep command {grep_command} to get tags')
-
-    proc = Popen(
-        grep_command,
-        stdout=PIPE, stderr=PIPE,
-        shell=True)
-    output, err = proc.communicate()
-    output_lines = output.decode().split('\n')
-
-    for line in output_lines:
+    matches = backend.find_lines(search_directory, TAG_FILTER)
 
-        if not line.strip():
-            continue
+    for match in matches:
 
-        tags = tag_regex.findall(line)
+        tags = tag_regex.findall(match['line'])
         # Matches are returned as tuples because the pattern
         # has two groups. We only want to keep the first one
         tags = [tag[0] for tag in tags]
         tag_items.extend(tags)
 
-    # Only keep a unique set of tags with no wrapping colons
     log.debug(tag_items)
+    return tag_items
+
+
+def clean_tags(tag_items):
+    '''Reduce a list of raw tags to a sorted unique set
+    '''
+
+    # Only keep a unique set of tags with no wrapping colons
     tag_items = [item.strip().strip(':') for item in list(set(tag_items))]
     # Only keep tags with at least one letter
-    tag_items = [item
-                 for item in tag_items
-                 if any(char.isalpha() for char in item)]
+    tag_items = [item for item in tag_items if is_valid_tag(item)]
     tag_items.sort()
     return tag_items
 
 
+def count_tags(tag_items):
+    '''Count the uses of each tag in a list of raw tags
+    '''
+
+    tag_counts = {}
+    for item in tag_items:
+        tag = item.strip().strip(':')
+        if not is_valid_tag(tag):
+            continue
+        tag_counts[tag] = tag_counts.get(tag, 0) + 1
+    return tag_counts
+
+
+def is_valid_tag(tag):
+    '''Only tags with at least one letter are kept
+    '''
+    return any(char.isalpha() for char in tag)
+
+
 def extract_tags(text):
 
     tags = []
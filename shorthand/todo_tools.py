@@ -1,11 +1,17 @@
 import re
+import heapq
 import logging
 from datetime import datetime
-from subprocess import Popen, PIPE
+from itertools import islice
 import shlex
 
+from shorthand.backends import GrepBackend
+from shorthand.backends.base import compile_pattern
 from shorthand.tag_tools import extract_tags
-from shorthand.utils.paths import get_relative_path, get_display_path
+from shorthand.utils.paths import get_relative_path, get_display_path, \
+    is_in_directory
+from shorthand.utils.files import open_note_buffer, iter_buffer_lines, \
+    find_line_offset
 from shorthand.utils.patterns import INCOMPLETE_PREFIX_GREP, \
     COMPLETE_PREFIX_GREP, SKIPPED_PREFIX_GREP, \
     START_STAMP_ONLY_PATTERN, START_END_STAMP_ONLY_PATTERN
@@ -73,13 +79,57 @@ def parse_todo(todo_line):
 
 def get_todos(notes_directory, todo_status='incomplete', directory_filter=None,
               query_string=None, case_sensitive=False, sort_by=None,
-              suppress_future=True, tag=None, grep_path='grep'):
+              suppress_future=True, tag=None, grep_path='grep',
+              elements=None, backend=None, limit=None, offset=0):
     '''Get a specified set of todos using grep on the filesystem
+
+    If `elements` from a scan of the notes directory are provided
+        then the todos are taken from those instead
+    `backend` is the search backend to find todos with, which
+        defaults to grep
+    `limit` returns at most this many todos, starting `offset` todos
+        into the results. Without a sort the search stops as soon as
+        enough todos are found, and with one only the top todos are
+        kept while searching
     '''
 
     log.info(f'Getting {todo_status} todos in directory {directory_filter}'
              f' with query string "{query_string}" sorted by {sort_by}')
 
+    if sort_by and sort_by not in SUPPORTED_SORT_FIELDS:
+        raise ValueError('Invalid sort field {}'.format(sort_by))
+
+    todo_items = iter_todos(
+        notes_directory, todo_status=todo_status,
+        directory_filter=directory_filter, query_string=query_string,
+        case_sensitive=case_sensitive, suppress_future=suppress_future,
+        tag=tag, grep_path=grep_path, elements=elements, backend=backend)
+
+    if limit is None:
+        todo_items = sort_todos(list(todo_items), sort_by)
+        return todo_items[offset:]
+
+    if sort_by:
+        # Equivalent to a full sort, but only keeping the top todos
+        todo_items = heapq.nlargest(offset + limit, todo_items,
+                                    key=get_sort_key(sort_by))
+        todo_items = todo_items[offset:]
+    else:
+        todo_items = list(islice(todo_items, offset, offset + limit))
+
+    log.info(f'returning {len(todo_items)} todos')
+    return todo_items
+
+
+def iter_todos(notes_directory, todo_status='incomplete',
+               directory_filter=None, query_string=None,
+               case_sensitive=False, suppress_future=True, tag=None,
+               grep_path='grep', elements=None, backend=None):
+    '''Lazily yield a specified set of todos in the order they are
+    found, taking the same arguments as `get_todos`. The search stops
+    when the caller stops iterating
+    '''
+
     todo_status = todo_status.lower()
 
     if todo_status not in PATTERN_MAPPING.keys():
@@ -88,7 +138,15 @@ def get_todos(notes_directory, todo_status='incomplete', directory_filter=None,
                          f'Valid options are: '
                          f'{", ".join(PATTERN_MAPPING.keys())}')
 
-    todo_items = []
+    if elements is not None:
+        return iter_scanned_todos(
+            elements, todo_status=todo_status,
+            directory_filter=directory_filter, query_string=query_string,
+            case_sensitive=case_sensitive, suppress_future=suppress_future,
+            tag=tag)
+
+    if backend is None:
+        backend = GrepBackend(grep_path)
 
     search_directory = notes_directory
     if directory_filter:
@@ -96,58 +154,44 @@ def get_todos(notes_directory, todo_status='incomplete', directory_filter=None,
             search_directory += '/'
         search_directory += directory_filter
 
-    grep_command = '{grep_path} -Prn "{pattern}" '\
-                   '--include="*.note" {dir}'.format(
-                        grep_path=grep_path,
-                        pattern=PATTERN_MAPPING[todo_status],
-                        dir=search_directory)
-
+    # Each query component is a grep basic regex which must
+    # match the todo, while the tag must match exactly
+    filter_regexes = []
     if query_string:
-        query_components = shlex.split(query_string)
-        # Add safe handling of quoted phrases
-        safe_components = []
-        for component in query_components:
-            if component[0] == '"' and component[-1] == '"':
-                safe_components.append(component[1:-1])
-            else:
-                safe_components.append(component)
+        for query_component in shlex.split(query_string):
+            filter_regexes.append(compile_pattern(
+                query_component, syntax='basic',
+                case_sensitive=case_sensitive))
+    if tag:
+        filter_regexes.append(compile_pattern(f':{tag}:', syntax='basic'))
 
-        if not case_sensitive:
-            grep_filter_mode = ' -i'
-        else:
-            grep_filter_mode = ''
+    log.debug(f'Searching for {todo_status} todos in {search_directory}')
+    matches = backend.iter_lines(search_directory,
+                                 PATTERN_MAPPING[todo_status])
 
-        for additional_filter in query_components:
-            new_filter = ' | {grep_path}{mode} "{pattern}"'.format(
-                            grep_path=grep_path,
-                            mode=grep_filter_mode,
-                            pattern=additional_filter)
-            grep_command = grep_command + new_filter
+    return iter_found_todos(notes_directory, matches, todo_status,
+                            directory_filter, filter_regexes,
+                            suppress_future)
 
-    if tag:
-        new_filter = f' | {grep_path} ":{tag}:"'
-        grep_command = grep_command + new_filter
 
-    log.debug(f'Running grep command {grep_command} to get todos')
-    proc = Popen(
-        grep_command,
-        stdout=PIPE, stderr=PIPE,
-        shell=True)
-    output, err = proc.communicate()
-    output_lines = output.decode().split('\n')
+def iter_found_todos(notes_directory, matches, todo_status,
+                     directory_filter=None, filter_regexes=None,
+                     suppress_future=True):
+    '''Parse the todos out of lines found by a search backend
+    '''
 
     start_stamp_regex = re.compile(START_STAMP_ONLY_PATTERN)
     start_end_stamp_regex = re.compile(START_END_STAMP_ONLY_PATTERN)
 
-    for line in output_lines:
+    for match in matches:
 
-        if not line.strip():
+        if not all([regex.search(match['line'])
+                    for regex in filter_regexes or []]):
             continue
 
-        split_line = line.split(':', 2)
-        file_path = split_line[0].strip()
-        line_number = split_line[1].strip()
-        match_content = split_line[2].strip()
+        file_path = match['file_path']
+        line_number = match['line_number']
+        match_content = match['line'].strip()
 
         # remove the leading `[]`, `[ ]`, `[X]`, or `[S]`
         match_content = match_content.split(']', 1)[1].strip()
@@ -195,14 +239,72 @@ def get_todos(notes_directory, todo_status='incomplete', directory_filter=None,
                 is_future_todo = True
 
         if not suppress_future or not is_future_todo:
-            todo_items.append(processed_todo)
+            yield processed_todo
+
+
+def iter_scanned_todos(elements, todo_status='incomplete',
+                       directory_filter=None, query_string=None,
+                       case_sensitive=False, suppress_future=True,
+                       tag=None):
+    '''Filter the todos found by a scan of the notes directory
+    '''
+
+    # Each query component is a grep basic regex which is matched
+    # against the whole line, the same as when searching with a backend
+    query_regexes = []
+    if query_string:
+        for query_component in shlex.split(query_string):
+            query_regexes.append(compile_pattern(
+                query_component, syntax='basic',
+                case_sensitive=case_sensitive))
+
+    current_date_stamp = datetime.now().isoformat()[:10]
+
+    for todo in elements['todos']:
+
+        if todo['status'] != todo_status:
+            continue
+        if not is_in_directory(todo['file_path'], directory_filter):
+            continue
+        if tag and tag not in todo['tags']:
+            continue
+
+        if not all([regex.search(todo['line'])
+                    for regex in query_regexes]):
+            continue
+
+        if suppress_future and todo['start_date'] and \
+                todo['start_date'] > current_date_stamp:
+            continue
+
+        yield {
+            'file_path': todo['file_path'],
+            'display_path': get_display_path(todo['file_path'],
+                                             directory_filter),
+            'line_number': todo['line_number'],
+            'todo_text': todo['todo_text'],
+            'start_date': todo['start_date'],
+            'end_date': todo['end_date'],
+            'status': todo['status'],
+            'tags': list(todo['tags'])
+        }
+
+
+def get_sort_key(sort_by):
+    '''Get the key function to sort todos by a supported sort field
+    '''
+    return lambda k: k[sort_by] if k[sort_by] else ''
+
+
+def sort_todos(todo_items, sort_by=None):
+    '''Sort a list of todos by one of the supported sort fields
+    '''
 
     # Sort Results
     if sort_by:
         if sort_by not in SUPPORTED_SORT_FIELDS:
             raise ValueError('Invalid sort field {}'.format(sort_by))
-        todo_items = sorted(todo_items,
-                            key=lambda k: k[sort_by] if k[sort_by] else '',
+        todo_items = sorted(todo_items, key=get_sort_key(sort_by),
                             reverse=True)
 
     # Wrap Results
@@ -256,11 +358,11 @@ def analyze_todos(todos):
 
 def mark_todo(filename, line_number, status):
 
-    with open(filename, 'r') as file_object:
-        file_content = file_object.read()
-
-    split_content = file_content.split('\n')
-    line_content = split_content[line_number-1]
+    with open_note_buffer(filename) as note_buffer:
+        line_start = find_line_offset(note_buffer, line_number)
+        _, raw_line = next(iter_buffer_lines(note_buffer, line_start))
+    line_end = line_start + len(raw_line)
+    line_content = raw_line.decode('utf-8', errors='replace')
 
     # Modify line_content
     block_pattern = r'(^\s*)(\[)([ XS]*)(\])'
@@ -277,8 +379,17 @@ def mark_todo(filename, line_number, status):
         '\\g<1>[{}]'.format(sub_character),
         line_content)
 
-    split_content[line_number-1] = line_content
-    with open(filename, 'w') as file_object:
-        file_object.write('\n'.join(split_content))
+    new_raw_line = line_content.encode('utf-8')
+    if len(new_raw_line) == len(raw_line):
+        # Overwrite the line in place, leaving the rest of the file as is
+        with open(filename, 'r+b') as file_object:
+            file_object.seek(line_start)
+            file_object.write(new_raw_line)
+    else:
+        with open_note_buffer(filename) as note_buffer:
+            new_content = note_buffer[:line_start] + new_raw_line + \
+                note_buffer[line_end:]
+        with open(filename, 'wb') as file_object:
+            file_object.write(new_content)
 
     return line_content
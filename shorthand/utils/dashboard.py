@@ -0,0 +1,164 @@
+'''
+Summary of the notes shown on the home page, which is kept up to date
+from the changes recorded by the element index.
+
+The counts for each file are kept in memory, so when notes change only
+the changed files are looked at, and the totals are adjusted by the
+difference. The finished summary is cached until something changes.
+
+The element index is expected to be kept current by something else,
+such as `shorthand watch` when `element_index_watched` is set, so that
+serving the summary costs nothing more than a check for new changes.
+Refreshing the index while serving it looks at every notes file.
+'''
+
+import logging
+import threading
+from datetime import date, timedelta
+
+from shorthand.utils.paths import is_in_directory
+
+
+# How far either side of today events are included in the summary
+DEFAULT_EVENT_SPAN = timedelta(weeks=6)
+
+
+log = logging.getLogger(__name__)
+
+
+def get_file_summary(file_elements):
+    '''Get the parts of the summary which come from a single file
+    '''
+
+    undated_todos = 0
+    todo_start_dates = []
+    for todo in file_elements['todos']:
+        if todo['status'] != 'incomplete':
+            continue
+        if todo['start_date']:
+            todo_start_dates.append(todo['start_date'])
+        else:
+            undated_todos += 1
+
+    unanswered_questions = 0
+    for question in file_elements['questions']:
+        if question['answer'] is None:
+            unanswered_questions += 1
+
+    return {
+        'undated_todos': undated_todos,
+        'todo_start_dates': todo_start_dates,
+        'unanswered_questions': unanswered_questions
+    }
+
+
+def count_incomplete_todos(file_summary, current_date_stamp):
+    '''Count the incomplete todos within a file which aren't in the future
+    '''
+    current_todos = [start_date
+                     for start_date in file_summary['todo_start_dates']
+                     if start_date <= current_date_stamp]
+    return file_summary['undated_todos'] + len(current_todos)
+
+
+class DashboardSummary(object):
+    """Incomplete todo and unanswered question counts, along with the
+    calendar events around today, for a single directory of the notes
+    """
+
+    def __init__(self, element_index, directory_filter=None,
+                 event_span=DEFAULT_EVENT_SPAN):
+        super(DashboardSummary, self).__init__()
+        self.element_index = element_index
+        self.directory_filter = directory_filter
+        self.event_span = event_span
+        # Sequence number of the last index change which was applied
+        self.sequence = 0
+        # Relative file path -> summary of that file
+        self.file_summaries = {}
+        self.incomplete_todos = 0
+        self.unanswered_questions = 0
+        self.current_date_stamp = date.today().isoformat()
+        self.summary = None
+        self.lock = threading.Lock()
+
+    def update(self):
+        '''Apply any changes to the element index since the last update.
+        Returns whether anything changed
+        '''
+
+        sequence, updated_paths, removed_paths = \
+            self.element_index.get_changes(self.sequence)
+        if sequence == self.sequence:
+            return False
+
+        for file_path in updated_paths + removed_paths:
+            file_summary = self.file_summaries.pop(file_path, None)
+            if file_summary is not None:
+                self.incomplete_todos -= count_incomplete_todos(
+                    file_summary, self.current_date_stamp)
+                self.unanswered_questions -= \
+                    file_summary['unanswered_questions']
+
+        for file_path in updated_paths:
+            if not is_in_directory(file_path, self.directory_filter):
+                continue
+            file_summary = get_file_summary(
+                self.element_index.get_file_elements(file_path))
+            self.file_summaries[file_path] = file_summary
+            self.incomplete_todos += count_incomplete_todos(
+                file_summary, self.current_date_stamp)
+            self.unanswered_questions += file_summary['unanswered_questions']
+
+        log.debug(f'Updated the dashboard summary with '
+                  f'{len(updated_paths) + len(removed_paths)} changed files')
+        self.sequence = sequence
+        self.summary = None
+        return True
+
+    def set_date(self, current_date):
+        '''Move the summary to a new day, which may bring todos out of
+        the future and changes which events are recent
+        '''
+
+        self.current_date_stamp = current_date.isoformat()
+        self.incomplete_todos = 0
+        for file_summary in self.file_summaries.values():
+            self.incomplete_todos += count_incomplete_todos(
+                file_summary, self.current_date_stamp)
+        self.summary = None
+
+    def get_summary(self, refresh=False):
+        '''Get the summary of the notes, of the form:
+        {
+            "incomplete_todos": 12,
+            "unanswered_questions": 3,
+            "events": [<calendar events around today in date order>]
+        }
+
+        `refresh` brings the element index up to date first, which
+            looks at every notes file and is only needed when nothing
+            else, such as a watcher, keeps the index current
+        '''
+
+        if refresh:
+            self.element_index.refresh()
+
+        with self.lock:
+            today = date.today()
+            if self.current_date_stamp != today.isoformat():
+                self.set_date(today)
+            self.update()
+
+            if self.summary is None:
+                self.summary = {
+                    'incomplete_todos': self.incomplete_todos,
+                    'unanswered_questions': self.unanswered_questions,
+                    'events': self.element_index.get_calendar_events(
+                        start=(today - self.event_span).isoformat(),
+                        end=(today + self.event_span).isoformat(),
+                        directory_filter=self.directory_filter,
+                        refresh=False)
+                }
+
+            return self.summary
@@ -0,0 +1,489 @@
+'''
+Persistent index of all elements within the notes, stored in
+a SQLite database within the cache directory.
+
+Files are only re-parsed when their modification time or size has
+changed since the last refresh, so keeping the index current costs
+a `stat` of each notes file rather than a full read of the corpus.
+Every file update or removal is assigned an increasing sequence
+number so that consumers of the index can ask for just the files
+which have changed since they last looked.
+
+Dated events for the calendar are also kept in a table keyed by date,
+so that a range of dates can be looked up without reading every event.
+'''
+
+import json
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+
+from shorthand.utils.scanner import ELEMENT_TYPES, get_empty_elements, \
+                                    scan_file
+from shorthand.utils.files import get_file_stats
+from shorthand.calendar_tools import get_element_events
+from shorthand.tag_tools import is_valid_tag
+from shorthand.utils.paths import get_relative_path, get_full_path
+
+
+INDEX_FILE_NAME = 'element_index.sqlite'
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS files (
+        file_path TEXT PRIMARY KEY,
+        mtime_ns INTEGER NOT NULL,
+        size INTEGER NOT NULL,
+        sequence INTEGER NOT NULL
+    )''',
+    '''CREATE TABLE IF NOT EXISTS removed_files (
+        file_path TEXT PRIMARY KEY,
+        sequence INTEGER NOT NULL
+    )''',
+    '''CREATE TABLE IF NOT EXISTS elements (
+        file_path TEXT NOT NULL,
+        element_type TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        data TEXT NOT NULL
+    )''',
+    '''CREATE INDEX IF NOT EXISTS elements_by_type
+        ON elements (element_type, file_path, position)''',
+    '''CREATE INDEX IF NOT EXISTS elements_by_file
+        ON elements (file_path)''',
+    '''CREATE TABLE IF NOT EXISTS calendar_events (
+        date TEXT NOT NULL,
+        event_order INTEGER NOT NULL,
+        file_path TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        start_date TEXT,
+        data TEXT NOT NULL
+    )''',
+    '''CREATE INDEX IF NOT EXISTS calendar_events_by_date
+        ON calendar_events (date, event_order, file_path, position)''',
+    '''CREATE INDEX IF NOT EXISTS calendar_events_by_file
+        ON calendar_events (file_path)''',
+    '''CREATE TABLE IF NOT EXISTS tag_occurrences (
+        tag TEXT NOT NULL,
+        file_path TEXT NOT NULL,
+        line_number INTEGER NOT NULL,
+        occurrence INTEGER NOT NULL,
+        element_type TEXT,
+        position INTEGER
+    )''',
+    '''CREATE INDEX IF NOT EXISTS tag_occurrences_by_tag
+        ON tag_occurrences (tag, element_type, file_path, position)''',
+    '''CREATE INDEX IF NOT EXISTS tag_occurrences_by_file
+        ON tag_occurrences (file_path)'''
+]
+# Bumped whenever the schema changes in a way which needs every file
+# to be parsed again
+SCHEMA_VERSION = 5
+
+# Element types which tags are linked to when they're on the same line
+TAGGED_ELEMENT_TYPES = ['todos', 'questions', 'definitions']
+
+# Calendar events are ordered by their type within each day
+CALENDAR_EVENT_ORDER = ['section', 'incomplete_todo', 'completed_todo',
+                        'skipped_todo', 'question', 'answer']
+
+
+log = logging.getLogger(__name__)
+
+
+class ElementIndex(object):
+    """Element index for a notes directory which is persisted
+    in the cache directory and refreshed incrementally
+    """
+
+    def __init__(self, notes_directory, cache_directory):
+        super(ElementIndex, self).__init__()
+        self.notes_directory = notes_directory.rstrip('/')
+        self.db_path = cache_directory.rstrip('/') + '/' + INDEX_FILE_NAME
+        self.refresh_lock = threading.Lock()
+        with self.connect() as connection:
+            version = connection.execute(
+                'PRAGMA user_version').fetchone()[0]
+            if version < SCHEMA_VERSION:
+                # Tag occurrences have gained columns since they were
+                # first indexed, and are rebuilt from scratch anyway
+                connection.execute('DROP TABLE IF EXISTS tag_occurrences')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            if version < SCHEMA_VERSION:
+                # Parse every file again to fill in any new tables
+                connection.execute('DELETE FROM files')
+                connection.execute('DELETE FROM elements')
+                connection.execute('DELETE FROM calendar_events')
+                connection.execute('DELETE FROM tag_occurrences')
+                connection.execute(
+                    f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    @contextmanager
+    def connect(self):
+        '''Open a new connection to the index database which is committed
+        and closed on exit. Connections are not shared so that the index
+        can be used across threads
+        '''
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def refresh(self, paths=None):
+        '''Bring the index up to date with the notes directory by
+        re-parsing only the files whose modification time or size has
+        changed, and dropping files which no longer exist
+
+        If `paths` is specified then only those files are checked
+
+        Returns a tuple of (updated_paths, removed_paths)
+        '''
+
+        with self.refresh_lock:
+
+            file_stats = get_file_stats(self.notes_directory, paths)
+
+            with self.connect() as connection:
+                if paths is None:
+                    indexed_files = connection.execute(
+                        'SELECT file_path, mtime_ns, size FROM files'
+                    ).fetchall()
+                else:
+                    relative_paths = [
+                        get_relative_path(self.notes_directory, path)
+                        for path in paths]
+                    indexed_files = []
+                    for relative_path in relative_paths:
+                        indexed_files.extend(connection.execute(
+                            'SELECT file_path, mtime_ns, size FROM files '
+                            'WHERE file_path = ?', (relative_path,)
+                        ).fetchall())
+
+            indexed_stats = {file_path: (mtime_ns, size)
+                             for file_path, mtime_ns, size in indexed_files}
+
+            updated_paths = [file_path
+                             for file_path, stats in file_stats.items()
+                             if indexed_stats.get(file_path) != stats]
+            removed_paths = [file_path
+                             for file_path in indexed_stats.keys()
+                             if file_path not in file_stats]
+
+            if not updated_paths and not removed_paths:
+                return [], []
+
+            log.info(f'Updating {len(updated_paths)} files and removing '
+                     f'{len(removed_paths)} files in the element index')
+
+            # Parse all changed files before taking the write lock
+            parsed_files = {}
+            for file_path in updated_paths:
+                full_path = get_full_path(self.notes_directory, file_path)
+                try:
+                    parsed_files[file_path] = scan_file(
+                        self.notes_directory, full_path)
+                except FileNotFoundError:
+                    removed_paths.append(file_path)
+
+            with self.connect() as connection:
+                connection.execute('BEGIN IMMEDIATE')
+                sequence = self.get_sequence(connection)
+
+                for file_path, file_elements in parsed_files.items():
+                    sequence += 1
+                    mtime_ns, size = file_stats[file_path]
+                    connection.execute(
+                        'DELETE FROM elements WHERE file_path = ?',
+                        (file_path,))
+                    connection.execute(
+                        'DELETE FROM removed_files WHERE file_path = ?',
+                        (file_path,))
+                    connection.execute(
+                        'INSERT OR REPLACE INTO files (file_path, mtime_ns, '
+                        'size, sequence) VALUES (?, ?, ?, ?)',
+                        (file_path, mtime_ns, size, sequence))
+                    rows = []
+                    for element_type in ELEMENT_TYPES:
+                        for position, element in enumerate(
+                                file_elements[element_type]):
+                            rows.append((file_path, element_type, position,
+                                         json.dumps(element)))
+                    connection.executemany(
+                        'INSERT INTO elements (file_path, element_type, '
+                        'position, data) VALUES (?, ?, ?, ?)', rows)
+                    self.update_calendar_events(connection, file_path,
+                                                file_elements)
+                    self.update_tag_occurrences(connection, file_path,
+                                                file_elements)
+
+                for file_path in removed_paths:
+                    sequence += 1
+                    connection.execute(
+                        'DELETE FROM elements WHERE file_path = ?',
+                        (file_path,))
+                    connection.execute(
+                        'DELETE FROM calendar_events WHERE file_path = ?',
+                        (file_path,))
+                    connection.execute(
+                        'DELETE FROM tag_occurrences WHERE file_path = ?',
+                        (file_path,))
+                    connection.execute(
+                        'DELETE FROM files WHERE file_path = ?',
+                        (file_path,))
+                    connection.execute(
+                        'INSERT OR REPLACE INTO removed_files (file_path, '
+                        'sequence) VALUES (?, ?)', (file_path, sequence))
+
+            return list(parsed_files.keys()), removed_paths
+
+    def update_calendar_events(self, connection, file_path, file_elements):
+        '''Replace the calendar events for a file with the dated events
+        among its elements
+        '''
+
+        connection.execute('DELETE FROM calendar_events WHERE file_path = ?',
+                           (file_path,))
+        rows = []
+        for position, (event, start_date) in enumerate(
+                get_element_events(file_elements)):
+            if not event['date']:
+                continue
+            rows.append((event['date'],
+                         CALENDAR_EVENT_ORDER.index(event['type']),
+                         file_path, position, start_date,
+                         json.dumps(event)))
+        connection.executemany(
+            'INSERT INTO calendar_events (date, event_order, file_path, '
+            'position, start_date, data) VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+    def update_tag_occurrences(self, connection, file_path, file_elements):
+        '''Replace the tag occurrences for a file, linking each one to
+        every element on the same line. A tag on a line without any
+        elements is stored once without an element, and `occurrence`
+        numbers each tag within the file so that it is only counted once
+        '''
+
+        connection.execute('DELETE FROM tag_occurrences WHERE file_path = ?',
+                           (file_path,))
+
+        # Line number -> [(element type, position)] of the elements on it
+        line_elements = {}
+        for element_type in TAGGED_ELEMENT_TYPES:
+            for position, element in enumerate(file_elements[element_type]):
+                line_elements.setdefault(element['line_number'], []).append(
+                    (element_type, position))
+
+        rows = []
+        for occurrence, tag in enumerate(file_elements['tags']):
+            if not is_valid_tag(tag['tag']):
+                continue
+            for element_type, position in line_elements.get(
+                    tag['line_number'], [(None, None)]):
+                rows.append((tag['tag'], file_path, int(tag['line_number']),
+                             occurrence, element_type, position))
+        connection.executemany(
+            'INSERT INTO tag_occurrences (tag, file_path, line_number, '
+            'occurrence, element_type, position) '
+            'VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+    def get_sequence(self, connection=None):
+        '''Get the sequence number of the most recent change to the index
+        '''
+
+        if connection is None:
+            with self.connect() as connection:
+                return self.get_sequence(connection)
+
+        sequence = connection.execute(
+            'SELECT MAX(sequence) FROM (SELECT sequence FROM files '
+            'UNION ALL SELECT sequence FROM removed_files)').fetchone()[0]
+        return sequence or 0
+
+    def get_changes(self, since_sequence=0):
+        '''Get all files which have been updated or removed since the
+        specified sequence number
+
+        Returns a tuple of (sequence, updated_paths, removed_paths)
+        '''
+
+        with self.connect() as connection:
+            sequence = self.get_sequence(connection)
+            updated_paths = [row[0] for row in connection.execute(
+                'SELECT file_path FROM files WHERE sequence > ? '
+                'ORDER BY sequence', (since_sequence,))]
+            removed_paths = [row[0] for row in connection.execute(
+                'SELECT file_path FROM removed_files WHERE sequence > ? '
+                'ORDER BY sequence', (since_sequence,))]
+
+        return sequence, updated_paths, removed_paths
+
+    def get_elements(self, directory_filter=None, element_types=None,
+                     refresh=True, tag=None):
+        '''Get all elements within the index in the same form as
+        a scan of the notes directory
+
+        `element_types` can be used to only load the element types
+            which are needed, all other element types are left empty
+        `refresh` toggles whether the index is brought up to date
+            before being queried
+        `tag` only loads the todos, questions, and definitions which
+            are on the same line as the tag, which are looked up from
+            the tag index. Other element types are left empty
+        '''
+
+        if refresh:
+            self.refresh()
+
+        if element_types is None:
+            element_types = ELEMENT_TYPES
+
+        if tag:
+            element_types = [element_type for element_type in element_types
+                             if element_type in TAGGED_ELEMENT_TYPES]
+            query = 'SELECT DISTINCT elements.file_path, ' \
+                    'elements.position, elements.data ' \
+                    'FROM tag_occurrences JOIN elements ' \
+                    'ON elements.file_path = tag_occurrences.file_path ' \
+                    'AND elements.element_type = ' \
+                    'tag_occurrences.element_type ' \
+                    'AND elements.position = tag_occurrences.position ' \
+                    'WHERE tag_occurrences.element_type = ? ' \
+                    'AND tag_occurrences.tag = ?'
+            params = [tag]
+            path_column = 'tag_occurrences.file_path'
+        else:
+            query = 'SELECT file_path, position, data FROM elements ' \
+                    'WHERE element_type = ?'
+            params = []
+            path_column = 'file_path'
+        if directory_filter:
+            path_prefix = '/' + directory_filter.strip('/') + '/'
+            query += f' AND substr({path_column}, 1, ?) = ?'
+            params.extend([len(path_prefix), path_prefix])
+        query += ' ORDER BY 1, 2'
+
+        elements = get_empty_elements()
+        with self.connect() as connection:
+            for element_type in element_types:
+                elements[element_type] = [
+                    json.loads(data)
+                    for file_path, position, data in connection.execute(
+                        query, [element_type] + params)]
+
+        return elements
+
+    def get_file_elements(self, file_path):
+        '''Get all elements within a single file from the index
+        '''
+
+        file_path = get_relative_path(self.notes_directory, file_path)
+
+        elements = get_empty_elements()
+        with self.connect() as connection:
+            for element_type, data in connection.execute(
+                    'SELECT element_type, data FROM elements '
+                    'WHERE file_path = ? ORDER BY position', (file_path,)):
+                elements[element_type].append(json.loads(data))
+
+        return elements
+
+    def get_calendar_events(self, start=None, end=None,
+                            directory_filter=None, refresh=True):
+        '''Get all calendar events between two inclusive dates of the
+        form `YYYY-MM-DD` in date order. Events are looked up by date,
+        so only the events within the range are read. Todos which
+        start in the future are left out
+
+        `refresh` toggles whether the index is brought up to date
+            before being queried
+        '''
+
+        if refresh:
+            self.refresh()
+
+        current_date_stamp = datetime.now().isoformat()[:10]
+        query = 'SELECT data FROM calendar_events ' \
+                'WHERE (start_date IS NULL OR start_date <= ?)'
+        params = [current_date_stamp]
+        if start:
+            query += ' AND date >= ?'
+            params.append(start)
+        if end:
+            query += ' AND date <= ?'
+            params.append(end)
+        if directory_filter:
+            path_prefix = '/' + directory_filter.strip('/') + '/'
+            query += ' AND substr(file_path, 1, ?) = ?'
+            params.extend([len(path_prefix), path_prefix])
+        query += ' ORDER BY date, event_order, file_path, position'
+
+        with self.connect() as connection:
+            return [json.loads(row[0])
+                    for row in connection.execute(query, params)]
+
+    def get_tag_counts(self, directory_filter=None, refresh=True):
+        '''Get the number of times that each tag is used within the notes
+        from the tag index
+
+        `refresh` toggles whether the index is brought up to date
+            before being queried
+        '''
+
+        if refresh:
+            self.refresh()
+
+        # A tag on the same line as several elements has a row for
+        # each of them, but is still only a single occurrence
+        query = 'SELECT DISTINCT tag, file_path, occurrence ' \
+                'FROM tag_occurrences'
+        params = []
+        if directory_filter:
+            path_prefix = '/' + directory_filter.strip('/') + '/'
+            query += ' WHERE substr(file_path, 1, ?) = ?'
+            params = [len(path_prefix), path_prefix]
+        query = f'SELECT tag, COUNT(*) FROM ({query}) GROUP BY tag'
+
+        with self.connect() as connection:
+            return {tag: count
+                    for tag, count in connection.execute(query, params)}
+
+    def get_tag_occurrences(self, tag, element_type=None,
+                            directory_filter=None, refresh=True):
+        '''Get every occurrence of a tag within the notes, of the form:
+        {
+            "file_path": "/path/to/file.note",
+            "line_number": "12",
+            "element_type": "todos"
+        }
+        where `element_type` is None for tags which aren't on the same
+        line as a todo, question, or definition. A tag on the same line
+        as several of them has an occurrence for each one
+
+        `element_type` only gets the occurrences on that element type
+        '''
+
+        if refresh:
+            self.refresh()
+
+        query = 'SELECT file_path, line_number, element_type ' \
+                'FROM tag_occurrences WHERE tag = ?'
+        params = [tag]
+        if element_type:
+            query += ' AND element_type = ?'
+            params.append(element_type)
+        if directory_filter:
+            path_prefix = '/' + directory_filter.strip('/') + '/'
+            query += ' AND substr(file_path, 1, ?) = ?'
+            params.extend([len(path_prefix), path_prefix])
+        query += ' ORDER BY file_path, line_number, occurrence'
+
+        with self.connect() as connection:
+            return [{
+                'file_path': file_path,
+                'line_number': str(line_number),
+                'element_type': occurrence_type
+            } for file_path, line_number, occurrence_type
+                in connection.execute(query, params)]
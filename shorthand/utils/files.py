@@ -0,0 +1,151 @@
+'''
+Utilities for finding and reading the notes files within
+the notes directory
+'''
+
+import os
+import mmap
+from contextlib import contextmanager
+
+from shorthand.utils.paths import get_relative_path, get_full_path
+
+
+# Smaller files are cheaper to read outright than to map
+MMAP_MIN_BYTES = 256 * 1024
+
+
+def get_notes_files(search_directory):
+    '''Get the full paths of all notes files within a directory
+    '''
+
+    notes_files = []
+    subdirectories = []
+    try:
+        with os.scandir(search_directory) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    subdirectories.append(entry.path)
+                elif entry.name[-5:] == '.note' and entry.is_file():
+                    notes_files.append(entry.path)
+    except (FileNotFoundError, NotADirectoryError):
+        return []
+
+    notes_files.sort()
+    for subdirectory in sorted(subdirectories):
+        notes_files.extend(get_notes_files(subdirectory))
+
+    return notes_files
+
+
+def get_file_stats(notes_directory, paths=None):
+    '''Get the modification time and size of notes files keyed by
+    their relative path. If `paths` are specified then only those
+    files are checked, otherwise every notes file in the notes
+    directory is checked. Files which do not exist are left out
+    '''
+
+    if paths is None:
+        full_paths = get_notes_files(notes_directory)
+    else:
+        full_paths = [get_full_path(notes_directory, path)
+                      for path in paths]
+
+    file_stats = {}
+    for full_path in full_paths:
+        if full_path[-5:] != '.note':
+            continue
+        try:
+            stat_result = os.stat(full_path)
+        except FileNotFoundError:
+            continue
+        relative_path = get_relative_path(notes_directory, full_path)
+        file_stats[relative_path] = (stat_result.st_mtime_ns,
+                                     stat_result.st_size)
+
+    return file_stats
+
+
+def read_note_bytes(full_path):
+    '''Read the raw content of a notes file
+    '''
+
+    with open(full_path, 'rb') as note_file_object:
+        return note_file_object.read()
+
+
+def read_note_lines(full_path):
+    '''Read the content of a notes file split into lines, keeping
+    line numbering consistent with grep
+    '''
+
+    note_content = read_note_bytes(full_path)
+    return note_content.decode('utf-8', errors='replace').split('\n')
+
+
+@contextmanager
+def open_note_buffer(full_path):
+    '''Open the raw content of a notes file as a read-only buffer.
+    Large files are memory-mapped so that only the pages which are
+    actually looked at get read, while small files are read outright.
+
+    Either way the buffer supports `find`, slicing, and `len`, but
+    substring checks must use `find` since `in` on a memory map
+    only matches single bytes
+    '''
+
+    with open(full_path, 'rb') as note_file_object:
+        file_size = os.fstat(note_file_object.fileno()).st_size
+        if file_size < MMAP_MIN_BYTES:
+            yield note_file_object.read()
+            return
+
+        note_buffer = mmap.mmap(note_file_object.fileno(), 0,
+                                access=mmap.ACCESS_READ)
+        try:
+            yield note_buffer
+        finally:
+            note_buffer.close()
+
+
+def iter_buffer_lines(buffer, start=0):
+    '''Iterate over the lines of a buffer as `(offset, line)` pairs
+    without splitting the whole buffer up front, beginning from the
+    line which starts at the `start` offset
+    '''
+
+    buffer_size = len(buffer)
+    while start <= buffer_size:
+        end = buffer.find(b'\n', start)
+        if end == -1:
+            end = buffer_size
+        yield start, buffer[start:end]
+        start = end + 1
+
+
+def find_line_offset(buffer, line_number):
+    '''Find the offset of the start of a line within a buffer, only
+    reading as far into the buffer as that line. Raises a ValueError
+    if the buffer has fewer lines
+    '''
+
+    offset = 0
+    for _ in range(line_number - 1):
+        offset = buffer.find(b'\n', offset)
+        if offset == -1:
+            raise ValueError(f'Line {line_number} is past the end '
+                             f'of the file')
+        offset += 1
+    return offset
+
+
+def is_line_offset(buffer, offset, line_number):
+    '''Check whether an offset is the start of a specific line within
+    a buffer
+    '''
+
+    if offset < 0 or offset > len(buffer):
+        return False
+    if offset and buffer[offset - 1:offset] != b'\n':
+        return False
+    return buffer[:offset].count(b'\n') == line_number - 1
+
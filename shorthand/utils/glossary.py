@@ -0,0 +1,163 @@
+'''
+In-memory glossary of every definition within the notes, kept sorted
+by term so that a single term, or all terms starting with a prefix,
+can be looked up with a binary search instead of a search of the
+notes. Terms are matched case insensitive.
+
+The glossary is kept up to date from the changes recorded by the
+element index, so only the definitions in changed files are replaced.
+'''
+
+import logging
+import threading
+from bisect import bisect_left, insort
+
+from shorthand.utils.paths import get_display_path, is_in_directory
+
+
+log = logging.getLogger(__name__)
+
+
+def get_term_key(term):
+    '''Get the key which a term is sorted and looked up by
+    '''
+    return term.strip().lower()
+
+
+class Glossary(object):
+    """Definitions sorted by term, for exact and prefix lookups
+    """
+
+    def __init__(self, element_index=None):
+        super(Glossary, self).__init__()
+        self.element_index = element_index
+        # Sorted (term key, file path, line number) entries
+        self.entries = []
+        # Entry -> definition
+        self.definitions = {}
+        # File path -> entries for the definitions within that file
+        self.file_entries = {}
+        # Sequence number of the last index change which was applied
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def add_file(self, file_path, definitions):
+        '''Replace all definitions within a file
+        '''
+
+        self.remove_file(file_path)
+        file_entries = []
+        for definition in definitions:
+            entry = (get_term_key(definition['term']), file_path,
+                     int(definition['line_number']))
+            insort(self.entries, entry)
+            self.definitions[entry] = definition
+            file_entries.append(entry)
+        if file_entries:
+            self.file_entries[file_path] = file_entries
+
+    def remove_file(self, file_path):
+        '''Remove all definitions within a file
+        '''
+
+        for entry in self.file_entries.pop(file_path, []):
+            entry_idx = bisect_left(self.entries, entry)
+            del self.entries[entry_idx]
+            del self.definitions[entry]
+
+    def load(self, elements):
+        '''Load all definitions from a scan of the notes directory
+        '''
+
+        file_definitions = {}
+        for definition in elements['definitions']:
+            file_definitions.setdefault(definition['file_path'], [])
+            file_definitions[definition['file_path']].append(definition)
+
+        with self.lock:
+            for file_path in list(self.file_entries.keys()):
+                self.remove_file(file_path)
+            for file_path, definitions in file_definitions.items():
+                self.add_file(file_path, definitions)
+
+    def update(self, refresh=True):
+        '''Apply any changes to the element index since the last update.
+        Returns whether anything changed
+
+        `refresh` toggles whether the element index is brought up
+            to date first
+        '''
+
+        if refresh:
+            self.element_index.refresh()
+
+        with self.lock:
+            sequence, updated_paths, removed_paths = \
+                self.element_index.get_changes(self.sequence)
+            if sequence == self.sequence:
+                return False
+
+            for file_path in removed_paths:
+                self.remove_file(file_path)
+            for file_path in updated_paths:
+                file_elements = self.element_index.get_file_elements(
+                    file_path)
+                self.add_file(file_path, file_elements['definitions'])
+
+            log.debug(f'Updated the glossary with '
+                      f'{len(updated_paths) + len(removed_paths)} '
+                      f'changed files')
+            self.sequence = sequence
+            return True
+
+    def lookup(self, term, directory_filter=None):
+        '''Get the definitions of a single term
+        '''
+
+        term_key = get_term_key(term)
+        return self.get_matching(term_key, directory_filter,
+                                 lambda entry_key: entry_key == term_key)
+
+    def lookup_prefix(self, prefix, directory_filter=None, limit=None):
+        '''Get the definitions of all terms starting with a prefix,
+        sorted by term
+
+        `limit` returns at most this many definitions
+        '''
+
+        prefix_key = get_term_key(prefix)
+        return self.get_matching(
+            prefix_key, directory_filter,
+            lambda entry_key: entry_key.startswith(prefix_key), limit)
+
+    def get_matching(self, start_key, directory_filter, is_match,
+                     limit=None):
+        '''Get definitions in term order, starting from the first term
+        which sorts at or after `start_key`, for as long as `is_match`
+        holds for their term key
+        '''
+
+        definitions = []
+        with self.lock:
+            entry_idx = bisect_left(self.entries, (start_key,))
+            while entry_idx < len(self.entries):
+                entry = self.entries[entry_idx]
+                entry_idx += 1
+                if not is_match(entry[0]):
+                    break
+                if not is_in_directory(entry[1], directory_filter):
+                    continue
+
+                definition = self.definitions[entry]
+                definitions.append({
+                    "file_path": definition['file_path'],
+                    "display_path": get_display_path(
+                        definition['file_path'], directory_filter),
+                    "line_number": definition['line_number'],
+                    "term": definition['term'],
+                    "definition": definition['definition']
+                })
+                if limit is not None and len(definitions) >= limit:
+                    break
+
+        return definitions
@@ -0,0 +1,392 @@
+'''
+In-memory spatial index of the GPS locations within the notes, which
+buckets each location into a grid of latitude / longitude cells so that
+the locations within a bounding box, or nearest to a point, are found
+by only looking at the nearby cells instead of every location.
+
+The index is kept up to date from the changes recorded by the element
+index, so only the locations in changed files are replaced.
+
+Locations can also be grouped into clusters for each zoom level of a
+map, which are cached until a file with locations in it changes.
+'''
+
+import math
+import heapq
+import logging
+import threading
+
+from shorthand.utils.paths import get_display_path, is_in_directory
+
+
+# Size of each grid cell in degrees
+DEFAULT_CELL_SIZE = 1.0
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Locations within a square of this many pixels on a map are clustered
+CLUSTER_PIXELS = 60
+# Width of the whole world in pixels at zoom level 0
+TILE_PIXELS = 256
+MAX_ZOOM = 20
+# Number of locations from each cluster which are returned with it
+CLUSTER_SAMPLE_SIZE = 3
+
+
+log = logging.getLogger(__name__)
+
+
+def get_distance(latitude_a, longitude_a, latitude_b, longitude_b):
+    '''Get the great circle distance in kilometers between two points
+    using the haversine formula
+    '''
+
+    latitude_a = math.radians(latitude_a)
+    latitude_b = math.radians(latitude_b)
+    latitude_delta = latitude_b - latitude_a
+    longitude_delta = math.radians(longitude_b - longitude_a)
+
+    haversine = math.sin(latitude_delta / 2) ** 2 + \
+        math.cos(latitude_a) * math.cos(latitude_b) * \
+        math.sin(longitude_delta / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(haversine)))
+
+
+def validate_bounds(bounds):
+    '''Check a `(south, west, north, east)` bounding box in degrees and
+    return it as floats. A box where west is greater than east crosses
+    the antimeridian
+    '''
+
+    try:
+        south, west, north, east = [float(bound) for bound in bounds]
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid bounding box {bounds}')
+
+    if south > north:
+        raise ValueError(f'South bound {south} is north of '
+                         f'north bound {north}')
+    return south, west, north, east
+
+
+def is_in_bounds(latitude, longitude, bounds):
+    '''Check whether a point is within a validated bounding box
+    '''
+
+    south, west, north, east = bounds
+    if not south <= latitude <= north:
+        return False
+    if west <= east:
+        return west <= longitude <= east
+    return longitude >= west or longitude <= east
+
+
+def format_location(location, directory_filter=None):
+    '''Get a location in the form returned by the location tools
+    '''
+    return {
+        "latitude": location['latitude'],
+        "longitude": location['longitude'],
+        "name": location['name'],
+        'file_path': location['file_path'],
+        'display_path': get_display_path(location['file_path'],
+                                         directory_filter),
+        'line_number': location['line_number'],
+    }
+
+
+class LocationIndex(object):
+    """GPS locations bucketed into a grid of cells for bounding box
+    and nearest neighbour queries
+    """
+
+    def __init__(self, element_index=None, cell_size=DEFAULT_CELL_SIZE):
+        super(LocationIndex, self).__init__()
+        self.element_index = element_index
+        self.cell_size = cell_size
+        # (latitude cell, longitude cell) -> (latitude, longitude,
+        #   location) entries within that cell
+        self.cells = {}
+        # Latitude cell -> longitude cells in that row with any entries
+        self.rows = {}
+        # File path -> cells holding the locations within that file
+        self.file_cells = {}
+        # (zoom, directory filter) -> clusters
+        self.clusters = {}
+        # Sequence number of the last index change which was applied
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def get_cell(self, latitude, longitude):
+        '''Get the grid cell which a point falls in
+        '''
+        return (math.floor(latitude / self.cell_size),
+                math.floor(longitude / self.cell_size))
+
+    def add_file(self, file_path, locations):
+        '''Replace all locations within a file
+        '''
+
+        self.remove_file(file_path)
+        file_cells = set()
+        for location in locations:
+            try:
+                latitude = float(location['latitude'])
+                longitude = float(location['longitude'])
+            except ValueError:
+                log.debug(f'Skipping invalid location {location}')
+                continue
+            cell = self.get_cell(latitude, longitude)
+            self.cells.setdefault(cell, [])
+            self.cells[cell].append((latitude, longitude, location))
+            self.rows.setdefault(cell[0], set())
+            self.rows[cell[0]].add(cell[1])
+            file_cells.add(cell)
+        if file_cells:
+            self.file_cells[file_path] = file_cells
+            self.clusters = {}
+
+    def remove_file(self, file_path):
+        '''Remove all locations within a file
+        '''
+
+        if file_path in self.file_cells:
+            self.clusters = {}
+
+        for cell in self.file_cells.pop(file_path, []):
+            entries = [entry for entry in self.cells[cell]
+                       if entry[2]['file_path'] != file_path]
+            if entries:
+                self.cells[cell] = entries
+                continue
+            del self.cells[cell]
+            self.rows[cell[0]].discard(cell[1])
+            if not self.rows[cell[0]]:
+                del self.rows[cell[0]]
+
+    def load(self, elements):
+        '''Load all locations from a scan of the notes directory
+        '''
+
+        file_locations = {}
+        for location in elements['locations']:
+            file_locations.setdefault(location['file_path'], [])
+            file_locations[location['file_path']].append(location)
+
+        with self.lock:
+            for file_path in list(self.file_cells.keys()):
+                self.remove_file(file_path)
+            for file_path, locations in file_locations.items():
+                self.add_file(file_path, locations)
+
+    def update(self, refresh=True):
+        '''Apply any changes to the element index since the last update.
+        Returns whether anything changed
+
+        `refresh` toggles whether the element index is brought up
+            to date first
+        '''
+
+        if refresh:
+            self.element_index.refresh()
+
+        with self.lock:
+            sequence, updated_paths, removed_paths = \
+                self.element_index.get_changes(self.sequence)
+            if sequence == self.sequence:
+                return False
+
+            for file_path in removed_paths:
+                self.remove_file(file_path)
+            for file_path in updated_paths:
+                file_elements = self.element_index.get_file_elements(
+                    file_path)
+                self.add_file(file_path, file_elements['locations'])
+
+            log.debug(f'Updated the location index with '
+                      f'{len(updated_paths) + len(removed_paths)} '
+                      f'changed files')
+            self.sequence = sequence
+            return True
+
+    def get_locations(self, bounds=None, directory_filter=None):
+        '''Get all locations, optionally only those within a
+        `(south, west, north, east)` bounding box
+        '''
+
+        if bounds is not None:
+            bounds = validate_bounds(bounds)
+
+        locations = []
+        with self.lock:
+            for cell in self.get_bounds_cells(bounds):
+                for latitude, longitude, location in self.cells[cell]:
+                    if not is_in_directory(location['file_path'],
+                                           directory_filter):
+                        continue
+                    if bounds is not None and \
+                            not is_in_bounds(latitude, longitude, bounds):
+                        continue
+                    locations.append(format_location(location,
+                                                     directory_filter))
+
+        return locations
+
+    def get_bounds_cells(self, bounds=None):
+        '''Get the cells which overlap a validated bounding box
+        '''
+
+        if bounds is None:
+            return list(self.cells.keys())
+
+        south, west, north, east = bounds
+        south_row, west_column = self.get_cell(south, west)
+        north_row, east_column = self.get_cell(north, east)
+
+        cells = []
+        for row in range(south_row, north_row + 1):
+            for column in self.rows.get(row, []):
+                if west <= east:
+                    in_bounds = west_column <= column <= east_column
+                else:
+                    in_bounds = column >= west_column or \
+                        column <= east_column
+                if in_bounds:
+                    cells.append((row, column))
+        return cells
+
+    def get_nearest(self, latitude, longitude, count=10,
+                    directory_filter=None):
+        '''Get the `count` locations nearest to a point, closest first,
+        with the `distance` to each in kilometers
+
+        Rows of cells are searched outwards from the row holding the
+        point, and the search stops once the next row is further away
+        than the furthest of the nearest locations found so far
+        '''
+
+        if count < 1:
+            raise ValueError(f'Invalid location count {count}')
+
+        center_row, _ = self.get_cell(latitude, longitude)
+        kilometers_per_row = math.radians(self.cell_size) * EARTH_RADIUS_KM
+
+        # Max-heap of the nearest locations by negated distance
+        nearest = []
+        entry_count = 0
+        with self.lock:
+            if not self.rows:
+                return []
+            row_span = max(abs(row - center_row) for row in self.rows)
+
+            for row_offset in range(row_span + 1):
+                # Every point in rows this far away is at least this
+                # far away in latitude alone
+                min_distance = max(0, row_offset - 1) * kilometers_per_row
+                if len(nearest) >= count and -nearest[0][0] < min_distance:
+                    break
+
+                rows = set([center_row - row_offset, center_row + row_offset])
+                for row in rows:
+                    for column in self.rows.get(row, []):
+                        for entry in self.cells[(row, column)]:
+                            entry_latitude, entry_longitude, location = entry
+                            if not is_in_directory(location['file_path'],
+                                                   directory_filter):
+                                continue
+                            distance = get_distance(
+                                latitude, longitude,
+                                entry_latitude, entry_longitude)
+                            # The entry count keeps locations themselves
+                            # from ever being compared
+                            entry_count += 1
+                            item = (-distance, entry_count, location)
+                            if len(nearest) < count:
+                                heapq.heappush(nearest, item)
+                            elif item > nearest[0]:
+                                heapq.heapreplace(nearest, item)
+
+        locations = []
+        for item in sorted(nearest, reverse=True):
+            location = format_location(item[-1], directory_filter)
+            location['distance'] = -item[0]
+            locations.append(location)
+        return locations
+
+    def get_clusters(self, zoom, bounds=None, directory_filter=None):
+        '''Get the locations grouped into clusters for a zoom level of a
+        map, of the form:
+        {
+            "latitude": <latitude of the cluster centroid>,
+            "longitude": <longitude of the cluster centroid>,
+            "count": <number of locations in the cluster>,
+            "locations": [<a sample of the locations in the cluster>]
+        }
+
+        Locations are clustered by a grid which gets finer with each zoom
+            level. Clusters are cached for each zoom level until the
+            locations change
+        `bounds` only returns the clusters with a centroid within a
+            `(south, west, north, east)` bounding box
+        '''
+
+        zoom = int(zoom)
+        if not 0 <= zoom <= MAX_ZOOM:
+            raise ValueError(f'Invalid zoom level {zoom}')
+        if bounds is not None:
+            bounds = validate_bounds(bounds)
+
+        with self.lock:
+            cache_key = (zoom, directory_filter)
+            if cache_key not in self.clusters:
+                self.clusters[cache_key] = self.build_clusters(
+                    zoom, directory_filter)
+            clusters = self.clusters[cache_key]
+
+        if bounds is None:
+            return clusters
+        return [cluster for cluster in clusters
+                if is_in_bounds(cluster['latitude'], cluster['longitude'],
+                                bounds)]
+
+    def build_clusters(self, zoom, directory_filter=None):
+        '''Group all locations into clusters for a zoom level
+        '''
+
+        cluster_size = 360 * CLUSTER_PIXELS / (TILE_PIXELS * 2 ** zoom)
+
+        # Cluster cell -> [latitude total, longitude total, locations]
+        cluster_cells = {}
+        for entries in self.cells.values():
+            for latitude, longitude, location in entries:
+                if not is_in_directory(location['file_path'],
+                                       directory_filter):
+                    continue
+                cluster_cell = (math.floor(latitude / cluster_size),
+                                math.floor(longitude / cluster_size))
+                if cluster_cell not in cluster_cells:
+                    cluster_cells[cluster_cell] = [0.0, 0.0, []]
+                cluster_totals = cluster_cells[cluster_cell]
+                cluster_totals[0] += latitude
+                cluster_totals[1] += longitude
+                cluster_totals[2].append(location)
+
+        clusters = []
+        for cluster_cell in sorted(cluster_cells.keys()):
+            latitude_total, longitude_total, locations = \
+                cluster_cells[cluster_cell]
+            sample_locations = heapq.nsmallest(
+                CLUSTER_SAMPLE_SIZE, locations,
+                key=lambda location: (location['file_path'],
+                                      int(location['line_number'])))
+            clusters.append({
+                'latitude': latitude_total / len(locations),
+                'longitude': longitude_total / len(locations),
+                'count': len(locations),
+                'locations': [format_location(location, directory_filter)
+                              for location in sample_locations]
+            })
+
+        log.debug(f'Built {len(clusters)} location clusters '
+                  f'for zoom level {zoom}')
+        return clusters
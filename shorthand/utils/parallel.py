@@ -0,0 +1,65 @@
+'''
+Shared process pools for work which is spread across the notes files,
+such as scanning them for elements or searching them in-process.
+
+Larger sets of notes files are split into batches which are handed
+out to a pool of processes, while smaller ones are not worth the cost
+of sending them to another process.
+'''
+
+import os
+import atexit
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+
+# Below this many files work is not worth spreading across processes
+PARALLEL_SCAN_MIN_FILES = 64
+SCAN_BATCHES_PER_WORKER = 4
+
+# Process pools are expensive to start, so they are kept
+# around and shared between scans
+SCAN_POOLS = {}
+
+
+log = logging.getLogger(__name__)
+
+
+def get_worker_count(workers=None):
+    '''Get the number of processes to use, which defaults to the
+    number of cores
+    '''
+    if workers is None:
+        workers = os.cpu_count() or 1
+    return workers
+
+
+def get_file_batches(full_paths, workers):
+    '''Split a list of files into batches to be handed out to a pool
+    of workers. Several batches are used per worker so that a batch
+    of large files doesn't hold up all of the others
+    '''
+
+    batch_count = workers * SCAN_BATCHES_PER_WORKER
+    batch_size = -(-len(full_paths) // batch_count)
+    return [full_paths[idx:idx + batch_size]
+            for idx in range(0, len(full_paths), batch_size)]
+
+
+def get_scan_pool(workers):
+    '''Get a shared process pool with the specified number of workers
+    '''
+    if workers not in SCAN_POOLS:
+        SCAN_POOLS[workers] = ProcessPoolExecutor(max_workers=workers)
+    return SCAN_POOLS[workers]
+
+
+@atexit.register
+def shutdown_scan_pools():
+    '''Shut down all of the shared process pools, so that their worker
+    processes don't outlive the process which started them
+    '''
+    for workers, pool in list(SCAN_POOLS.items()):
+        log.debug(f'Shutting down scan pool with {workers} processes')
+        pool.shutdown(wait=True)
+    SCAN_POOLS.clear()
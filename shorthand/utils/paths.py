@@ -84,3 +84,20 @@ def get_display_path(path, directory_filter=None):
     path = ' → '.join(path.split('/'))
 
     return path
+
+
+def is_in_directory(path, directory_filter=None):
+    '''Check whether a relative path within the notes directory
+    falls under the specified directory filter
+    '''
+
+    if not directory_filter:
+        return True
+
+    # Always work with paths that start with slashes, and
+    # Directory filters that start and end with slashes
+    if path[0] != '/':
+        path = '/' + path
+    directory_filter = '/' + directory_filter.strip('/') + '/'
+
+    return path[:len(directory_filter)] == directory_filter
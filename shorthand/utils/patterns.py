@@ -2,6 +2,8 @@
 Regular Expression Library used by Shorthand.
 '''
 
+import re
+
 # General
 #   Matches a valid Date Stamp
 DATE_STAMP_PATTERN = r'[1-2][0-9]{3}\-[0-3][0-9]\-[0-3][0-9]'
@@ -81,6 +83,24 @@ GPS_PATTERN = r"(GPS\[)(-?1?\d{1,2}\.\d{3,6})(, ?)"\
 
 CHARS_TO_ESCAPE = ['`']
 
+# Characters which are special in a Python regex but literal in a
+# grep basic regex, unless escaped with a backslash
+BRE_LITERAL_CHARACTERS = '+?(){}|'
+
+# POSIX character classes within grep bracket expressions
+POSIX_CLASS_REGEX = re.compile(r'\[:([a-z]+):\]')
+POSIX_CLASSES = {
+    'alpha': 'a-zA-Z',
+    'digit': '0-9',
+    'alnum': 'a-zA-Z0-9',
+    'upper': 'A-Z',
+    'lower': 'a-z',
+    'space': '\\s',
+    'blank': ' \\t',
+    'xdigit': '0-9A-Fa-f',
+    'punct': re.escape('!"#$%&\'()*+,-./:;<=>?@[\\]^_`{|}~')
+}
+
 
 def escape_for_cli(input_pattern):
     '''Patterns which include special characters must
@@ -99,3 +119,82 @@ def escape_for_cli(input_pattern):
             input_pattern = input_pattern[1:]
 
     return clean_pattern
+
+
+def translate_grep_pattern(pattern):
+    '''Translate a grep basic regular expression into an equivalent
+    Python regular expression
+    '''
+
+    translated = ''
+    # Whether the previous element can be repeated with a star,
+    # a star anywhere else is a literal in grep
+    can_repeat = False
+    idx = 0
+    while idx < len(pattern):
+        character = pattern[idx]
+        next_character = pattern[idx + 1:idx + 2]
+
+        if character == '[':
+            # Bracket expressions
+            translated += '['
+            idx += 1
+            if pattern[idx:idx + 1] == '^':
+                translated += '^'
+                idx += 1
+            if pattern[idx:idx + 1] == ']':
+                translated += '\\]'
+                idx += 1
+            while idx < len(pattern) and pattern[idx] != ']':
+                class_match = POSIX_CLASS_REGEX.match(pattern, idx)
+                if class_match:
+                    translated += POSIX_CLASSES[class_match.group(1)]
+                    idx = class_match.end()
+                    continue
+                if pattern[idx] in '\\[':
+                    translated += '\\'
+                translated += pattern[idx]
+                idx += 1
+            if idx >= len(pattern):
+                raise re.error('Unmatched [ in pattern', pattern)
+            translated += ']'
+            can_repeat = True
+
+        elif character == '\\' and next_character:
+            if next_character in BRE_LITERAL_CHARACTERS:
+                translated += next_character
+                can_repeat = next_character not in '(|'
+            elif next_character in '<>':
+                translated += '\\b'
+                can_repeat = False
+            else:
+                translated += '\\' + next_character
+                can_repeat = True
+            idx += 1
+
+        elif character == '*' and not can_repeat:
+            translated += '\\*'
+            can_repeat = True
+
+        elif character == '^' and can_repeat:
+            # An anchor is only special at the start of the pattern
+            translated += '\\^'
+            can_repeat = True
+
+        elif character == '$' and next_character and \
+                pattern[idx + 1:idx + 3] not in ['\\)', '\\|']:
+            # An anchor is only special at the end of the pattern
+            translated += '\\$'
+            can_repeat = True
+
+        elif character in BRE_LITERAL_CHARACTERS:
+            translated += '\\' + character
+            can_repeat = True
+
+        else:
+            translated += character
+            can_repeat = character != '^'
+
+        idx += 1
+
+    return translated
@@ -1,3 +1,4 @@
+import io
 import re
 import json
 import logging
@@ -25,15 +26,15 @@ ALL_TYPES = [
     "int", "line", "date", "bool", "real", "uuid",
     "range", "enum", "size", "regexp"]
 
+field_regex = re.compile(r'[a-zA-Z][a-zA-Z0-9_]*: .*')
 
-def load_from_file(file_path):
-    '''Load one or more record sets from a rec file
+
+def load_from_file(file_path, columnar=False):
+    '''Load a record set from a rec file, reading it one line at a time
     '''
 
     with open(file_path, 'r') as rec_file_object:
-        rec_file_content = rec_file_object.read()
-
-    return load_from_string(rec_file_content)
+        return load_from_lines(rec_file_object, columnar=columnar)
 
 
 def process_type_definition(definition_string):
@@ -134,271 +135,320 @@ def process_type_definition(definition_string):
         }
 
 
-def load_from_string(input_string):
-    '''Load one or more record sets from a string
-    1. Read out all record set config from the file, and
-       instantiate a new RecordSet object with that config
-    2. Add each record into the record set until all are
-       consumed
-    3. Return the resulting record set object
+def add_config_entry(record_set_config, key, value, line):
+    '''Add a single `%` entry to the config of a record set
     '''
 
-    log.debug(f'Got rec data: {input_string}')
+    if key is None:
+        raise ValueError(f'Record set config entry {line} is invalid')
+
+    if not value.strip():
+        raise ValueError(f'Record set config entry '
+                         f'{line} is incomplete')
+
+    if key not in ALLOWED_CONFIG_KEYS:
+        raise ValueError(f'unknown config key {key} specified')
+
+    if key == 'rec':
+        # Check that the record set name is not already defined
+        if record_set_config.get('rec'):
+            raise ValueError('Record set name cannot be '
+                             'defined more than once')
+        split_value = value.strip().split(' ')
+        if len(split_value) == 1:
+            record_set_name = split_value[0]
+            record_set_config[key] = {'name': record_set_name}
+        elif len(split_value) == 2:
+            record_set_name = split_value[0]
+            record_set_link = split_value[1]
+            record_set_config[key] = {
+                'name': record_set_name,
+                'link': record_set_link}
+        else:
+            raise ValueError(f'Invalid Record Set name '
+                             f'definition "{line}"')
+
+    if key in FIELD_LIST_FIELDS:
+        # keep a list of fields
+        record_set_config[key] = value.strip().split(' ')
+
+    if key == 'doc':
+        # Check that the documentation is not already set
+        if record_set_config.get('doc'):
+            raise ValueError('Record set documentation cannot '
+                             'be defined more than once')
+        record_set_config[key] = value.strip()
+
+    if key == 'key':
+        # Check that the primary key is not already set
+        if record_set_config.get('key'):
+            raise ValueError('Record set primary key cannot '
+                             'be defined more than once')
+        if len(value.strip().split(' ')) > 1:
+            raise ValueError('Only a single field can be '
+                             'specified as a primary key')
+        record_set_config[key] = value.strip()
+
+    if key == 'size':
+        # Check that a size constraint is not already set
+        if record_set_config.get('size'):
+            raise ValueError('Record sets cannot have more than '
+                             'one size constraint')
+
+        split_value = value.strip().split(' ')
+        if len(split_value) == 1:
+            # Only a specific number of records is specified
+            amount = int(split_value[0])
+            record_set_config[key] = {
+                'amount': amount,
+                'condition': '=='
+            }
 
-    split_lines = input_string.split('\n')
-    record_set_config = {
-        'custom_types': {},
-        'field_types': {}
-    }
-    # Loop through all lines until we reach the end of the field config
-    config_start = False
-    for idx, line in enumerate(split_lines):
+        elif len(split_value) == 2:
+            # A condition and number of records is specified
+            condition = split_value[0]
+            if condition not in ['==', '<', '>', '<=', '>=']:
+                raise ValueError(f'Unknown condition '
+                                 f'{condition} specified')
+            limit = split_value[1]
+            if limit[:2] == '0x':
+                amount = get_hex_int(limit)
+            else:
+                try:
+                    amount = int(limit)
+                except ValueError:
+                    raise ValueError(f'cannot convert size limit '
+                                     f'{limit} to an integer')
+            record_set_config[key] = {
+                'amount': amount,
+                'condition': condition
+            }
 
-        if not line.strip():
-            # Blank Line
-            if config_start:
-                break
+        else:
+            raise ValueError(f'Invalid size condition '
+                             f'"{value}" specified')
+
+    if key == 'typedef':
+        split_value = value.split(' ')
+        custom_type_name = split_value[0]
+        type_definition_string = ' '.join(split_value[1:])
+        type_definition = process_type_definition(
+                                type_definition_string)
+        record_set_config['custom_types'][custom_type_name] = \
+            type_definition
+
+    if key == 'type':
+        '''
+        Handling for type assignments
+        Needs to work with:
+            %type: WasGood,WasBad bool
+            %type: WasGood was_good_type
+            %type: Pages range 0 MAX
+        '''
+        split_value = value.split(' ')
+        if len(split_value) < 2:
+            raise ValueError(f'Invalid type assignment: {line}')
+        elif len(split_value) >= 2:
+            # We are assigning the field to either a primitive type
+            # or a custom type
+            field_names = split_value[0].split(',')
+            type_name = split_value[1]
+            if type_name in record_set_config['custom_types'].keys():
+                # We are referencing a custom type that exists
+                type_definition = {
+                    'type': 'custom',
+                    'name': type_name
+                }
+                for field_name in field_names:
+                    record_set_config['field_types'][field_name] = \
+                        type_definition
+            elif type_name in ALL_TYPES:
+                # We are referencing a builtin type
+                type_definition_string = ' '.join(split_value[1:])
+                type_definition = process_type_definition(
+                                        type_definition_string)
+                for field_name in field_names:
+                    record_set_config['field_types'][field_name] = \
+                        type_definition
             else:
+                # We are referencing a custom type that doesn't exist
+                raise ValueError(f'Undefined type {type_name} '
+                                 f'specified for field(s) '
+                                 f'{split_value[0]}')
+
+
+def tokenize(lines):
+    '''Split lines of rec data into tokens in a single pass, where each
+    token is a tuple of `(token_type, key, value, line)` and the token
+    type is one of:
+        `blank`  - A blank line, which separates records
+        `config` - A `%` config entry
+        `field`  - A field of a record
+        `other`  - Any other line, which is not valid rec syntax
+
+    Continuation lines starting with `+` are joined onto the value of
+        the config entry or field directly above them, and comments
+        are dropped
+    `lines` can be any iterable of lines, with or without
+        trailing newlines
+    '''
+
+    # Token which may still be continued by the next line
+    pending_token = None
+    for line in lines:
+        if line.endswith('\n'):
+            line = line[:-1]
+
+        if pending_token is not None:
+            if line[:1] == '+' and len(line.strip()) > 2:
+                token_type, key, value, token_line = pending_token
+                if token_type == 'config':
+                    value = value + ' ' + line.strip()[2:]
+                else:
+                    value = value + '\n ' + line.strip()[2:]
+                pending_token = (token_type, key, value, token_line)
                 continue
+            yield pending_token
+            pending_token = None
+
+        if not line.strip():
+            yield ('blank', None, None, line)
 
-        if line[0] == '#':
-            # Comments
+        elif line[0] in ['#', '+']:
+            # Comments, and continuations with nothing to continue
             continue
 
-        if line[0] not in ['+', '%']:
-            if config_start:
-                raise ValueError(f'Invalid Syntax. Line "{line}" in field '
-                                 f'config does not start with either "%" '
-                                 f'or "+"')
+        elif line[0] == '%':
+            split_line = line.split(':', 2)
+            if len(split_line) < 2:
+                yield ('config', None, None, line)
+            else:
+                pending_token = ('config', split_line[0][1:],
+                                 split_line[1].strip(), line)
 
-        if line[0] == '+':
-            # we already got this content when
-            # processing the line above
-            continue
+        elif field_regex.match(line):
+            key, value = line.split(':', 1)
+            pending_token = ('field', key, value.lstrip(' '), line)
 
-        # TODO - switch over to using a regex
-        if line[0] == '%':
-            config_start = True
-            if len(line.split(':', 1)) < 2:
-                raise ValueError(f'Record set config entry {line} is invalid')
-            key = line.split(':', 1)[0][1:]
-            value = line.split(':', 2)[1].strip()
-            # check to see if there is more to the value on the next line
-            lookahead = 1
-            while True:
-                next_line = split_lines[idx + lookahead]
-
-                if not next_line.strip():
-                    break
-
-                if next_line[0] == '+' and len(next_line.strip()) > 2:
-                    value = value + ' ' + next_line.strip()[2:]
-                    lookahead += 1
+        else:
+            yield ('other', None, None, line)
 
-                else:
-                    break
-
-            if not value.strip():
-                raise ValueError(f'Record set config entry '
-                                 f'{line} is incomplete')
-
-            if key not in ALLOWED_CONFIG_KEYS:
-                raise ValueError(f'unknown config key {key} specified')
-
-            if key == 'rec':
-                # Check that the record set name is not already defined
-                if record_set_config.get('rec'):
-                    raise ValueError('Record set name cannot be '
-                                     'defined more than once')
-                split_value = value.strip().split(' ')
-                if len(split_value) == 1:
-                    record_set_name = split_value[0]
-                    record_set_config[key] = {'name': record_set_name}
-                elif len(split_value) == 2:
-                    record_set_name = split_value[0]
-                    record_set_link = split_value[1]
-                    record_set_config[key] = {
-                        'name': record_set_name,
-                        'link': record_set_link}
-                else:
-                    raise ValueError(f'Invalid Record Set name '
-                                     f'definition "{line}"')
-
-            if key in FIELD_LIST_FIELDS:
-                # keep a list of fields
-                record_set_config[key] = value.strip().split(' ')
-
-            if key == 'doc':
-                # Check that the documentation is not already set
-                if record_set_config.get('doc'):
-                    raise ValueError('Record set documentation cannot '
-                                     'be defined more than once')
-                record_set_config[key] = value.strip()
-
-            if key == 'key':
-                # Check that the primary key is not already set
-                if record_set_config.get('key'):
-                    raise ValueError('Record set primary key cannot '
-                                     'be defined more than once')
-                if len(value.strip().split(' ')) > 1:
-                    raise ValueError('Only a single field can be '
-                                     'specified as a primary key')
-                record_set_config[key] = value.strip()
-
-            if key == 'size':
-                # Check that a size constraint is not already set
-                if record_set_config.get('size'):
-                    raise ValueError('Record sets cannot have more than '
-                                     'one size constraint')
-
-                split_value = value.strip().split(' ')
-                if len(split_value) == 1:
-                    # Only a specific number of records is specified
-                    amount = int(split_value[0])
-                    record_set_config[key] = {
-                        'amount': amount,
-                        'condition': '=='
-                    }
-
-                elif len(split_value) == 2:
-                    # A condition and number of records is specified
-                    condition = split_value[0]
-                    if condition not in ['==', '<', '>', '<=', '>=']:
-                        raise ValueError(f'Unknown condition '
-                                         f'{condition} specified')
-                    limit = split_value[1]
-                    if limit[:2] == '0x':
-                        amount = get_hex_int(limit)
-                    else:
-                        try:
-                            amount = int(limit)
-                        except ValueError:
-                            raise ValueError(f'cannot convert size limit '
-                                             f'{limit} to an integer')
-                    record_set_config[key] = {
-                        'amount': amount,
-                        'condition': condition
-                    }
+    if pending_token is not None:
+        yield pending_token
 
-                else:
-                    raise ValueError(f'Invalid size condition '
-                                     f'"{value}" specified')
 
-            if key == 'typedef':
-                split_value = value.split(' ')
-                custom_type_name = split_value[0]
-                type_definition_string = ' '.join(split_value[1:])
-                type_definition = process_type_definition(
-                                        type_definition_string)
-                record_set_config['custom_types'][custom_type_name] = \
-                    type_definition
-
-            if key == 'type':
-                '''
-                Handling for type assignments
-                Needs to work with:
-                    %type: WasGood,WasBad bool
-                    %type: WasGood was_good_type
-                    %type: Pages range 0 MAX
-                '''
-                split_value = value.split(' ')
-                if len(split_value) < 2:
-                    raise ValueError(f'Invalid type assignment: {line}')
-                elif len(split_value) >= 2:
-                    # We are assigning the field to either a primitive type
-                    # or a custom type
-                    field_names = split_value[0].split(',')
-                    type_name = split_value[1]
-                    if type_name in record_set_config['custom_types'].keys():
-                        # We are referencing a custom type that exists
-                        type_definition = {
-                            'type': 'custom',
-                            'name': type_name
-                        }
-                        for field_name in field_names:
-                            record_set_config['field_types'][field_name] = \
-                                type_definition
-                    elif type_name in ALL_TYPES:
-                        # We are referencing a builtin type
-                        type_definition_string = ' '.join(split_value[1:])
-                        type_definition = process_type_definition(
-                                                type_definition_string)
-                        for field_name in field_names:
-                            record_set_config['field_types'][field_name] = \
-                                type_definition
-                    else:
-                        # We are referencing a custom type that doesn't exist
-                        raise ValueError(f'Undefined type {type_name} '
-                                         f'specified for field(s) '
-                                         f'{split_value[0]}')
-
-    log.debug(f'Got rec config: {json.dumps(record_set_config)}')
-
-    record_set = RecordSet(config=record_set_config)
-
-    records = []
+def parse_records(lines):
+    '''Parse a record set from lines of rec data in a single pass,
+    yielding `(item_type, item)` tuples. The first item is always the
+    `config` of the record set, followed by each `record` as soon as
+    the end of it is read
+
+    The config ends at the first blank line after it starts. Any
+        records before the config are held until the config ends
+    '''
+
+    record_set_config = {
+        'custom_types': {},
+        'field_types': {}
+    }
+    config_start = False
+    config_end = False
+    held_records = []
     current_record = {}
-    for idx, line in enumerate(split_lines):
+    for token_type, key, value, line in tokenize(lines):
+
+        if not config_end:
+            if token_type == 'config':
+                config_start = True
+                add_config_entry(record_set_config, key, value, line)
+            elif token_type == 'blank' and config_start:
+                config_end = True
+                yield ('config', record_set_config)
+                for record in held_records:
+                    yield ('record', record)
+                held_records = []
+            elif token_type != 'blank' and config_start:
+                raise ValueError(f'Invalid Syntax. Line "{line}" in field '
+                                 f'config does not start with either "%" '
+                                 f'or "+"')
 
-        if not line.strip():
-            # Empty line
-            if current_record:
-                records.append(current_record)
-                current_record = {}
+        if token_type == 'blank':
+            if not current_record:
                 continue
+            if config_end:
+                yield ('record', current_record)
             else:
-                continue
+                held_records.append(current_record)
+            current_record = {}
+
+        elif token_type == 'field':
+            current_record.setdefault(key, [])
+            current_record[key].append(value)
 
-        if re.match(r'[a-zA-Z][a-zA-Z0-9_]*: .*', line):
-            # A field value
-            split_line = line.split(':', 1)
-            key = split_line[0]
-            value = split_line[1].lstrip(' ')
+        elif token_type == 'config' and current_record:
+            # we have reached the start of a new record set
+            raise ValueError('Found the start of a new record set '
+                             'in the middle of a record')
 
-            # check to see if there is more to the value on the next line
-            lookahead = 1
-            while True:
+    if current_record:
+        held_records.append(current_record)
+    if not config_end:
+        yield ('config', record_set_config)
+    for record in held_records:
+        yield ('record', record)
 
-                if idx + lookahead >= len(split_lines):
-                    break
 
-                next_line = split_lines[idx + lookahead]
+def load_from_lines(lines, columnar=False):
+    '''Load a record set from any iterable of lines of rec data,
+    such as an open file, inserting each record as soon as it is read
+    rather than holding the whole input in memory
 
-                if not next_line.strip():
-                    break
+    `columnar` stores the records as typed columns, which is much
+        smaller for large record sets
+    '''
 
-                if next_line[0] == '+' and len(next_line.strip()) > 2:
-                    value = value + '\n ' + next_line.strip()[2:]
-                    lookahead += 1
+    record_set = None
+    record_count = 0
+    for item_type, item in parse_records(lines):
+        if item_type == 'config':
+            log.debug(f'Got rec config: {json.dumps(item)}')
+            record_set = RecordSet(config=item, columnar=columnar)
+        else:
+            record_set.insert_record(item)
+            record_count += 1
 
-                else:
-                    break
+    if record_count:
+        record_set.validate_size_constraint()
 
-            current_record.setdefault(key, [])
-            current_record[key].append(value)
+    # Serializing every record is only worth it when it will be logged
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug(f'Got Record Set JSON {record_set.get_json()}')
+        log.debug(f'Found record set fields '
+                  f'{json.dumps(record_set.get_fields())}')
 
-            if idx == len(split_lines) - 1:
-                # Last line
-                if current_record:
-                    records.append(current_record)
-                    current_record = {}
-                    continue
-                else:
-                    continue
+    return record_set
 
-            continue
 
-        if line[0] == '%':
-            # we have reached the start of a new record set
-            if current_record:
-                raise ValueError('Found the start of a new record set '
-                                 'in the middle of a record')
-            continue
+def load_from_string(input_string, columnar=False):
+    '''Load a record set from a string
+    '''
+    return load_from_lines(io.StringIO(input_string), columnar=columnar)
 
-    if records:
-        record_set.insert(records)
 
-    log.debug(f'Got Record Set JSON {record_set.get_json()}')
-    log.debug(f'Found record set fields {json.dumps(record_set.get_fields())}')
+def load_summary(lines):
+    '''Lazily load only the config of a record set from lines of
+    rec data, and count its records without validating or storing
+    them, returning:
+    {
+        "config": <record set config>,
+        "record_count": <number of records>
+    }
+    '''
 
-    return record_set
+    summary = {'config': None, 'record_count': 0}
+    for item_type, item in parse_records(lines):
+        if item_type == 'config':
+            summary['config'] = item
+        else:
+            summary['record_count'] += 1
+    return summary
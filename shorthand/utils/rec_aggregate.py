@@ -0,0 +1,205 @@
+'''
+Aggregation of the records of a record set into summary values, such as
+the total of an amount field for each category, so that only a handful
+of numbers needs to be returned instead of every record.
+
+Aggregations are written as `count`, `count(Field)`, `sum(Field)`,
+`avg(Field)`, `min(Field)`, `max(Field)`, or `p<N>(Field)` for the Nth
+percentile, such as `p90(Field)`. Every aggregation other than `count`
+only works on numeric fields.
+'''
+
+import re
+import math
+import logging
+
+from shorthand.utils.rec_select import NUMERIC_TYPES
+
+
+AGGREGATE_FUNCTIONS = ['count', 'sum', 'avg', 'min', 'max']
+
+AGGREGATION_PATTERN = r'^(?P<function>[a-z]+|p\d{1,3}(\.\d+)?)'\
+                      r'(\((?P<field>[a-zA-Z][a-zA-Z0-9_]*)\))?$'
+PERCENTILE_PATTERN = r'^p(?P<percent>\d{1,3}(\.\d+)?)$'
+
+aggregation_regex = re.compile(AGGREGATION_PATTERN)
+percentile_regex = re.compile(PERCENTILE_PATTERN)
+
+
+log = logging.getLogger(__name__)
+
+
+def parse_aggregation(aggregation, record_set):
+    '''Parse an aggregation such as `sum(Amount)` into a tuple of
+    `(function, field, percent)`, where the field is None for a count
+    of records and the percent is only set for percentiles
+    '''
+
+    match = aggregation_regex.match(aggregation.replace(' ', ''))
+    if not match:
+        raise ValueError(f'Invalid aggregation "{aggregation}"')
+    function = match.group('function')
+    field_name = match.group('field')
+
+    percent = None
+    percentile_match = percentile_regex.match(function)
+    if percentile_match:
+        percent = float(percentile_match.group('percent'))
+        if percent > 100:
+            raise ValueError(f'Invalid percentile in aggregation '
+                             f'"{aggregation}"')
+        function = 'percentile'
+    elif function not in AGGREGATE_FUNCTIONS:
+        raise ValueError(f'Unknown aggregate function {function}')
+
+    if field_name is None and function != 'count':
+        raise ValueError(f'Aggregation "{aggregation}" must specify '
+                         f'a field')
+    if field_name is not None and function != 'count':
+        type_name = record_set.get_field_type(field_name).get('type')
+        if type_name not in NUMERIC_TYPES:
+            raise ValueError(f'Cannot aggregate non-numeric field '
+                             f'{field_name} with {function}')
+
+    return function, field_name, percent
+
+
+def get_aggregation_name(function, field_name, percent):
+    '''Get the name an aggregation is returned under
+    '''
+    if function == 'percentile':
+        function = f'p{percent:g}'
+    if field_name is None:
+        return function
+    return f'{function}({field_name})'
+
+
+def get_percentile(sorted_values, percent):
+    '''Get a percentile of sorted values, interpolating linearly between
+    the two values on either side of it
+    '''
+
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * percent / 100
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    lower_value = sorted_values[lower]
+    return lower_value + (sorted_values[upper] - lower_value) * \
+        (position - lower)
+
+
+def get_aggregate(function, values, percent=None):
+    '''Aggregate the values of a numeric field
+    '''
+
+    if function == 'count':
+        return len(values)
+    if function == 'sum':
+        return sum(values)
+    if not len(values):
+        return None
+    if function == 'avg':
+        return sum(values) / len(values)
+    if function == 'min':
+        return min(values)
+    if function == 'max':
+        return max(values)
+    return get_percentile(sorted(values), percent)
+
+
+def aggregate_records(record_set, aggregations, group_by=None, keys=None):
+    '''Aggregate the records of a record set, optionally grouped by the
+    values of one or more fields, returning one row for each group of
+    the form:
+    {
+        "<group by field>": <value of the field for the group>,
+        "count": <number of records in the group>,
+        "sum(Amount)": <total of the values of Amount in the group>,
+        ...
+    }
+
+    Records are grouped by the first value of each group by field, and
+        groups are returned in the order they are first seen. Without
+        any group by fields there is always a single group
+    `keys` only aggregates the records with those keys
+    '''
+
+    parsed_aggregations = []
+    for aggregation in aggregations:
+        parsed_aggregations.append(parse_aggregation(aggregation,
+                                                     record_set))
+    group_by = group_by or []
+
+    # Group each record by its key
+    groups = []
+    group_ids = {}
+    key_groups = {}
+    selected_keys = None if keys is None else set(keys)
+    if group_by:
+        group_fields = [record_set.iter_field_values(field_name)
+                        for field_name in group_by]
+        for field_values in zip(*group_fields):
+            key = field_values[0][0]
+            if selected_keys is not None and key not in selected_keys:
+                continue
+            group = tuple(values[0] if values else None
+                          for _, values in field_values)
+            if group not in group_ids:
+                group_ids[group] = len(groups)
+                groups.append(group)
+            key_groups[key] = group_ids[group]
+    else:
+        groups.append(())
+        if keys is None:
+            keys = record_set.records.keys()
+        for key in keys:
+            key_groups[key] = 0
+
+    record_counts = [0] * len(groups)
+    for group_id in key_groups.values():
+        record_counts[group_id] += 1
+
+    # Gather the values of each aggregated field by group
+    field_names = set(field_name for _, field_name, _
+                      in parsed_aggregations if field_name is not None)
+    group_values = {}
+    for field_name in field_names:
+        all_values = None
+        if len(groups) == 1 and len(key_groups) == len(record_set.records):
+            # A single group of every record can use a column directly
+            all_values = record_set.get_column_values(field_name)
+        if all_values is not None:
+            group_values[field_name] = [all_values]
+            continue
+
+        field_group_values = [[] for _ in groups]
+        for key, values in record_set.iter_field_values(field_name):
+            group_id = key_groups.get(key)
+            if group_id is not None and values:
+                field_group_values[group_id].extend(values)
+        group_values[field_name] = field_group_values
+
+    rows = []
+    for group_id, group in enumerate(groups):
+        row = dict(zip(group_by, group))
+        sorted_values = {}
+        for function, field_name, percent in parsed_aggregations:
+            name = get_aggregation_name(function, field_name, percent)
+            if field_name is None:
+                row[name] = record_counts[group_id]
+                continue
+            values = group_values[field_name][group_id]
+            if function == 'percentile':
+                # Values are only sorted once for all percentiles
+                if field_name not in sorted_values:
+                    sorted_values[field_name] = sorted(values)
+                row[name] = get_percentile(sorted_values[field_name],
+                                           percent)
+            else:
+                row[name] = get_aggregate(function, values, percent)
+        rows.append(row)
+
+    log.debug(f'Aggregated {len(key_groups)} records into '
+              f'{len(rows)} groups')
+    return rows
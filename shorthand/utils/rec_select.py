@@ -0,0 +1,468 @@
+'''
+Selection of records from a record set with recsel style expressions
+such as `Temp >= 40 && (Location = 'Austin, TX' || Id < 2)`, along with
+the secondary indexes on fields which answer those selections without
+looking at every record.
+
+A comparison matches a record when any value of its field satisfies
+it, and fields are compared according to their type, so numeric fields
+are compared as numbers and date fields as dates.
+'''
+
+import re
+import bisect
+import logging
+from datetime import datetime, timezone
+
+from dateutil import parser
+
+
+NUMERIC_TYPES = ['int', 'range', 'real']
+# Types with an order, which get a sorted index
+SORTED_TYPES = NUMERIC_TYPES + ['date']
+
+INDEX_TYPES = ['hash', 'sorted']
+
+COMPARISON_OPERATORS = ['=', '!=', '<', '<=', '>', '>=', '~']
+ORDERING_OPERATORS = ['<', '<=', '>', '>=']
+
+EXPRESSION_TOKEN_PATTERN = r'\s*(?:(&&|\|\||!=|<=|>=|=|<|>|~|!|\(|\))'\
+                           r'|\'((?:[^\'\\]|\\.)*)\''\
+                           r'|"((?:[^"\\]|\\.)*)"'\
+                           r'|([^\s&|!=<>~()\'"]+))'
+FIELD_NAME_PATTERN = r'^[a-zA-Z][a-zA-Z0-9_]*$'
+
+expression_token_regex = re.compile(EXPRESSION_TOKEN_PATTERN)
+field_name_regex = re.compile(FIELD_NAME_PATTERN)
+
+
+log = logging.getLogger(__name__)
+
+
+def parse_date(value):
+    '''Parse a date value into a naive UTC datetime which can be
+    compared with any other, or None if it isn't a date
+    '''
+
+    try:
+        parsed_date = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        try:
+            parsed_date = parser.parse(value)
+        except (TypeError, ValueError, OverflowError):
+            return None
+    if parsed_date.tzinfo is not None:
+        parsed_date = parsed_date.astimezone(timezone.utc).replace(
+            tzinfo=None)
+    return parsed_date
+
+
+def get_compare_value(type_name, value):
+    '''Get the form of a field value which is compared and indexed for
+    a field type, or None if the value can't be compared as that type
+    '''
+
+    if type_name in NUMERIC_TYPES:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+    if type_name == 'date':
+        return parse_date(value)
+    return str(value)
+
+
+class HashIndex(object):
+    """Keys of the records holding each value of a field, for
+    equality lookups
+    """
+
+    def __init__(self, field_name, type_name=None):
+        super(HashIndex, self).__init__()
+        self.field_name = field_name
+        self.type_name = type_name
+        # Compared value -> keys of the records with that value
+        self.keys = {}
+
+    def add(self, key, values):
+        '''Index the values of a field within a single record
+        '''
+        for value in values:
+            compare_value = get_compare_value(self.type_name, value)
+            if compare_value is None:
+                continue
+            self.keys.setdefault(compare_value, set())
+            self.keys[compare_value].add(key)
+
+    def finish(self):
+        '''Complete the index once every record is added
+        '''
+        pass
+
+    def get_keys(self, operator, value):
+        '''Get the keys of the records with a value matching a
+        comparison, or None if the index can't answer it
+        '''
+        if operator != '=':
+            return None
+        return set(self.keys.get(value, ()))
+
+
+class SortedIndex(object):
+    """Values of a field in sorted order along with the keys of the
+    records holding them, for equality and range lookups
+    """
+
+    def __init__(self, field_name, type_name=None):
+        super(SortedIndex, self).__init__()
+        self.field_name = field_name
+        self.type_name = type_name
+        self.entries = []
+        self.values = []
+        self.keys = []
+
+    def add(self, key, values):
+        '''Index the values of a field within a single record
+        '''
+        for value in values:
+            compare_value = get_compare_value(self.type_name, value)
+            if compare_value is None:
+                continue
+            self.entries.append((compare_value, len(self.entries), key))
+
+    def finish(self):
+        '''Sort the values once every record is added
+        '''
+        self.entries.sort()
+        self.values = [entry[0] for entry in self.entries]
+        self.keys = [entry[2] for entry in self.entries]
+        self.entries = []
+
+    def get_keys(self, operator, value):
+        '''Get the keys of the records with a value matching a
+        comparison, or None if the index can't answer it
+        '''
+
+        if operator == '=':
+            start = bisect.bisect_left(self.values, value)
+            end = bisect.bisect_right(self.values, value)
+        elif operator == '<':
+            start, end = 0, bisect.bisect_left(self.values, value)
+        elif operator == '<=':
+            start, end = 0, bisect.bisect_right(self.values, value)
+        elif operator == '>':
+            start = bisect.bisect_right(self.values, value)
+            end = len(self.values)
+        elif operator == '>=':
+            start = bisect.bisect_left(self.values, value)
+            end = len(self.values)
+        else:
+            return None
+        return set(self.keys[start:end])
+
+
+class Comparison(object):
+    """Comparison of the values of a field to a single value"""
+
+    def __init__(self, field_name, operator, value):
+        super(Comparison, self).__init__()
+        self.field_name = field_name
+        self.operator = operator
+        self.value = value
+        self.compare_type = None
+        self.compare_value = None
+
+    def prepare(self, record_set):
+        '''Work out how the field is compared for a record set
+        '''
+
+        type_name = record_set.get_field_type(self.field_name).get('type')
+        if self.operator == '~':
+            self.compare_type = None
+            try:
+                self.compare_value = re.compile(self.value)
+            except re.error:
+                raise ValueError(f'Invalid pattern "{self.value}" for '
+                                 f'field {self.field_name}')
+            return
+
+        if type_name in SORTED_TYPES:
+            self.compare_type = type_name
+        elif self.operator in ORDERING_OPERATORS and \
+                get_compare_value('real', self.value) is not None:
+            # Untyped fields are ordered as numbers when compared
+            # to a number
+            self.compare_type = 'real'
+        else:
+            self.compare_type = None
+
+        self.compare_value = get_compare_value(self.compare_type,
+                                               self.value)
+        if self.compare_value is None:
+            raise ValueError(f'Cannot compare {type_name} field '
+                             f'{self.field_name} to "{self.value}"')
+
+    def matches(self, record):
+        '''Check whether a record matches the comparison
+        '''
+
+        for value in record.get(self.field_name, []):
+            if self.operator == '~':
+                if self.compare_value.search(str(value)):
+                    return True
+                continue
+
+            compare_value = get_compare_value(self.compare_type, value)
+            if compare_value is None:
+                continue
+            if self.operator == '=' and compare_value == self.compare_value:
+                return True
+            if self.operator == '!=' and compare_value != self.compare_value:
+                return True
+            if self.operator == '<' and compare_value < self.compare_value:
+                return True
+            if self.operator == '<=' and compare_value <= self.compare_value:
+                return True
+            if self.operator == '>' and compare_value > self.compare_value:
+                return True
+            if self.operator == '>=' and compare_value >= self.compare_value:
+                return True
+        return False
+
+    def get_keys(self, record_set):
+        '''Get the keys of all matching records from an index, or None
+        if there is no index which can answer the comparison
+        '''
+
+        index = record_set.get_index(self.field_name)
+        if index is None or index.type_name != self.compare_type:
+            return None
+        return index.get_keys(self.operator, self.compare_value)
+
+
+class And(object):
+    """Records which match every one of a set of conditions"""
+
+    def __init__(self, conditions):
+        super(And, self).__init__()
+        self.conditions = conditions
+
+    def prepare(self, record_set):
+        for condition in self.conditions:
+            condition.prepare(record_set)
+
+    def matches(self, record):
+        for condition in self.conditions:
+            if not condition.matches(record):
+                return False
+        return True
+
+    def get_keys(self, record_set):
+        '''Intersect the keys of the conditions which can be answered by
+        an index, then check the rest of the conditions only against
+        those records
+        '''
+
+        keys = None
+        unindexed_conditions = []
+        for condition in self.conditions:
+            condition_keys = condition.get_keys(record_set)
+            if condition_keys is None:
+                unindexed_conditions.append(condition)
+            elif keys is None:
+                keys = condition_keys
+            else:
+                keys &= condition_keys
+
+        if keys is None or not unindexed_conditions:
+            return keys
+        matching_keys = set()
+        for key in keys:
+            record = record_set.records[key]
+            if all(condition.matches(record)
+                   for condition in unindexed_conditions):
+                matching_keys.add(key)
+        return matching_keys
+
+
+class Or(object):
+    """Records which match any one of a set of conditions"""
+
+    def __init__(self, conditions):
+        super(Or, self).__init__()
+        self.conditions = conditions
+
+    def prepare(self, record_set):
+        for condition in self.conditions:
+            condition.prepare(record_set)
+
+    def matches(self, record):
+        for condition in self.conditions:
+            if condition.matches(record):
+                return True
+        return False
+
+    def get_keys(self, record_set):
+        '''Union the keys of the conditions, as long as every one of
+        them can be answered by an index
+        '''
+
+        keys = set()
+        for condition in self.conditions:
+            condition_keys = condition.get_keys(record_set)
+            if condition_keys is None:
+                return None
+            keys |= condition_keys
+        return keys
+
+
+class Not(object):
+    """Records which don't match a condition"""
+
+    def __init__(self, condition):
+        super(Not, self).__init__()
+        self.condition = condition
+
+    def prepare(self, record_set):
+        self.condition.prepare(record_set)
+
+    def matches(self, record):
+        return not self.condition.matches(record)
+
+    def get_keys(self, record_set):
+        keys = self.condition.get_keys(record_set)
+        if keys is None:
+            return None
+        return set(record_set.records.keys()) - keys
+
+
+def tokenize_expression(expression):
+    '''Split a selection expression into `(token_type, token)` tuples,
+    where the token type is either `operator` or `value`
+    '''
+
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = expression_token_regex.match(expression, position)
+        if not match:
+            raise ValueError(f'Invalid selection expression "{expression}" '
+                             f'at position {position}')
+        operator, single_quoted, double_quoted, word = match.groups()
+        if operator is not None:
+            tokens.append(('operator', operator))
+        elif word is not None:
+            tokens.append(('value', word))
+        else:
+            quoted = single_quoted if single_quoted is not None \
+                else double_quoted
+            tokens.append(('value', re.sub(r'\\(.)', r'\1', quoted)))
+        position = match.end()
+    return tokens
+
+
+class ExpressionParser(object):
+    """Recursive descent parser for selection expressions, where `!`
+    binds tighter than `&&`, which binds tighter than `||`
+    """
+
+    def __init__(self, expression):
+        super(ExpressionParser, self).__init__()
+        self.expression = expression
+        self.tokens = tokenize_expression(expression)
+        self.position = 0
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return (None, None)
+
+    def take(self):
+        token = self.peek()
+        if token[0] is None:
+            raise ValueError(f'Unexpected end of selection expression '
+                             f'"{self.expression}"')
+        self.position += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise ValueError('Empty selection expression')
+        condition = self.parse_or()
+        if self.peek()[0] is not None:
+            raise ValueError(f'Unexpected "{self.peek()[1]}" in selection '
+                             f'expression "{self.expression}"')
+        return condition
+
+    def parse_or(self):
+        conditions = [self.parse_and()]
+        while self.peek() == ('operator', '||'):
+            self.take()
+            conditions.append(self.parse_and())
+        if len(conditions) == 1:
+            return conditions[0]
+        return Or(conditions)
+
+    def parse_and(self):
+        conditions = [self.parse_unary()]
+        while self.peek() == ('operator', '&&'):
+            self.take()
+            conditions.append(self.parse_unary())
+        if len(conditions) == 1:
+            return conditions[0]
+        return And(conditions)
+
+    def parse_unary(self):
+        token = self.take()
+        if token == ('operator', '!'):
+            return Not(self.parse_unary())
+        if token == ('operator', '('):
+            condition = self.parse_or()
+            if self.take() != ('operator', ')'):
+                raise ValueError(f'Unclosed parenthesis in selection '
+                                 f'expression "{self.expression}"')
+            return condition
+
+        token_type, field_name = token
+        if token_type != 'value' or not field_name_regex.match(field_name):
+            raise ValueError(f'Expected a field name in selection '
+                             f'expression "{self.expression}", '
+                             f'found "{field_name}"')
+        token_type, operator = self.take()
+        if token_type != 'operator' or \
+                operator not in COMPARISON_OPERATORS:
+            raise ValueError(f'Expected a comparison after field '
+                             f'{field_name}, found "{operator}"')
+        token_type, value = self.take()
+        if token_type != 'value':
+            raise ValueError(f'Expected a value to compare field '
+                             f'{field_name} to, found "{value}"')
+        return Comparison(field_name, operator, value)
+
+
+def parse_expression(expression):
+    '''Parse a selection expression into a condition, made up of
+    comparisons such as `Field = value`, `Field != value`, `Field < 10`
+    or `Field ~ regex`, joined with `&&`, `||`, `!` and parentheses.
+    Values with spaces or operators in them must be quoted
+    '''
+    return ExpressionParser(expression).parse()
+
+
+def select_keys(record_set, expression):
+    '''Get the keys of the records in a record set which match a
+    selection expression, in the order the records were inserted
+    '''
+
+    condition = parse_expression(expression)
+    condition.prepare(record_set)
+
+    keys = condition.get_keys(record_set)
+    if keys is None:
+        log.debug(f'Scanning every record for selection "{expression}"')
+        return [key for key, record in record_set.records.items()
+                if condition.matches(record)]
+
+    positions = record_set.get_record_positions()
+    return sorted(keys, key=positions.get)
@@ -1,14 +1,21 @@
 import csv
 import re
+import sys
 import json
 import uuid
-import copy
+import logging
+from array import array
+from itertools import islice
+from collections.abc import Mapping
 from datetime import datetime
 from io import StringIO
 
 from dateutil import parser
 
 from shorthand.utils.rec_lib import get_hex_int
+from shorthand.utils.rec_select import HashIndex, SortedIndex, \
+                                       SORTED_TYPES, INDEX_TYPES, select_keys
+from shorthand.utils.rec_aggregate import aggregate_records
 
 
 UUID_PATTERN = r'^[0-9A-F]{8}-[0-9A-F]{4}-4[0-9A-F]{3}-'\
@@ -18,14 +25,197 @@ ALL_TYPES = [
     "int", "line", "date", "bool", "real", "uuid",
     "range", "enum", "size", "regexp"]
 
+BOOL_VALUES = ('0', '1', 'true', 'false', 'yes', 'no')
+
+# Dates which can be checked without dateutil
+ISO_DATE_PATTERN = r'^\d{4}-\d{2}-\d{2}([T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?$'
+
+iso_date_regex = re.compile(ISO_DATE_PATTERN)
+uuid_regex = re.compile(UUID_PATTERN)
+
+# Number of rows which are read and validated at a time when importing
+IMPORT_BATCH_SIZE = 1000
+# Most row errors which are kept in the report of an import
+DEFAULT_MAX_IMPORT_ERRORS = 100
+
+# Array typecodes which columns of numeric field types are stored with.
+# Columns of any other type hold interned strings
+COLUMN_TYPECODES = {
+    "int": "q",
+    "range": "q",
+    "real": "d"}
+
+
+log = logging.getLogger(__name__)
+
+
+def parse_int(field_value):
+    '''Convert the value of an int or range field, which may be hex
+    '''
+    if field_value[:2] == '0x' or field_value[:3] == '-0x':
+        return get_hex_int(field_value)
+    return int(field_value)
+
+
+def clean_csv_row(row, value_separator=None):
+    '''Turn a row read from CSV data into a record
+    '''
+    processed_row = {}
+    for key, value in dict(row).items():
+        if value_separator:
+            processed_row[key] = value.split(value_separator)
+        else:
+            processed_row[key] = [value]
+    return processed_row
+
+
+def clean_json_record(record):
+    '''Turn an object from JSON data into a record
+    '''
+    clean_record = {}
+    if not isinstance(record, dict):
+        raise ValueError(f'Each record added must be a JSON object. '
+                         f'Object of type {type(record)} found: '
+                         f'{record}')
+    for key, value in record.items():
+        if isinstance(value, list):
+            clean_record[key] = value
+        elif not isinstance(key, str) or not isinstance(value, str):
+            raise ValueError('All keys and values in JSON imported '
+                             'data must be provided as strings')
+        else:
+            clean_record[key] = [value]
+    return clean_record
+
+
+class Column(object):
+    """All values of a single field across the records of a columnar
+    record set, stored one after the other along with where the values
+    of each record end
+    """
+
+    def __init__(self, typecode=None, row_count=0):
+        super(Column, self).__init__()
+        self.typecode = typecode
+        if typecode:
+            self.values = array(typecode)
+        else:
+            self.values = []
+        # Index into `values` where the values of each row end
+        self.ends = array('q', [0] * row_count)
+
+    def append(self, values):
+        '''Add the values of the next row, which may be empty
+        '''
+
+        if values and self.typecode:
+            try:
+                self.values.extend(array(self.typecode, values))
+            except (OverflowError, TypeError):
+                # Values which don't fit the array are kept as objects
+                self.typecode = None
+                self.values = list(self.values)
+        if values and not self.typecode:
+            self.values.extend([
+                sys.intern(value) if isinstance(value, str) else value
+                for value in values])
+        self.ends.append(len(self.values))
+
+    def get(self, row):
+        '''Get the values of a single row
+        '''
+        start = self.ends[row - 1] if row else 0
+        return list(self.values[start:self.ends[row]])
+
+
+class ColumnarRecords(Mapping):
+    """Records of a record set keyed by primary key, which are stored
+    as one typed column per field instead of one dictionary per record
+    and are only put back together as dictionaries when read
+    """
+
+    def __init__(self, field_typecodes=None):
+        super(ColumnarRecords, self).__init__()
+        self.field_typecodes = field_typecodes or {}
+        self.columns = {}
+        # Each distinct order of fields within a record, which is kept
+        # so that records read back identically
+        self.layouts = []
+        self.layout_ids = {}
+        self.row_layouts = array('q')
+        # Primary key -> row
+        self.rows = {}
+        self.row_count = 0
+
+    def __setitem__(self, key, record):
+        layout = tuple(record.keys())
+        if layout not in self.layout_ids:
+            self.layout_ids[layout] = len(self.layouts)
+            self.layouts.append(tuple(sys.intern(field_name)
+                                      for field_name in layout))
+        for field_name in layout:
+            if field_name not in self.columns:
+                self.columns[field_name] = Column(
+                    self.field_typecodes.get(field_name), self.row_count)
+
+        for field_name, column in self.columns.items():
+            column.append(record.get(field_name))
+        self.row_layouts.append(self.layout_ids[layout])
+
+        # Replacing a record leaves its old row unused, and keeps it in
+        # the same position as a dictionary would
+        self.rows[key] = self.row_count
+        self.row_count += 1
+
+    def __getitem__(self, key):
+        row = self.rows[key]
+        return {field_name: self.columns[field_name].get(row)
+                for field_name in self.layouts[self.row_layouts[row]]}
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def iter_field(self, field_name):
+        '''Get the values of a single field for every record as
+        `(key, values)` tuples, without putting the records together
+        '''
+        column = self.columns.get(field_name)
+        if column is None:
+            for key in self.rows:
+                yield key, []
+            return
+
+        values = column.values
+        ends = column.ends
+        for key, row in self.rows.items():
+            start = ends[row - 1] if row else 0
+            yield key, values[start:ends[row]]
+
+    def get_column_values(self, field_name):
+        '''Get every value of a numeric field across all records as the
+        typed array the column is stored as, or None if the column isn't
+        typed or holds rows of replaced records
+        '''
+        column = self.columns.get(field_name)
+        if column is None or not column.typecode or \
+                len(self.rows) != self.row_count:
+            return None
+        return column.values
+
+    def __len__(self):
+        return len(self.rows)
+
 
 class RecordSet(object):
     """Record Set object which holds the field configuration
     and full record contents for one type of records in a GNU
     recfile
+
+    With `columnar` set the records are stored as typed columns,
+    which takes far less memory for large record sets
     """
 
-    def __init__(self, config):
+    def __init__(self, config, columnar=False):
         super(RecordSet, self).__init__()
         if config:
             if self.validate_config(config):
@@ -35,7 +225,246 @@ class RecordSet(object):
         else:
             self.config = {}
         self.fields = {}
-        self.records = {}
+        # Date values which are already known to be valid, since the
+        # same dates tend to repeat across records
+        self.parsed_dates = {}
+        self.compile_validators()
+        # Field name -> type of index declared with `create_index`
+        self.index_types = {}
+        # Field name -> index, which are built when first used and
+        # dropped whenever records are inserted
+        self.indexes = {}
+        self.record_positions = None
+        if columnar:
+            self.records = ColumnarRecords(self.get_field_typecodes())
+        else:
+            self.records = {}
+
+    def get_field_type(self, field_name):
+        '''Get the full type definition of a field, following any
+        custom types through to the type they are defined as
+        '''
+
+        field_type = self.config.get('field_types', {}).get(field_name, {})
+        # Custom type chains are checked to end within validate_config
+        while field_type and field_type.get('type') == 'custom':
+            field_type = self.config.get('custom_types', {}).get(
+                field_type['name'])
+        return field_type or {}
+
+    def get_field_typecodes(self):
+        '''Get the array typecodes which the columns of numeric
+        fields are stored with
+        '''
+
+        field_typecodes = {}
+        for field_name in self.config.get('field_types', {}).keys():
+            field_type = self.get_field_type(field_name)
+            typecode = COLUMN_TYPECODES.get(field_type.get('type'))
+            if typecode:
+                field_typecodes[field_name] = typecode
+        return field_typecodes
+
+    def compile_validators(self):
+        '''Compile the config into a validator for each typed field,
+        so that types are only looked up and patterns only compiled
+        once rather than for every record
+        '''
+
+        self.field_validators = {}
+        for field_name in self.config.get('field_types', {}).keys():
+            field_validator = self.get_field_validator(
+                field_name, self.get_field_type(field_name))
+            if field_validator is not None:
+                self.field_validators[field_name] = field_validator
+
+        self.auto_field_types = []
+        for auto_field in self.config.get('auto', []):
+            self.auto_field_types.append(
+                (auto_field, self.get_field_type(auto_field).get('type')))
+
+        self.allowed_field_set = set(self.config.get('allowed') or [])
+
+    def get_field_validator(self, field_name, field_type):
+        '''Get a function which validates the values of a field with the
+        specified type definition. The function returns a tuple of
+        (error_message, converted_values), where converted values are
+        None if the values are kept as they are
+        '''
+
+        type_name = field_type.get('type')
+
+        if type_name == 'int':
+            def validate_int(field_values):
+                converted_values = []
+                for field_value in field_values:
+                    try:
+                        converted_values.append(parse_int(field_value))
+                    except ValueError:
+                        error_message = f"can't convert value "\
+                                        f"\"{field_value}\" of field "\
+                                        f"\"{field_name}\" to an int"
+                        return error_message, None
+                return False, converted_values
+            return validate_int
+
+        if type_name == 'line':
+            def validate_line(field_values):
+                for field_value in field_values:
+                    if '\n' in field_value:
+                        error_message = f'value "{field_value}" of line type '\
+                                        f'field "{field_name}" contains a '\
+                                        f'newline character'
+                        return error_message, None
+                return False, None
+            return validate_line
+
+        if type_name == 'date':
+            def validate_date(field_values):
+                for field_value in field_values:
+                    if not self.is_valid_date(field_value):
+                        error_message = f'cannot parse date value '\
+                                        f'"{field_value}" of field '\
+                                        f'"{field_name}"'
+                        return error_message, None
+                return False, None
+            return validate_date
+
+        if type_name == 'bool':
+            def validate_bool(field_values):
+                for field_value in field_values:
+                    if field_value not in BOOL_VALUES:
+                        error_message = f'Value {field_value} for bool '\
+                                        f'field {field_name} is not allowed'
+                        return error_message, None
+                return False, None
+            return validate_bool
+
+        if type_name == 'real':
+            def validate_real(field_values):
+                converted_values = []
+                for field_value in field_values:
+                    try:
+                        converted_values.append(float(field_value))
+                    except ValueError:
+                        error_message = f'can\'t convert value '\
+                                        f'\"{field_value}\" of field '\
+                                        f'\"{field_name}\" to a float'
+                        return error_message, None
+                return False, converted_values
+            return validate_real
+
+        if type_name == 'range':
+            max_value = field_type.get('max')
+            min_value = field_type.get('min')
+            if not isinstance(max_value, int):
+                max_value = None
+            if not isinstance(min_value, int):
+                min_value = None
+
+            def validate_range(field_values):
+                converted_values = []
+                for field_value in field_values:
+                    try:
+                        num_value = parse_int(field_value)
+                    except ValueError:
+                        error_message = f"can't convert value "\
+                                        f"\"{field_value}\" of field "\
+                                        f"\"{field_name}\" to a float"
+                        return error_message, None
+                    if max_value is not None and num_value > max_value:
+                        error_message = f'Value {field_value} of field '\
+                                        f'{field_name} exceeds the maximum '\
+                                        f'range value {max_value}'
+                        return error_message, None
+                    if min_value is not None and num_value < min_value:
+                        error_message = f'Value {field_value} of field '\
+                                        f'{field_name} is below the minimum '\
+                                        f'range value {min_value}'
+                        return error_message, None
+                    converted_values.append(num_value)
+                return False, converted_values
+            return validate_range
+
+        if type_name == 'enum':
+            allowed_values = field_type.get('values', [])
+            allowed_value_set = set(allowed_values)
+
+            def validate_enum(field_values):
+                for field_value in field_values:
+                    try:
+                        is_allowed = field_value in allowed_value_set
+                    except TypeError:
+                        is_allowed = False
+                    if not is_allowed:
+                        error_message = f'value {field_value} of field '\
+                                        f'{field_name} is not in allowed '\
+                                        f'values {allowed_values}'
+                        return error_message, None
+                return False, None
+            return validate_enum
+
+        if type_name == 'size':
+            size_limit = field_type['limit']
+
+            def validate_size(field_values):
+                for field_value in field_values:
+                    if len(field_value) > size_limit:
+                        error_message = f'Value {field_value} of field '\
+                                        f'{field_name} is above the field\'s '\
+                                        f'size limit of {size_limit} '\
+                                        f'characters'
+                        return error_message, None
+                return False, None
+            return validate_size
+
+        if type_name == 'regexp':
+            pattern = field_type['pattern']
+            pattern_regex = re.compile(pattern)
+
+            def validate_regexp(field_values):
+                for field_value in field_values:
+                    if not pattern_regex.match(field_value):
+                        error_message = f'value "{field_value}" of field '\
+                                        f'{field_name} does not match '\
+                                        f'regex {pattern}'
+                        return error_message, None
+                return False, None
+            return validate_regexp
+
+        if type_name == 'uuid':
+            def validate_uuid(field_values):
+                for field_value in field_values:
+                    if not uuid_regex.match(field_value):
+                        error_message = f'value "{field_value}" of uuid '\
+                                        f'field {field_name} is not a '\
+                                        f'valid UUID4'
+                        return error_message, None
+                return False, None
+            return validate_uuid
+
+        return None
+
+    def is_valid_date(self, field_value):
+        '''Check whether a value can be parsed as a date. ISO dates are
+        checked directly, and anything else is handed to dateutil
+        '''
+
+        if isinstance(field_value, str) and iso_date_regex.match(field_value):
+            try:
+                datetime.fromisoformat(field_value)
+                return True
+            except ValueError:
+                pass
+
+        if isinstance(field_value, str) and \
+                field_value in self.parsed_dates:
+            return True
+        try:
+            self.parsed_dates[field_value] = parser.parse(field_value)
+        except:
+            return False
+        return True
 
     def validate_config(self, config):
         '''Validate configuration for a record set
@@ -226,7 +655,9 @@ class RecordSet(object):
         Returns a tuple of (error_message, processed_record)
         '''
 
-        processed_record = copy.deepcopy(record)
+        # The values of a field are only ever replaced rather than
+        # changed in place, so the record itself needn't be copied deeply
+        processed_record = dict(record)
 
         # Validate Primary Key
         primary_key_field = self.config.get('key')
@@ -238,172 +669,42 @@ class RecordSet(object):
                                 f'can only have a single value per record'
                 return error_message, None
 
-        # Validate types of all specified fields
+        # Validate and convert the values of each typed field
         for field_name, field_values in record.items():
-            field_type = self.config.get('field_types', {}).get(field_name, {})
-
-            # Get the full type definition if it is a custom type
-            if field_type.get('type') == 'custom':
-                field_type = self.config.get('custom_types', {}).get(
-                    field_type['name'])
-
-            # Validate int field
-            if field_type.get('type') == 'int':
-                processed_record[field_name] = []
-                for field_value in field_values:
-                    try:
-                        if field_value[:2] == '0x' or field_value[:3] == '-0x':
-                            num_value = get_hex_int(field_value)
-                        else:
-                            num_value = int(field_value)
-                        processed_record[field_name].append(num_value)
-                    except ValueError:
-                        error_message = f"can't convert value "\
-                                        f"\"{field_value}\" of field "\
-                                        f"\"{field_name}\" to an int"
-                        return error_message, None
-
-            # Validate line field
-            if field_type.get('type') == 'line':
-                for field_value in field_values:
-                    if '\n' in field_value:
-                        error_message = f'value "{field_value}" of line type '\
-                                        f'field "{field_name}" contains a '\
-                                        f'newline character'
-                        return error_message, None
-
-            # Validate date field
-            if field_type.get('type') == 'date':
-                for field_value in field_values:
-                    try:
-                        _ = parser.parse(field_value)
-                    except:
-                        error_message = f'cannot parse date value '\
-                                        f'"{field_value}" of field '\
-                                        f'"{field_name}"'
-                        return error_message, None
-
-            # Validate bool field
-            if field_type.get('type') == 'bool':
-                for field_value in field_values:
-                    if field_value not in ['0', '1', 'true',
-                                           'false', 'yes', 'no']:
-                        error_message = f'Value {field_value} for bool '\
-                                        f'field {field_name} is not allowed'
-                        return error_message, None
-
-            # Validate real field
-            if field_type.get('type') == 'real':
-                processed_record[field_name] = []
-                for field_value in field_values:
-                    try:
-                        num_value = float(field_value)
-                        processed_record[field_name].append(num_value)
-                    except ValueError:
-                        error_message = f'can\'t convert value '\
-                                        f'\"{field_value}\" of field '\
-                                        f'\"{field_name}\" to a float'
-                        return error_message, None
-
-            # Validate range field
-            if field_type.get('type') == 'range':
-                max_value = field_type.get('max')
-                min_value = field_type.get('min')
-                processed_record[field_name] = []
-                for field_value in field_values:
-                    try:
-                        if field_value[:2] == '0x' or field_value[:3] == '-0x':
-                            num_value = get_hex_int(field_value)
-                            processed_record[field_name].append(num_value)
-                        else:
-                            num_value = int(field_value)
-                            processed_record[field_name].append(num_value)
-                    except ValueError:
-                        error_message = f"can't convert value "\
-                                        f"\"{field_value}\" of field "\
-                                        f"\"{field_name}\" to a float"
-                        return error_message, None
-                    if isinstance(max_value, int) and num_value > max_value:
-                        error_message = f'Value {field_value} of field '\
-                                        f'{field_name} exceeds the maximum '\
-                                        f'range value {max_value}'
-                        return error_message, None
-                    if isinstance(min_value, int) and num_value < min_value:
-                        error_message = f'Value {field_value} of field '\
-                                        f'{field_name} is below the minimum '\
-                                        f'range value {min_value}'
-                        return error_message, None
-
-            # Validate enum field
-            if field_type.get('type') == 'enum':
-                allowed_values = field_type.get('values', [])
-                for field_value in field_values:
-                    if field_value not in allowed_values:
-                        error_message = f'value {field_value} of field '\
-                                        f'{field_name} is not in allowed '\
-                                        f'values {allowed_values}'
-                        return error_message, None
-
-            # Validate size field
-            if field_type.get('type') == 'size':
-                size_limit = field_type['limit']
-                for field_value in field_values:
-                    if len(field_value) > size_limit:
-                        error_message = f'Value {field_value} of field '\
-                                        f'{field_name} is above the field\'s '\
-                                        f'size limit of {size_limit} '\
-                                        f'characters'
-                        return error_message, None
-
-            # Validate regexp field
-            if field_type.get('type') == 'regexp':
-                pattern = field_type['pattern']
-                for field_value in field_values:
-                    if not re.match(pattern, field_value):
-                        error_message = f'value "{field_value}" of field '\
-                                        f'{field_name} does not match '\
-                                        f'regex {pattern}'
-                        return error_message, None
-
-            # Validate uuid field
-            if field_type.get('type') == 'uuid':
-                for field_value in field_values:
-                    if not re.match(UUID_PATTERN, field_value):
-                        error_message = f'value "{field_value}" of uuid '\
-                                        f'field {field_name} is not a '\
-                                        f'valid UUID4'
-                        return error_message, None
+            field_validator = self.field_validators.get(field_name)
+            if field_validator is None:
+                continue
+            error_message, converted_values = field_validator(field_values)
+            if error_message:
+                return error_message, None
+            if converted_values is not None:
+                processed_record[field_name] = converted_values
 
-            # Auto-generate field values if needed
-            for auto_field in self.config.get('auto', []):
+        # Auto-generate field values if needed
+        if record:
+            for auto_field, auto_field_type in self.auto_field_types:
 
                 # Only auto-generate a field value if one doesn't already exist
                 if not record.get(auto_field):
 
-                    auto_field_type = self.config.get('field_types', {}).get(
-                        auto_field)
-                    if auto_field_type.get('type') == 'custom':
-                        auto_field_type = self.config.get(
-                            'custom_types', {}).get(auto_field_type['name'])
-
-                    if auto_field_type.get('type') == 'date':
+                    if auto_field_type == 'date':
                         timestamp = datetime.now().strftime('%Y-%m-%d')
                         processed_record[auto_field] = [timestamp]
 
-                    elif auto_field_type.get('type') == 'int':
+                    elif auto_field_type == 'int':
                         max_field_value = max([max(r[auto_field])
                                                for r in self.records])
                         new_value = max_field_value + 1
                         processed_record[auto_field] = [new_value]
 
-                    elif auto_field_type.get('type') == 'uuid':
+                    elif auto_field_type == 'uuid':
                         new_uuid = uuid.uuid4()
                         processed_record[auto_field] = [new_uuid]
 
                     else:
                         error_message = f'Cannot auto-generate a value for '\
                                         f'field {auto_field} of type '\
-                                        f'{auto_field_type.get("type")}'
+                                        f'{auto_field_type}'
                         return error_message, None
 
         # Validate Mandatory Fields
@@ -422,7 +723,7 @@ class RecordSet(object):
         allowed_fields = self.config.get('allowed')
         if allowed_fields:
             for field_name in processed_record.keys():
-                if field_name not in allowed_fields:
+                if field_name not in self.allowed_field_set:
                     error_message = f'field {field_name} not in allowed '\
                                     f'fields {allowed_fields}'
                     return error_message, None
@@ -490,45 +791,65 @@ class RecordSet(object):
         Typically only called by internal methods
         '''
         for record in records:
-            error_message, processed_record = self.validate_record(record)
-            if not error_message:
-                primary_key_field = self.config.get('key')
-                primary_key_value = str(processed_record.get(
-                    primary_key_field, [None])[0])
-                if primary_key_field:
-                    self.records[primary_key_value] = processed_record
-                else:
-                    if len(self.records.keys()):
-                        primary_key_value = str(len(self.records.keys()) + 1)
-                    else:
-                        primary_key_value = 1
-                    self.records[primary_key_value] = processed_record
-            else:
-                raise ValueError(f'Validation Error: {error_message} '
-                                 f'in record {record}')
+            self.insert_record(record)
 
         # Check that size constraints are still met
         self.validate_size_constraint()
 
+    def insert_record(self, record):
+        '''Insert a single raw dictionary into the record set without
+        checking the size constraints of the record set, which must be
+        checked once all records are inserted
+        '''
+        error_message, processed_record = self.validate_record(record)
+        if self.indexes or self.record_positions is not None:
+            self.indexes = {}
+            self.record_positions = None
+        if not error_message:
+            primary_key_field = self.config.get('key')
+            primary_key_value = str(processed_record.get(
+                primary_key_field, [None])[0])
+            if primary_key_field:
+                self.records[primary_key_value] = processed_record
+            else:
+                if len(self.records.keys()):
+                    primary_key_value = str(len(self.records.keys()) + 1)
+                else:
+                    primary_key_value = 1
+                self.records[primary_key_value] = processed_record
+        else:
+            raise ValueError(f'Validation Error: {error_message} '
+                             f'in record {record}')
+
     def get_rec(self, include_config=False):
         '''Serialize the record set to recfile format
         '''
+        return ''.join(self.iter_rec(include_config=include_config))
+
+    def iter_rec(self, include_config=False, records=None):
+        '''Serialize the record set to recfile format one record at a time
+
+        `records` serializes only some of the records, such as those
+            from `select`
+        '''
 
         # Write config to string
         if include_config:
             raise NotImplementedError()
         # Write records to string
-        record_strings = []
-        for record in self.records.values():
-            record_string = ''
+        if records is None:
+            records = self.records.values()
+        for idx, record in enumerate(records):
+            record_lines = []
             for key, values in record.items():
                 for value in values:
                     clean_value = str(value).replace("\n", "\n+ ")
-                    record_string += f'{key}: {clean_value}\n'
-            record_string = record_string.strip()
-            record_strings.append(record_string)
-        output_string = '\n\n'.join(record_strings)
-        return output_string
+                    record_lines.append(f'{key}: {clean_value}')
+            record_string = '\n'.join(record_lines).strip()
+            if idx:
+                yield '\n\n' + record_string
+            else:
+                yield record_string
 
     def save_rec(self, file_path):
         '''Write the contents of the record set to a file in recfile format
@@ -544,18 +865,37 @@ class RecordSet(object):
     def get_csv(self, value_separator='|', include_headers=True):
         '''Serialize the record set to a string of CSV data
         '''
+        return ''.join(self.iter_csv(value_separator=value_separator,
+                                     include_headers=include_headers))
+
+    def iter_csv(self, value_separator='|', include_headers=True,
+                 records=None, fields=None):
+        '''Serialize the record set to CSV data one row at a time
+
+        `records` and `fields` serialize only some of the records and
+            fields, such as those from `select`
+        '''
+        if records is None:
+            records = self.records.values()
+        if fields is None:
+            fields = self.get_fields()
         csv_string = StringIO()
-        writer = csv.DictWriter(csv_string, fieldnames=self.get_fields())
+        writer = csv.DictWriter(csv_string, fieldnames=fields)
         if include_headers:
             writer.writeheader()
-        for record in self.records.values():
+        for record in records:
             processed_record = {}
             for key, values in record.items():
                 processed_record[key] = value_separator.join(
                     [str(value)
                      for value in values])
             writer.writerow(processed_record)
-        return csv_string.getvalue()
+            yield csv_string.getvalue()
+            csv_string.seek(0)
+            csv_string.truncate(0)
+        # The headers of a record set without any records
+        if csv_string.tell():
+            yield csv_string.getvalue()
 
     def insert_csv(self, csv_data, delimiter=',', value_separator=None):
         '''Import CSV data to update the record set
@@ -565,19 +905,113 @@ class RecordSet(object):
         reader = csv.DictReader(f, delimiter=delimiter)
         all_rows = []
         for row in reader:
-            processed_row = {}
-            for key, value in dict(row).items():
-                if value_separator:
-                    processed_row[key] = value.split(value_separator)
-                else:
-                    processed_row[key] = [value]
-            all_rows.append(processed_row)
+            all_rows.append(clean_csv_row(row, value_separator))
         self.insert(all_rows)
 
+    def import_csv(self, csv_file, delimiter=',', value_separator=None,
+                   max_errors=DEFAULT_MAX_IMPORT_ERRORS):
+        '''Stream CSV data into the record set from an open file or any
+        other iterable of lines, as described by `import_rows`
+        '''
+
+        reader = csv.DictReader(csv_file, delimiter=delimiter)
+        rows = enumerate(reader, start=1)
+        return self.import_rows(
+            rows, lambda row: clean_csv_row(row, value_separator),
+            max_errors)
+
+    def import_json_lines(self, json_lines_file,
+                          max_errors=DEFAULT_MAX_IMPORT_ERRORS):
+        '''Stream JSON lines data, with one JSON object per line, into
+        the record set from an open file or any other iterable of lines,
+        as described by `import_rows`. Blank lines are skipped
+        '''
+
+        rows = ((row_number, line)
+                for row_number, line in enumerate(json_lines_file, start=1)
+                if line.strip())
+        return self.import_rows(
+            rows, lambda line: clean_json_record(json.loads(line)),
+            max_errors)
+
+    def import_rows(self, rows, parse_row,
+                    max_errors=DEFAULT_MAX_IMPORT_ERRORS):
+        '''Insert rows into the record set, reading and validating them
+        in batches so that only one batch is held in memory at a time.
+        Rows which can't be parsed or fail validation are skipped rather
+        than stopping the import. Returns a report of the form:
+        {
+            "inserted": 99998,
+            "failed": 2,
+            "errors": [
+                {"row": 12, "message": "Validation Error: ..."},
+                ...
+            ]
+        }
+
+        `rows` is an iterable of (row number, raw row) tuples, and
+            `parse_row` turns a raw row into a record to insert
+        `max_errors` is the most errors which are kept in the report,
+            although every failed row is counted. An error with no row
+            number is for the size constraint of the record set
+        '''
+
+        report = {'inserted': 0, 'failed': 0, 'errors': []}
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, IMPORT_BATCH_SIZE))
+            if not batch:
+                break
+            for row_number, raw_row in batch:
+                try:
+                    self.insert_record(parse_row(raw_row))
+                    report['inserted'] += 1
+                except ValueError as e:
+                    report['failed'] += 1
+                    if len(report['errors']) < max_errors:
+                        report['errors'].append({'row': row_number,
+                                                 'message': str(e)})
+
+        try:
+            self.validate_size_constraint()
+        except ValueError as e:
+            report['errors'].append({'row': None, 'message': str(e)})
+
+        log.info(f'Imported {report["inserted"]} records with '
+                 f'{report["failed"]} failures')
+        return report
+
     def get_json(self):
         '''serialize the record set to a JSON string
         '''
-        return json.dumps(list(self.records.values()))
+        return ''.join(self.iter_json())
+
+    def iter_json(self, records=None):
+        '''Serialize the record set to a JSON array one record at a time
+        '''
+        if records is None:
+            records = self.records.values()
+        yield '['
+        for idx, record in enumerate(records):
+            if idx:
+                yield ', ' + json.dumps(record)
+            else:
+                yield json.dumps(record)
+        yield ']'
+
+    def get_json_lines(self):
+        '''Serialize the record set to JSON lines, with one JSON object
+        for each record on its own line
+        '''
+        return ''.join(self.iter_json_lines())
+
+    def iter_json_lines(self, records=None):
+        '''Serialize the record set to JSON lines one record at a time
+        '''
+        if records is None:
+            records = self.records.values()
+        for record in records:
+            yield json.dumps(record) + '\n'
 
     def insert_json(self, json_data):
         '''Import JSON data to update the record set
@@ -589,20 +1023,7 @@ class RecordSet(object):
                              f'not as {type(records)}')
         clean_records = []
         for record in records:
-            clean_record = {}
-            if not isinstance(record, dict):
-                raise ValueError(f'Each record added must be a JSON object. '
-                                 f'Object of type {type(record)} found: '
-                                 f'{record}')
-            for key, value in record.items():
-                if isinstance(value, list):
-                    clean_record[key] = value
-                elif not isinstance(key, str) or not isinstance(value, str):
-                    raise ValueError('All keys and values in JSON imported '
-                                     'data must be provided as strings')
-                else:
-                    clean_record[key] = [value]
-            clean_records.append(clean_record)
+            clean_records.append(clean_json_record(record))
 
         self.insert(clean_records)
 
@@ -625,3 +1046,123 @@ class RecordSet(object):
         '''Get all records in the record set as a list of dictionaries
         '''
         return self.records.values()
+
+    def create_index(self, field_name, index_type='hash'):
+        '''Declare a `hash` index on a field for equality lookups, or a
+        `sorted` index for equality and range lookups, which takes the
+        place of any automatic index on that field
+        '''
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f'Unknown index type {index_type}')
+        self.index_types[field_name] = index_type
+        self.indexes.pop(field_name, None)
+
+    def get_index_type(self, field_name):
+        '''Get the type of index used for a field. Primary key and unique
+        fields get a hash index, and numeric and date fields get a
+        sorted index, unless a different index is declared
+        '''
+        if field_name in self.index_types:
+            return self.index_types[field_name]
+        if field_name == self.config.get('key') or \
+                field_name in self.config.get('unique', []):
+            return 'hash'
+        if self.get_field_type(field_name).get('type') in SORTED_TYPES:
+            return 'sorted'
+        return None
+
+    def get_index(self, field_name):
+        '''Get the index of a field, building it if it isn't built yet,
+        or None if the field isn't indexed
+        '''
+
+        if field_name in self.indexes:
+            return self.indexes[field_name]
+
+        index_type = self.get_index_type(field_name)
+        if index_type is None:
+            return None
+        type_name = self.get_field_type(field_name).get('type')
+        if type_name not in SORTED_TYPES:
+            type_name = None
+        if index_type == 'hash':
+            index = HashIndex(field_name, type_name)
+        else:
+            index = SortedIndex(field_name, type_name)
+
+        for key, values in self.iter_field_values(field_name):
+            index.add(key, values)
+        index.finish()
+
+        log.debug(f'Built {index_type} index on field {field_name}')
+        self.indexes[field_name] = index
+        return index
+
+    def iter_field_values(self, field_name):
+        '''Get the values of a single field for every record as
+        `(key, values)` tuples
+        '''
+        if isinstance(self.records, ColumnarRecords):
+            return self.records.iter_field(field_name)
+        return ((key, record.get(field_name, []))
+                for key, record in self.records.items())
+
+    def get_column_values(self, field_name):
+        '''Get every value of a numeric field across all records as a
+        typed array when the records are columnar, or None otherwise
+        '''
+        if isinstance(self.records, ColumnarRecords):
+            return self.records.get_column_values(field_name)
+        return None
+
+    def get_record_positions(self):
+        '''Get the position of each record in insertion order by key
+        '''
+        if self.record_positions is None:
+            self.record_positions = {key: position for position, key
+                                     in enumerate(self.records.keys())}
+        return self.record_positions
+
+    def select(self, expression=None, fields=None):
+        '''Get the records matching a recsel style selection expression,
+        such as `Temp >= 40 && Location = 'Austin, TX'`, in the order
+        they were inserted. Indexed fields are looked up in their index
+        instead of checking every record
+
+        `fields` projects each record down to only those fields.
+            The expression is checked right away, and the records are
+            returned as a generator
+        '''
+
+        if expression:
+            keys = select_keys(self, expression)
+        else:
+            keys = self.records.keys()
+        return self.iter_records(keys, fields)
+
+    def aggregate(self, aggregations, group_by=None, expression=None):
+        '''Aggregate the records into summary values, such as
+        `['count', 'sum(Amount)', 'p90(Amount)']`, optionally grouped by
+        the values of one or more fields, as described by
+        `aggregate_records`
+
+        `expression` only aggregates the records matching a selection
+            expression, as used by `select`
+        '''
+        keys = None
+        if expression:
+            keys = select_keys(self, expression)
+        return aggregate_records(self, aggregations, group_by=group_by,
+                                 keys=keys)
+
+    def iter_records(self, keys, fields=None):
+        '''Get the records with a list of keys, optionally projected
+        down to only some fields
+        '''
+        for key in keys:
+            record = self.records[key]
+            if fields is None:
+                yield record
+            else:
+                yield {field_name: record[field_name]
+                       for field_name in fields if field_name in record}
@@ -5,7 +5,7 @@ import codecs
 
 from shorthand.todo_tools import parse_todo
 from shorthand.tag_tools import extract_tags
-from shorthand.utils.rec import load_from_string
+from shorthand.utils.rec import load_from_lines
 from shorthand.utils.patterns import DEFINITION_PATTERN, \
                                      INTERNAL_LINK_PATTERN, GPS_PATTERN
 
@@ -80,7 +80,7 @@ def get_rendered_markdown(markdown_content):
                 continue
             elif is_rec_data_block:
                 is_rec_data_block = False
-                record_set = load_from_string('\n'.join(rec_data_lines))
+                record_set = load_from_lines(rec_data_lines)
                 record_set_data = json.dumps(list(record_set.all()))
                 column_config = [{'title': field,
                                   'data': field,
@@ -0,0 +1,289 @@
+'''
+Single-pass scanner which reads each notes file once and extracts
+every type of element that the shorthand tools know about.
+
+The result of a scan is a dictionary of element lists keyed by
+element type, which can be handed to any of the `get_*` tools
+via their `elements` argument instead of having each tool run
+its own search over the full notes directory.
+
+Scanning needs no external grep. Larger notes directories are split
+into batches of files which are scanned across a pool of processes.
+'''
+
+import re
+import logging
+
+from shorthand.todo_tools import parse_todo
+from shorthand.tag_tools import extract_tags
+from shorthand.rec_tools import get_record_set_summary
+from shorthand.utils.paths import get_relative_path
+from shorthand.utils.parallel import PARALLEL_SCAN_MIN_FILES, \
+    get_worker_count, get_file_batches, get_scan_pool
+from shorthand.utils.files import get_notes_files, open_note_buffer, \
+    iter_buffer_lines
+from shorthand.utils.patterns import INCOMPLETE_PREFIX_GREP, \
+    COMPLETE_PREFIX_GREP, SKIPPED_PREFIX_GREP, ALL_QUESTIONS, \
+    ANSWER_PATTERN, START_STAMP_ONLY_PATTERN, TAG_PATTERN, \
+    DEFINITION_PATTERN, GPS_PATTERN, DATED_HEADING_PATTERN, \
+    RECORD_SET_PATTERN
+
+
+ELEMENT_TYPES = ['todos', 'questions', 'tags', 'definitions',
+                 'locations', 'headings', 'record_sets']
+
+TODO_REGEXES = [
+    ('incomplete', re.compile(INCOMPLETE_PREFIX_GREP)),
+    ('complete', re.compile(COMPLETE_PREFIX_GREP)),
+    ('skipped', re.compile(SKIPPED_PREFIX_GREP))
+]
+question_regex = re.compile(ALL_QUESTIONS)
+answer_regex = re.compile(ANSWER_PATTERN)
+timestamp_regex = re.compile(START_STAMP_ONLY_PATTERN)
+tag_regex = re.compile(TAG_PATTERN)
+definition_regex = re.compile(DEFINITION_PATTERN)
+gps_regex = re.compile(GPS_PATTERN)
+dated_heading_regex = re.compile(DATED_HEADING_PATTERN)
+record_set_regex = re.compile(RECORD_SET_PATTERN)
+
+# Literals which a line must contain for each type of element to
+# be found on it. Headings and record sets must start with theirs
+TODO_LITERAL = b'['
+QUESTION_LITERAL = b'? '
+ANSWER_LITERAL = b'@ '
+TAG_LITERAL = b' :'
+DEFINITION_LITERAL = b'{'
+GPS_LITERAL = b'GPS['
+HEADING_LITERAL = b'#'
+RECORD_SET_LITERAL = b'```rec-data'
+ELEMENT_LITERALS = [TODO_LITERAL, QUESTION_LITERAL, TAG_LITERAL,
+                    DEFINITION_LITERAL, GPS_LITERAL, HEADING_LITERAL,
+                    RECORD_SET_LITERAL]
+
+
+log = logging.getLogger(__name__)
+
+
+def get_empty_elements():
+    '''Get an empty set of scan results
+    '''
+    return {element_type: [] for element_type in ELEMENT_TYPES}
+
+
+def decode_line(line):
+    '''Decode a single line of a notes file
+    '''
+    return line.decode('utf-8', errors='replace')
+
+
+def scan_content(file_path, content):
+    '''Extract all elements from the raw content of a single file,
+    which may be either bytes or a memory-mapped buffer. Lines are
+    taken from the buffer one at a time rather than split up front
+
+    Every type of element contains a literal which is checked for in
+    the raw bytes first, so that lines of plain prose are skipped
+    without being decoded or matched against any regex
+
+    `file_path` is the relative path of the file within the
+        notes directory, and is attached to every element found
+    '''
+
+    elements = get_empty_elements()
+
+    for literal in ELEMENT_LITERALS:
+        if content.find(literal) != -1:
+            break
+    else:
+        return elements
+
+    for idx, (offset, raw_line) in enumerate(iter_buffer_lines(content)):
+
+        has_todo = TODO_LITERAL in raw_line
+        has_question = QUESTION_LITERAL in raw_line
+        has_tag = TAG_LITERAL in raw_line
+        has_definition = DEFINITION_LITERAL in raw_line
+        has_location = GPS_LITERAL in raw_line
+        has_heading = raw_line.startswith(HEADING_LITERAL)
+        has_record_set = raw_line.startswith(RECORD_SET_LITERAL)
+        if not (has_todo or has_question or has_tag or has_definition or
+                has_location or has_heading or has_record_set):
+            continue
+
+        line = decode_line(raw_line)
+        line_number = str(idx + 1)
+
+        # Todos
+        if has_todo:
+            for todo_status, todo_regex in TODO_REGEXES:
+                if not todo_regex.match(line):
+                    continue
+                parsed_todo = parse_todo(line.strip())
+                elements['todos'].append({
+                    'file_path': file_path,
+                    'line_number': line_number,
+                    'todo_text': parsed_todo['todo_text'],
+                    'start_date': parsed_todo['start_date'],
+                    'end_date': parsed_todo['end_date'],
+                    'status': todo_status,
+                    'tags': parsed_todo['tags'],
+                    'line': line
+                })
+                break
+
+        # Questions and the answers on the line directly following them
+        if has_question and question_regex.match(line):
+            question_text = line.strip()[2:]
+            question_date_match = timestamp_regex.match(question_text)
+            if question_date_match:
+                question_date = question_date_match.groups()[1]
+                question_text = question_date_match.groups()[4]
+            else:
+                question_date = None
+
+            tags, clean_text = extract_tags(question_text)
+            if tags:
+                question_text = clean_text
+
+            answer_text = None
+            answer_date = None
+            next_offset = offset + len(raw_line) + 1
+            if next_offset <= len(content):
+                _, next_line = next(iter_buffer_lines(content, next_offset))
+            else:
+                next_line = b''
+            if ANSWER_LITERAL in next_line:
+                answer_match = answer_regex.match(decode_line(next_line))
+                if answer_match:
+                    answer_text = answer_match.groups()[2]
+                    answer_date_match = timestamp_regex.match(answer_text)
+                    if answer_date_match:
+                        answer_date = answer_date_match.groups()[1]
+                        answer_text = answer_date_match.groups()[4]
+
+            elements['questions'].append({
+                'file_path': file_path,
+                'line_number': line_number,
+                'question': question_text,
+                'question_date': question_date,
+                'answer': answer_text,
+                'answer_date': answer_date,
+                'tags': tags
+            })
+
+        # Tags
+        if has_tag:
+            for raw_tag in tag_regex.findall(line):
+                elements['tags'].append({
+                    'file_path': file_path,
+                    'line_number': line_number,
+                    'tag': raw_tag[0].strip().strip(':')
+                })
+
+        # Definitions
+        definition_match = has_definition and definition_regex.match(line)
+        if definition_match:
+            term = definition_match.group(2).strip().strip(r'{}')
+            elements['definitions'].append({
+                'file_path': file_path,
+                'line_number': line_number,
+                'term': term,
+                'definition': definition_match.group(3)
+            })
+
+        # GPS Locations
+        if has_location:
+            for location_match in gps_regex.findall(line):
+                elements['locations'].append({
+                    'latitude': location_match[1],
+                    'longitude': location_match[3],
+                    'name': location_match[5],
+                    'file_path': file_path,
+                    'line_number': line_number
+                })
+
+        # Headings which end in a date stamp
+        heading_match = has_heading and dated_heading_regex.match(line)
+        if heading_match:
+            elements['headings'].append({
+                'file_path': file_path,
+                'line_number': line_number,
+                'event': heading_match.group(3).strip(),
+                'date': heading_match.group(4).strip(),
+                'element_id': line.split(' ', 1)[1].replace(' ', '-')
+            })
+
+        # Record sets, along with where they start and end
+        if has_record_set and record_set_regex.match(line):
+            record_set = {
+                'file_path': file_path,
+                'line_number': line_number
+            }
+            record_set.update(get_record_set_summary(content, offset))
+            elements['record_sets'].append(record_set)
+
+    return elements
+
+
+def scan_file(notes_directory, full_path):
+    '''Read a single notes file and extract all elements from it
+    '''
+
+    file_path = get_relative_path(notes_directory, full_path)
+    with open_note_buffer(full_path) as note_buffer:
+        return scan_content(file_path, note_buffer)
+
+
+def scan_files(notes_directory, full_paths):
+    '''Scan a batch of notes files and return all elements found
+    grouped by element type
+    '''
+
+    elements = get_empty_elements()
+    for full_path in full_paths:
+        try:
+            file_elements = scan_file(notes_directory, full_path)
+        except FileNotFoundError:
+            # Removed since the directory was listed
+            continue
+        for element_type in ELEMENT_TYPES:
+            elements[element_type].extend(file_elements[element_type])
+
+    return elements
+
+
+def scan_notes(notes_directory, directory_filter=None, workers=None):
+    '''Scan all notes within a directory in a single pass, reading
+    each file only once, and return all elements found grouped
+    by element type
+
+    `workers` is the number of processes to scan with, which defaults
+        to the number of cores. Small scans always run in-process
+    '''
+
+    search_directory = notes_directory
+    if directory_filter:
+        if search_directory[-1] != '/':
+            search_directory += '/'
+        search_directory += directory_filter
+
+    notes_files = get_notes_files(search_directory)
+
+    workers = get_worker_count(workers)
+    if workers < 2 or len(notes_files) < PARALLEL_SCAN_MIN_FILES:
+        log.debug(f'Scanning {len(notes_files)} notes files '
+                  f'in {search_directory}')
+        return scan_files(notes_directory, notes_files)
+
+    batches = get_file_batches(notes_files, workers)
+    log.debug(f'Scanning {len(notes_files)} notes files in '
+              f'{search_directory} with {workers} processes')
+
+    # Results come back in the same order as the batches
+    elements = get_empty_elements()
+    for batch_elements in get_scan_pool(workers).map(
+            scan_files, [notes_directory] * len(batches), batches):
+        for element_type in ELEMENT_TYPES:
+            elements[element_type].extend(batch_elements[element_type])
+
+    return elements
@@ -0,0 +1,457 @@
+'''
+In-process positional inverted index over the lines of all notes,
+used to answer full-text search queries without scanning the
+notes directory.
+
+Every word token is mapped to the files, lines, and positions within
+those lines where it occurs. Queries support:
+    - Plain terms, which must all occur within a matching line
+    - Quoted phrases, which must occur as consecutive tokens
+    - `NEAR/k` between two terms or phrases, which requires the
+      two to occur within `k` tokens of each other in the line
+Terms match whole word tokens rather than arbitrary substrings.
+
+Matching lines can optionally be ranked with BM25, treating each line
+as a document. Corpus statistics are updated as files are added to
+and removed from the index, so ranking never needs a full pass over
+the notes. The score of the file containing a line is used to break
+ties between equally scored lines.
+'''
+
+import re
+import math
+import heapq
+import shlex
+import logging
+import threading
+
+from shorthand.utils.files import get_file_stats, read_note_lines
+from shorthand.utils.paths import get_relative_path, get_full_path
+
+
+TOKEN_REGEX = re.compile(r'\w+')
+NEAR_REGEX = re.compile(r'^NEAR(/(\d+))?$')
+DEFAULT_NEAR_DISTANCE = 5
+
+# BM25 tuning parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+log = logging.getLogger(__name__)
+
+
+def tokenize(text):
+    '''Split text into a list of word tokens
+    '''
+    return TOKEN_REGEX.findall(text)
+
+
+def parse_query(query_string):
+    '''Parse a search query into a list of clauses which must
+    all match a line for the line to be returned
+
+    Clauses are one of:
+        {'type': 'phrase', 'tokens': [...]}
+        {'type': 'near', 'operands': [[...], [...]], 'distance': k}
+    where a single term is a phrase with one token
+    '''
+
+    components = shlex.split(query_string)
+
+    operands = []
+    for component in components:
+        near_match = NEAR_REGEX.match(component)
+        if near_match:
+            distance = near_match.group(2)
+            if distance is None:
+                distance = DEFAULT_NEAR_DISTANCE
+            operands.append({'type': 'near', 'distance': int(distance)})
+            continue
+        tokens = tokenize(component)
+        if tokens:
+            operands.append({'type': 'phrase', 'tokens': tokens})
+
+    clauses = []
+    for idx, operand in enumerate(operands):
+        if operand['type'] != 'near':
+            continue
+        if idx == 0 or idx == len(operands) - 1 or \
+                operands[idx - 1]['type'] != 'phrase' or \
+                operands[idx + 1]['type'] != 'phrase':
+            raise ValueError('NEAR must be placed between two search terms')
+        clauses.append({
+            'type': 'near',
+            'operands': [operands[idx - 1]['tokens'],
+                         operands[idx + 1]['tokens']],
+            'distance': operand['distance']
+        })
+
+    # Terms which are operands of a NEAR are already covered by it
+    near_operand_indexes = set()
+    for idx, operand in enumerate(operands):
+        if operand['type'] == 'near':
+            near_operand_indexes.update([idx - 1, idx + 1])
+    for idx, operand in enumerate(operands):
+        if operand['type'] == 'phrase' and idx not in near_operand_indexes:
+            clauses.append(operand)
+
+    return clauses
+
+
+class LineIndex(object):
+    """Base for in-memory indexes over the lines of every notes file,
+    which handles keeping the index in sync with the notes directory.
+    Subclasses implement `add_file` and `remove_file`
+    """
+
+    def __init__(self, notes_directory):
+        super(LineIndex, self).__init__()
+        self.notes_directory = notes_directory.rstrip('/')
+        self.lock = threading.RLock()
+        # Modification time and size of each indexed file
+        self.file_stats = {}
+        # Raw lines of each indexed file
+        self.file_lines = {}
+
+    def refresh(self, paths=None):
+        '''Bring the index up to date by re-indexing only the files
+        whose modification time or size has changed, and dropping
+        files which no longer exist
+
+        If `paths` is specified then only those files are checked
+
+        Returns a tuple of (updated_paths, removed_paths)
+        '''
+
+        with self.lock:
+            file_stats = get_file_stats(self.notes_directory, paths)
+
+            if paths is None:
+                checked_paths = list(self.file_stats.keys())
+            else:
+                checked_paths = [path for path in file_stats.keys()
+                                 if path in self.file_stats]
+                checked_paths.extend([
+                    get_relative_path(self.notes_directory, path)
+                    for path in paths])
+
+            updated_paths = [file_path
+                             for file_path, stats in file_stats.items()
+                             if self.file_stats.get(file_path) != stats]
+            removed_paths = [file_path
+                             for file_path in set(checked_paths)
+                             if file_path in self.file_stats and
+                             file_path not in file_stats]
+
+            for file_path in removed_paths:
+                self.remove_file(file_path)
+
+            for file_path in updated_paths:
+                full_path = get_full_path(self.notes_directory, file_path)
+                try:
+                    lines = read_note_lines(full_path)
+                except FileNotFoundError:
+                    self.remove_file(file_path)
+                    continue
+                self.add_file(file_path, lines)
+                self.file_stats[file_path] = file_stats[file_path]
+
+            if updated_paths or removed_paths:
+                log.info(f'Re-indexed {len(updated_paths)} files and '
+                         f'removed {len(removed_paths)} files from the '
+                         f'{self.__class__.__name__}')
+
+            return updated_paths, removed_paths
+
+    def add_file(self, file_path, lines):
+        '''Add all lines of a file to the index, replacing
+        anything previously indexed for the file
+        '''
+        raise NotImplementedError
+
+    def remove_file(self, file_path):
+        '''Remove everything indexed for a file
+        '''
+        raise NotImplementedError
+
+
+class SearchIndex(LineIndex):
+    """Positional inverted index of every line within the notes
+    """
+
+    def __init__(self, notes_directory):
+        super(SearchIndex, self).__init__(notes_directory)
+        # Distinct tokens within each indexed file
+        self.file_tokens = {}
+        # token -> file_path -> line_number -> [positions]
+        self.postings = {}
+        # Number of tokens in each line and in each file
+        self.line_lengths = {}
+        self.file_lengths = {}
+        # token -> number of lines containing the token
+        self.line_frequencies = {}
+        # Corpus totals used for average document lengths
+        self.total_lines = 0
+        self.total_line_tokens = 0
+
+    def add_file(self, file_path, lines):
+        '''Add all lines of a file to the index, replacing
+        anything previously indexed for the file
+        '''
+
+        with self.lock:
+            self.remove_file(file_path)
+
+            file_tokens = set()
+            line_lengths = []
+            for idx, line in enumerate(lines):
+                line_number = idx + 1
+                line_tokens = tokenize(line.lower())
+                for position, token in enumerate(line_tokens):
+                    file_postings = self.postings.setdefault(token, {})
+                    line_postings = file_postings.setdefault(file_path, {})
+                    if line_number not in line_postings:
+                        line_postings[line_number] = []
+                        self.line_frequencies[token] = \
+                            self.line_frequencies.get(token, 0) + 1
+                    line_postings[line_number].append(position)
+                    file_tokens.add(token)
+                line_lengths.append(len(line_tokens))
+
+            self.file_lines[file_path] = lines
+            self.file_tokens[file_path] = file_tokens
+            self.line_lengths[file_path] = line_lengths
+            self.file_lengths[file_path] = sum(line_lengths)
+            self.total_lines += len(line_lengths)
+            self.total_line_tokens += self.file_lengths[file_path]
+
+    def remove_file(self, file_path):
+        '''Remove everything indexed for a file
+        '''
+
+        with self.lock:
+            for token in self.file_tokens.pop(file_path, set()):
+                file_postings = self.postings[token]
+                self.line_frequencies[token] -= len(file_postings[file_path])
+                if not self.line_frequencies[token]:
+                    del self.line_frequencies[token]
+                del file_postings[file_path]
+                if not file_postings:
+                    del self.postings[token]
+            self.total_lines -= len(self.line_lengths.pop(file_path, []))
+            self.total_line_tokens -= self.file_lengths.pop(file_path, 0)
+            self.file_lines.pop(file_path, None)
+            self.file_stats.pop(file_path, None)
+
+    def get_candidate_lines(self, tokens):
+        '''Get all lines which contain every one of the tokens, keyed by
+        file path with a set of line numbers for each file
+        '''
+
+        # Start from the rarest token to keep intersections small
+        token_postings = []
+        for token in set(tokens):
+            file_postings = self.postings.get(token.lower())
+            if not file_postings:
+                return {}
+            token_postings.append(file_postings)
+        token_postings.sort(key=len)
+
+        candidates = {}
+        for file_path, line_postings in token_postings[0].items():
+            line_numbers = set(line_postings.keys())
+            for other_postings in token_postings[1:]:
+                other_lines = other_postings.get(file_path)
+                if not other_lines:
+                    line_numbers = set()
+                    break
+                line_numbers.intersection_update(other_lines.keys())
+            if line_numbers:
+                candidates[file_path] = line_numbers
+
+        return candidates
+
+    def get_phrase_spans(self, file_path, line_number, tokens,
+                         case_sensitive=False):
+        '''Get the (start, end) token positions of every occurrence
+        of a phrase within a line
+        '''
+
+        starts = None
+        for offset, token in enumerate(tokens):
+            positions = self.postings[token.lower()][file_path][line_number]
+            shifted = set(position - offset for position in positions)
+            if starts is None:
+                starts = shifted
+            else:
+                starts.intersection_update(shifted)
+            if not starts:
+                return []
+
+        if case_sensitive:
+            line_tokens = tokenize(self.file_lines[file_path][line_number - 1])
+            starts = [start for start in starts
+                      if line_tokens[start:start + len(tokens)] == tokens]
+
+        return [(start, start + len(tokens) - 1) for start in sorted(starts)]
+
+    def line_matches(self, file_path, line_number, clauses,
+                     case_sensitive=False):
+        '''Check that a candidate line satisfies every query clause
+        '''
+
+        for clause in clauses:
+            if clause['type'] == 'phrase':
+                spans = self.get_phrase_spans(file_path, line_number,
+                                              clause['tokens'],
+                                              case_sensitive)
+                if not spans:
+                    return False
+
+            elif clause['type'] == 'near':
+                first_spans = self.get_phrase_spans(
+                    file_path, line_number, clause['operands'][0],
+                    case_sensitive)
+                second_spans = self.get_phrase_spans(
+                    file_path, line_number, clause['operands'][1],
+                    case_sensitive)
+                distance = clause['distance']
+                if not any([second_start - first_end <= distance and
+                            first_start - second_end <= distance
+                            for first_start, first_end in first_spans
+                            for second_start, second_end in second_spans]):
+                    return False
+
+        return True
+
+    def get_bm25_score(self, term_frequency, document_frequency,
+                       document_count, document_length, average_length):
+        '''Get the BM25 score contribution of a single term
+        '''
+
+        idf = math.log(1 + (document_count - document_frequency + 0.5) /
+                       (document_frequency + 0.5))
+        length_norm = 1 - BM25_B + BM25_B * document_length / average_length
+        return idf * term_frequency * (BM25_K1 + 1) / \
+            (term_frequency + BM25_K1 * length_norm)
+
+    def get_line_score(self, file_path, line_number, tokens):
+        '''Get the BM25 score of a line for a set of query tokens,
+        treating each line as a document
+        '''
+
+        average_length = self.total_line_tokens / max(self.total_lines, 1)
+        line_length = self.line_lengths[file_path][line_number - 1]
+
+        score = 0
+        for token in tokens:
+            positions = self.postings[token][file_path].get(line_number, [])
+            if not positions:
+                continue
+            score += self.get_bm25_score(
+                len(positions), self.line_frequencies[token],
+                self.total_lines, line_length, max(average_length, 1))
+        return score
+
+    def get_file_score(self, file_path, tokens):
+        '''Get the BM25 score of a whole file for a set of query tokens
+        '''
+
+        file_count = len(self.file_lengths)
+        average_length = self.total_line_tokens / max(file_count, 1)
+
+        score = 0
+        for token in tokens:
+            line_postings = self.postings[token].get(file_path, {})
+            term_frequency = sum([len(positions)
+                                  for positions in line_postings.values()])
+            if not term_frequency:
+                continue
+            score += self.get_bm25_score(
+                term_frequency, len(self.postings[token]), file_count,
+                self.file_lengths[file_path], max(average_length, 1))
+        return score
+
+    def search(self, query_string, case_sensitive=False, refresh=True,
+               rank=False, limit=None):
+        '''Get all lines which match a query, in the same form as
+        the results of `search_notes`. The `count` is the total number
+        of matching lines, even when only the top results are returned
+
+        `rank` orders the results by BM25 score, best first, and
+            adds a `score` to each result
+        `limit` returns only the top results, which are selected with
+            a bounded heap rather than by sorting every match
+        '''
+
+        if refresh:
+            self.refresh()
+
+        clauses = parse_query(query_string)
+        if not clauses:
+            return {
+                "items": [],
+                "count": 0
+            }
+
+        required_tokens = []
+        for clause in clauses:
+            if clause['type'] == 'phrase':
+                required_tokens.extend(clause['tokens'])
+            else:
+                for operand in clause['operands']:
+                    required_tokens.extend(operand)
+
+        with self.lock:
+            candidates = self.get_candidate_lines(required_tokens)
+
+            matches = []
+            for file_path in sorted(candidates.keys()):
+                for line_number in sorted(candidates[file_path]):
+                    if self.line_matches(file_path, line_number,
+                                         clauses, case_sensitive):
+                        matches.append((file_path, line_number))
+            match_count = len(matches)
+
+            scores = {}
+            if rank:
+                query_tokens = set([token.lower()
+                                    for token in required_tokens])
+                file_scores = {}
+                for file_path, line_number in matches:
+                    if file_path not in file_scores:
+                        file_scores[file_path] = self.get_file_score(
+                            file_path, query_tokens)
+                    scores[(file_path, line_number)] = (
+                        self.get_line_score(file_path, line_number,
+                                            query_tokens),
+                        file_scores[file_path])
+
+                def score_key(match):
+                    return scores[match]
+
+                if limit is None:
+                    matches = sorted(matches, key=score_key, reverse=True)
+                else:
+                    matches = heapq.nlargest(limit, matches, key=score_key)
+            elif limit is not None:
+                matches = matches[:limit]
+
+            search_results = []
+            for file_path, line_number in matches:
+                line = self.file_lines[file_path][line_number - 1]
+                search_result = {
+                    'file_path': file_path,
+                    'line_number': str(line_number),
+                    'match_content': line.strip()
+                }
+                if rank:
+                    search_result['score'] = \
+                        scores[(file_path, line_number)][0]
+                search_results.append(search_result)
+
+        return {
+            "items": search_results,
+            "count": match_count
+        }
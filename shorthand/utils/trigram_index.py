@@ -0,0 +1,288 @@
+'''
+In-process trigram index over the lines of all notes, used to answer
+substring and regular expression searches without a full scan.
+
+Each search term is treated as a grep basic regular expression, the
+same as the grep based search. The literal runs which any match must
+contain are broken into trigrams, and the posting lists for those
+trigrams are intersected to find a small set of candidate lines.
+Only the candidate lines are then checked with the real expression.
+Terms with no literal run of three or more characters fall back to
+checking every line.
+'''
+
+import re
+import shlex
+import logging
+
+from shorthand.utils.search_index import LineIndex
+from shorthand.utils.patterns import translate_grep_pattern
+
+
+# Characters which always break up a run of literal characters
+REGEX_SPECIAL_CHARACTERS = '.[]^$\\()|'
+REGEX_QUANTIFIERS = '*+?{'
+
+
+log = logging.getLogger(__name__)
+
+
+def get_trigrams(text):
+    '''Get the set of all three character sequences within text
+    '''
+    return set([text[idx:idx + 3] for idx in range(len(text) - 2)])
+
+
+def get_required_literals(regex):
+    '''Get runs of literal characters which any match of a Python
+    regular expression must contain. This is conservative, so it
+    may leave out literals that are actually required but will
+    never include one that is not
+    '''
+
+    # With top level alternation nothing in particular is required
+    depth = 0
+    in_brackets = False
+    idx = 0
+    while idx < len(regex):
+        character = regex[idx]
+        if character == '\\':
+            idx += 2
+            continue
+        if in_brackets:
+            if character == ']':
+                in_brackets = False
+        elif character == '[':
+            in_brackets = True
+        elif character == '(':
+            depth += 1
+        elif character == ')':
+            depth -= 1
+        elif character == '|' and depth == 0:
+            return []
+        idx += 1
+
+    literals = []
+    current_run = ''
+    depth = 0
+    idx = 0
+    while idx < len(regex):
+        character = regex[idx]
+        next_character = regex[idx + 1:idx + 2]
+
+        if depth:
+            # Skip over groups, which may be optional or alternated
+            if character == '\\':
+                idx += 1
+            elif character == '(':
+                depth += 1
+            elif character == ')':
+                depth -= 1
+            idx += 1
+            continue
+
+        if character == '\\':
+            escaped = regex[idx + 1:idx + 2]
+            if escaped and not escaped.isalnum():
+                literal = escaped
+                idx += 2
+            else:
+                # Character classes such as \w break up literal runs
+                literals.append(current_run)
+                current_run = ''
+                idx += 2
+                continue
+            next_character = regex[idx:idx + 1]
+        elif character == '[':
+            # Skip over bracket expressions
+            literals.append(current_run)
+            current_run = ''
+            idx += 1
+            if regex[idx:idx + 1] == '^':
+                idx += 1
+            if regex[idx:idx + 1] == ']':
+                idx += 1
+            while idx < len(regex) and regex[idx] != ']':
+                if regex[idx] == '\\':
+                    idx += 1
+                idx += 1
+            idx += 1
+            continue
+        elif character == '{':
+            # Skip over bounded repetition such as {2,3}
+            literals.append(current_run)
+            current_run = ''
+            idx = regex.find('}', idx) + 1 or len(regex)
+            continue
+        elif character == '(':
+            literals.append(current_run)
+            current_run = ''
+            depth = 1
+            idx += 1
+            continue
+        elif character in REGEX_SPECIAL_CHARACTERS or \
+                character in REGEX_QUANTIFIERS:
+            literals.append(current_run)
+            current_run = ''
+            idx += 1
+            continue
+        else:
+            literal = character
+            idx += 1
+
+        if next_character and next_character in REGEX_QUANTIFIERS:
+            # The literal may not be present, so it ends the run
+            literals.append(current_run)
+            current_run = ''
+        else:
+            current_run += literal
+
+    literals.append(current_run)
+    return [literal for literal in literals if literal]
+
+
+class TrigramIndex(LineIndex):
+    """Trigram index of every line within the notes
+    """
+
+    def __init__(self, notes_directory):
+        super(TrigramIndex, self).__init__(notes_directory)
+        # Distinct trigrams within each indexed file
+        self.file_trigrams = {}
+        # trigram -> file_path -> set of line numbers
+        self.postings = {}
+
+    def add_file(self, file_path, lines):
+        '''Add all lines of a file to the index, replacing
+        anything previously indexed for the file
+        '''
+
+        with self.lock:
+            self.remove_file(file_path)
+
+            # Grep does not consider the empty string after a
+            # trailing newline to be a line
+            if lines and lines[-1] == '':
+                lines = lines[:-1]
+
+            file_trigrams = set()
+            for idx, line in enumerate(lines):
+                for trigram in get_trigrams(line.lower()):
+                    file_postings = self.postings.setdefault(trigram, {})
+                    file_postings.setdefault(file_path, set()).add(idx + 1)
+                    file_trigrams.add(trigram)
+
+            self.file_lines[file_path] = lines
+            self.file_trigrams[file_path] = file_trigrams
+
+    def remove_file(self, file_path):
+        '''Remove everything indexed for a file
+        '''
+
+        with self.lock:
+            for trigram in self.file_trigrams.pop(file_path, set()):
+                file_postings = self.postings[trigram]
+                del file_postings[file_path]
+                if not file_postings:
+                    del self.postings[trigram]
+            self.file_lines.pop(file_path, None)
+            self.file_stats.pop(file_path, None)
+
+    def get_candidate_lines(self, trigrams):
+        '''Get all lines which contain every one of the trigrams, keyed
+        by file path with a set of line numbers for each file. Returns
+        None if there are no trigrams to narrow the lines down with
+        '''
+
+        if not trigrams:
+            return None
+
+        # Start from the rarest trigram to keep intersections small
+        trigram_postings = []
+        for trigram in trigrams:
+            file_postings = self.postings.get(trigram)
+            if not file_postings:
+                return {}
+            trigram_postings.append(file_postings)
+        trigram_postings.sort(key=len)
+
+        candidates = {}
+        for file_path, line_numbers in trigram_postings[0].items():
+            line_numbers = set(line_numbers)
+            for other_postings in trigram_postings[1:]:
+                line_numbers.intersection_update(
+                    other_postings.get(file_path, set()))
+                if not line_numbers:
+                    break
+            if line_numbers:
+                candidates[file_path] = line_numbers
+
+        return candidates
+
+    def search(self, query_string, case_sensitive=False, refresh=True,
+               rank=False, limit=None):
+        '''Get all lines which match every term within a query, in
+        the same form as the results of `search_notes`. Each term is
+        a grep basic regular expression
+
+        `refresh` checks every notes file for changes first. A watched
+            index is refreshed with only the changed paths instead, so
+            that searches don't depend on the size of the notes
+        `limit` returns only the first results, while the count still
+            reflects every match
+        '''
+
+        if rank:
+            raise ValueError('The trigram index does not support ranking')
+
+        if refresh:
+            self.refresh()
+
+        flags = 0
+        if not case_sensitive:
+            flags = re.IGNORECASE
+
+        regexes = []
+        trigrams = set()
+        for term in shlex.split(query_string):
+            try:
+                regex = translate_grep_pattern(term)
+                regexes.append(re.compile(regex, flags))
+            except re.error as e:
+                # Grep finds nothing for an invalid pattern
+                log.warning(f'Invalid search pattern {term}: {e}')
+                return {
+                    "items": [],
+                    "count": 0
+                }
+            for literal in get_required_literals(regex):
+                trigrams.update(get_trigrams(literal.lower()))
+
+        search_results = []
+        with self.lock:
+            candidates = self.get_candidate_lines(trigrams)
+            if candidates is None:
+                candidates = {
+                    file_path: range(1, len(lines) + 1)
+                    for file_path, lines in self.file_lines.items()}
+
+            for file_path in sorted(candidates.keys()):
+                lines = self.file_lines[file_path]
+                for line_number in sorted(candidates[file_path]):
+                    line = lines[line_number - 1]
+                    if not all([regex.search(line) for regex in regexes]):
+                        continue
+                    search_results.append({
+                        'file_path': file_path,
+                        'line_number': str(line_number),
+                        'match_content': line.strip()
+                    })
+
+        result_count = len(search_results)
+        if limit is not None:
+            search_results = search_results[:limit]
+
+        return {
+            "items": search_results,
+            "count": result_count
+        }
@@ -0,0 +1,232 @@
+'''
+Watcher which follows changes to the notes directory using Linux
+inotify, so that stamping and indexes can be kept current by only
+processing the files which actually changed.
+
+Bursts of events, such as an editor saving a file through a temporary
+file and a rename, are debounced so that each changed file is only
+handled once per burst.
+'''
+
+import os
+import errno
+import ctypes
+import ctypes.util
+import select
+import struct
+import logging
+import threading
+
+
+# inotify event flags, from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | \
+             IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+EVENT_HEADER = struct.Struct('iIII')
+READ_SIZE = 64 * 1024
+
+DEFAULT_DEBOUNCE_SECONDS = 0.5
+
+
+log = logging.getLogger(__name__)
+
+
+def load_inotify():
+    '''Load the inotify functions from the C library
+    '''
+
+    libc_name = ctypes.util.find_library('c')
+    if not libc_name:
+        raise OSError('Could not find the C library to load inotify from')
+    libc = ctypes.CDLL(libc_name, use_errno=True)
+    if not hasattr(libc, 'inotify_init1'):
+        raise OSError('inotify is not available on this platform')
+
+    libc.inotify_init1.argtypes = [ctypes.c_int]
+    libc.inotify_init1.restype = ctypes.c_int
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                       ctypes.c_uint32]
+    libc.inotify_add_watch.restype = ctypes.c_int
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    libc.inotify_rm_watch.restype = ctypes.c_int
+    return libc
+
+
+class NotesWatcher(object):
+    """Watch every directory within the notes directory for changes to
+    notes files, and pass batches of changed files to a handler
+    """
+
+    def __init__(self, notes_directory, on_change,
+                 debounce_seconds=DEFAULT_DEBOUNCE_SECONDS):
+        '''`on_change` is called with a sorted list of the full paths
+        of all notes files which were changed, created, or removed
+        in a burst of events. When events have been dropped by the
+        kernel it is called with None, meaning anything may have changed
+        '''
+        super(NotesWatcher, self).__init__()
+        self.notes_directory = notes_directory.rstrip('/')
+        self.on_change = on_change
+        self.debounce_seconds = debounce_seconds
+        self.libc = load_inotify()
+        self.fd = None
+        # Watch descriptor -> watched directory
+        self.watches = {}
+        self.stop_event = threading.Event()
+
+    def start(self):
+        '''Open the inotify instance and watch the whole notes directory
+        '''
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error_number = ctypes.get_errno()
+            raise OSError(error_number, os.strerror(error_number))
+        self.add_watches(self.notes_directory)
+        log.info(f'Watching {len(self.watches)} directories '
+                 f'in {self.notes_directory}')
+
+    def close(self):
+        '''Close the inotify instance, which removes all watches
+        '''
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        self.watches = {}
+
+    def stop(self):
+        '''Ask a running watcher to stop after its current wait
+        '''
+        self.stop_event.set()
+
+    def add_watches(self, directory):
+        '''Watch a directory and every directory beneath it
+        '''
+        for dir_path, dirnames, filenames in os.walk(directory):
+            # Skip hidden directories such as .git
+            dirnames[:] = [dirname for dirname in dirnames
+                           if dirname[0] != '.']
+            watch = self.libc.inotify_add_watch(
+                self.fd, os.fsencode(dir_path), WATCH_MASK)
+            if watch < 0:
+                error_number = ctypes.get_errno()
+                if error_number in [errno.ENOENT, errno.ENOTDIR]:
+                    # Removed before it could be watched
+                    continue
+                raise OSError(error_number, os.strerror(error_number),
+                              dir_path)
+            self.watches[watch] = dir_path
+
+    def read_events(self):
+        '''Read all pending events, and return the set of changed notes
+        files, or None if the kernel event queue overflowed
+        '''
+
+        changed_paths = set()
+        overflowed = False
+        while True:
+            try:
+                data = os.read(self.fd, READ_SIZE)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+
+            offset = 0
+            while offset < len(data):
+                watch, mask, cookie, name_length = \
+                    EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset:offset + name_length].rstrip(b'\0')
+                offset += name_length
+
+                if mask & IN_Q_OVERFLOW:
+                    overflowed = True
+                    continue
+                if mask & IN_IGNORED:
+                    self.watches.pop(watch, None)
+                    continue
+
+                directory = self.watches.get(watch)
+                if directory is None or not name:
+                    continue
+                path = os.path.join(directory, os.fsdecode(name))
+
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        # Pick up new directories and any notes which
+                        # were already written to them
+                        self.add_watches(path)
+                        for dir_path, dirnames, filenames in os.walk(path):
+                            for filename in filenames:
+                                if filename[-5:] == '.note':
+                                    changed_paths.add(
+                                        os.path.join(dir_path, filename))
+                    elif mask & IN_MOVED_FROM:
+                        # Notes within a moved directory can't be listed
+                        # anymore, so treat it as a full change
+                        overflowed = True
+                    continue
+
+                if path[-5:] == '.note':
+                    changed_paths.add(path)
+
+        if overflowed:
+            # Directories may have been missed, so re-establish watches
+            self.add_watches(self.notes_directory)
+            return None
+        return changed_paths
+
+    def wait(self, timeout=None):
+        '''Wait for events to be readable, returning whether there are
+        any events
+        '''
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        return bool(readable)
+
+    def run(self, poll_seconds=1.0):
+        '''Watch for changes until stopped, calling the handler with the
+        files changed in each burst of events once it has settled
+        '''
+
+        if self.fd is None:
+            self.start()
+
+        try:
+            while not self.stop_event.is_set():
+                if not self.wait(poll_seconds):
+                    continue
+
+                changed_paths = set()
+                full_change = False
+                while True:
+                    batch = self.read_events()
+                    if batch is None:
+                        full_change = True
+                    else:
+                        changed_paths.update(batch)
+                    # Keep collecting until no events arrive
+                    # for a full debounce period
+                    if not self.wait(self.debounce_seconds):
+                        break
+
+                if full_change:
+                    log.info('Events were dropped, handling all notes')
+                    self.on_change(None)
+                elif changed_paths:
+                    log.info(f'Handling changes to '
+                             f'{len(changed_paths)} notes')
+                    self.on_change(sorted(changed_paths))
+        finally:
+            self.close()
@@ -0,0 +1,63 @@
+import os
+import sys
+import logging
+import unittest
+from unittest import mock
+
+from shorthand.utils.logging import setup_logging
+
+from utils import setup_environment, setup_notes_copy, TEMP_DIR
+
+
+CONFIG = setup_environment()
+setup_logging(CONFIG)
+log = logging.getLogger(__name__)
+
+API_NOTES_DIR = TEMP_DIR + '/api_notes'
+API_CACHE_DIR = TEMP_DIR + '/api_cache'
+WEB_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__))) + \
+    '/web'
+
+# The API is configured when it is imported, with an element index over
+# a separate copy of the notes which a watcher is relied on to refresh
+setup_notes_copy(API_NOTES_DIR, API_CACHE_DIR)
+WATCHED_CONFIG = dict(CONFIG, notes_directory=API_NOTES_DIR,
+                      cache_directory=API_CACHE_DIR, element_source='index',
+                      element_index_watched=True)
+sys.path.insert(0, WEB_DIR)
+with mock.patch('shorthand.utils.config.get_notes_config',
+                return_value=WATCHED_CONFIG):
+    import api
+
+# Pages and endpoints which are served from the element index
+ELEMENT_INDEX_URLS = ['/', '/todos', '/questions', '/glossary',
+                      '/api/v1/calendar', '/api/v1/tags']
+
+
+class TestWatchedIndexApi(unittest.TestCase):
+    """Test that the API doesn't check every note for changes on each
+    request when the element index is watched"""
+
+    def setUp(self):
+        # Other tests clear out the temporary directory, so the copy of
+        # the notes is set up again and indexed up front, standing in for
+        # the watcher which would have kept the index current
+        setup_notes_copy(API_NOTES_DIR, API_CACHE_DIR).refresh()
+        self.client = api.app.test_client()
+
+    def test_watched_requests(self):
+        for url in ELEMENT_INDEX_URLS:
+            with mock.patch('shorthand.utils.element_index.get_file_stats') \
+                    as mock_get_file_stats:
+                response = self.client.get(url)
+            assert response.status_code == 200
+            mock_get_file_stats.assert_not_called()
+
+    def test_unwatched_requests(self):
+        for url in ELEMENT_INDEX_URLS:
+            with mock.patch('shorthand.utils.element_index.get_file_stats') \
+                    as mock_get_file_stats, \
+                    mock.patch.object(api, 'INDEX_REFRESH', True):
+                response = self.client.get(url)
+            assert response.status_code == 200
+            mock_get_file_stats.assert_called()
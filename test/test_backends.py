@@ -0,0 +1,149 @@
+import sys
+import shutil
+import logging
+import unittest
+from unittest import mock
+
+from shorthand.utils.logging import setup_logging
+from shorthand.utils.patterns import ALL_QUESTIONS, RECORD_SET_PATTERN, \
+    CATCH_ALL_PATTERN, VALID_INCOMPLETE_PATTERN, VALID_COMPLETE_PATTERN
+from shorthand.backends import GrepBackend, RipgrepBackend, PythonBackend, \
+                               get_backend
+from shorthand.backends.grep import stream_command
+from shorthand.todo_tools import get_todos
+from shorthand.question_tools import get_questions
+from shorthand.tag_tools import get_tags
+from shorthand.search_tools import search_notes
+
+from utils import setup_environment
+
+
+CONFIG = setup_environment()
+setup_logging(CONFIG)
+log = logging.getLogger(__name__)
+
+
+def sort_matches(matches):
+    return sorted(matches, key=lambda match: (match['file_path'],
+                                              int(match['line_number'])))
+
+
+class TestBackends(unittest.TestCase):
+    """Test that all search backends find the same lines"""
+
+    maxDiff = None
+
+    def setUp(self):
+        self.grep = GrepBackend(CONFIG['grep_path'])
+        self.backends = [PythonBackend()]
+        if shutil.which('rg'):
+            self.backends.append(RipgrepBackend('rg'))
+
+    def assert_same_lines(self, *args, **kwargs):
+        expected = sort_matches(self.grep.find_lines(
+            CONFIG['notes_directory'], *args, **kwargs))
+        self.assertTrue(expected)
+        for backend in self.backends:
+            self.assertEqual(sort_matches(backend.find_lines(
+                CONFIG['notes_directory'], *args, **kwargs)), expected)
+
+    def test_perl_pattern_with_context(self):
+        self.assert_same_lines(ALL_QUESTIONS, context_after=1)
+
+    def test_record_sets(self):
+        self.assert_same_lines(RECORD_SET_PATTERN)
+
+    def test_excludes(self):
+        self.assert_same_lines(CATCH_ALL_PATTERN,
+                               excludes=[VALID_INCOMPLETE_PATTERN,
+                                         VALID_COMPLETE_PATTERN])
+
+    def test_basic_case_insensitive(self):
+        self.assert_same_lines('FOOD', case_sensitive=False, syntax='basic',
+                               filters=['e'])
+
+    def test_parallel_python_backend(self):
+        backend = PythonBackend(workers=2)
+        with mock.patch('shorthand.backends.python.PARALLEL_SCAN_MIN_FILES',
+                        0):
+            matches = backend.find_lines(CONFIG['notes_directory'],
+                                         ALL_QUESTIONS, context_after=1)
+        self.assertEqual(
+            sort_matches(matches),
+            sort_matches(self.grep.find_lines(CONFIG['notes_directory'],
+                                              ALL_QUESTIONS,
+                                              context_after=1)))
+
+    def test_lazy_lines(self):
+        for backend in [self.grep] + self.backends:
+            self.assertEqual(
+                list(backend.iter_lines(CONFIG['notes_directory'],
+                                        CATCH_ALL_PATTERN,
+                                        excludes=[VALID_COMPLETE_PATTERN])),
+                backend.find_lines(CONFIG['notes_directory'],
+                                   CATCH_ALL_PATTERN,
+                                   excludes=[VALID_COMPLETE_PATTERN]))
+
+    def test_stream_command_errors(self):
+        # More errors than fit in a pipe buffer are written before any
+        # output, which would block if errors weren't read until the end
+        script = ('import sys\n'
+                  'sys.stderr.write("e" * 1000000)\n'
+                  'sys.stdout.write("note.note\\x001:line\\n")\n'
+                  'sys.exit(2)')
+        matches = list(stream_command([sys.executable, '-c', script]))
+        self.assertEqual(matches, [{'file_path': 'note.note',
+                                    'line_number': '1',
+                                    'line': 'line',
+                                    'context_after': []}])
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            get_backend({'search_backend': 'not-a-backend'})
+
+
+def sort_results(results):
+    return sorted(results, key=lambda result: (result['file_path'],
+                                               int(result['line_number'])))
+
+
+class TestToolBackends(unittest.TestCase):
+    """Test that tools return the same results with any backend"""
+
+    maxDiff = None
+
+    def test_todos(self):
+        for status in ['incomplete', 'complete', 'skipped']:
+            self.assertEqual(
+                sort_results(get_todos(CONFIG['notes_directory'], status,
+                                       grep_path=CONFIG['grep_path'])),
+                sort_results(get_todos(CONFIG['notes_directory'], status,
+                                       grep_path=CONFIG['grep_path'],
+                                       backend=PythonBackend())))
+
+    def test_questions(self):
+        for status in ['all', 'answered', 'unanswered']:
+            self.assertEqual(
+                sort_results(get_questions(CONFIG['notes_directory'], status,
+                                           grep_path=CONFIG['grep_path'])),
+                sort_results(get_questions(CONFIG['notes_directory'], status,
+                                           grep_path=CONFIG['grep_path'],
+                                           backend=PythonBackend())))
+
+    def test_tags(self):
+        self.assertEqual(
+            get_tags(CONFIG['notes_directory'],
+                     grep_path=CONFIG['grep_path']),
+            get_tags(CONFIG['notes_directory'],
+                     grep_path=CONFIG['grep_path'],
+                     backend=PythonBackend()))
+
+    def test_search(self):
+        grep_results = search_notes(CONFIG['notes_directory'], 'food',
+                                    grep_path=CONFIG['grep_path'])
+        python_results = search_notes(CONFIG['notes_directory'], 'food',
+                                      grep_path=CONFIG['grep_path'],
+                                      backend=PythonBackend())
+        self.assertEqual(grep_results['count'], python_results['count'])
+        self.assertEqual(sort_results(grep_results['items']),
+                         sort_results(python_results['items']))
@@ -0,0 +1,89 @@
+import os
+import time
+import logging
+import unittest
+from datetime import date, timedelta
+from unittest import mock
+
+from shorthand.todo_tools import get_todos
+from shorthand.question_tools import get_questions
+from shorthand.utils.dashboard import DashboardSummary, get_file_summary
+from shorthand.utils.logging import setup_logging
+
+from utils import setup_environment, setup_notes_copy, TEMP_DIR
+
+
+CONFIG = setup_environment()
+setup_logging(CONFIG)
+log = logging.getLogger(__name__)
+
+DASHBOARD_NOTES_DIR = TEMP_DIR + '/dashboard_notes'
+DASHBOARD_CACHE_DIR = TEMP_DIR + '/dashboard_cache'
+
+
+class TestDashboardSummary(unittest.TestCase):
+    """Test the incrementally maintained home page summary"""
+
+    def setUp(self):
+        self.index = setup_notes_copy(DASHBOARD_NOTES_DIR,
+                                      DASHBOARD_CACHE_DIR)
+
+    def assert_counts_match(self, summary, directory_filter=None):
+        todos = get_todos(DASHBOARD_NOTES_DIR, 'incomplete',
+                          directory_filter=directory_filter,
+                          grep_path=CONFIG['grep_path'])
+        questions = get_questions(DASHBOARD_NOTES_DIR, 'unanswered',
+                                  directory_filter=directory_filter,
+                                  grep_path=CONFIG['grep_path'])
+        assert summary['incomplete_todos'] == len(todos)
+        assert summary['unanswered_questions'] == len(questions)
+
+    def test_counts(self):
+        for directory_filter in [None, 'section']:
+            dashboard = DashboardSummary(self.index,
+                                         directory_filter=directory_filter)
+            self.assert_counts_match(dashboard.get_summary(refresh=True),
+                                     directory_filter)
+
+    def test_cached_until_changed(self):
+        dashboard = DashboardSummary(self.index)
+        summary = dashboard.get_summary(refresh=True)
+        assert dashboard.get_summary(refresh=True) is summary
+
+        time.sleep(0.01)
+        with open(DASHBOARD_NOTES_DIR + '/todos.note', 'a') as note_file:
+            note_file.write('\n[] A brand new todo\n? A new question\n')
+        os.remove(DASHBOARD_NOTES_DIR + '/bugs.note')
+
+        with mock.patch('shorthand.utils.dashboard.get_file_summary',
+                        wraps=get_file_summary) as mock_get_file_summary:
+            new_summary = dashboard.get_summary(refresh=True)
+        # Only the changed file is summarized again
+        assert mock_get_file_summary.call_count == 1
+        assert new_summary is not summary
+        self.assert_counts_match(new_summary)
+
+    def test_watched_summary(self):
+        # The index is expected to be kept current by a watcher
+        self.index.refresh()
+        dashboard = DashboardSummary(self.index)
+        with mock.patch.object(self.index, 'refresh') as mock_refresh:
+            summary = dashboard.get_summary()
+        mock_refresh.assert_not_called()
+        self.assert_counts_match(summary)
+
+    def test_future_todos(self):
+        start_date = (date.today() + timedelta(days=1)).isoformat()
+        with open(DASHBOARD_NOTES_DIR + '/future.note', 'w') as note_file:
+            note_file.write(f'[ ] ({start_date}) Start tomorrow\n')
+        dashboard = DashboardSummary(self.index)
+        summary = dashboard.get_summary(refresh=True)
+        self.assert_counts_match(summary)
+        assert start_date not in [event['date']
+                                  for event in summary['events']]
+
+        # The todo counts once its start date arrives
+        dashboard.set_date(date.today() + timedelta(days=1))
+        assert dashboard.incomplete_todos == \
+            summary['incomplete_todos'] + 1
+
@@ -0,0 +1,203 @@
+import os
+import time
+import logging
+import unittest
+from unittest import mock
+
+from shorthand.todo_tools import get_todos
+from shorthand.question_tools import get_questions
+from shorthand.calendar_tools import get_calendar
+from shorthand.tag_tools import get_tags, get_tag_counts
+from shorthand.utils.element_index import ElementIndex
+from shorthand.utils.scanner import scan_notes, get_empty_elements, \
+    ELEMENT_TYPES
+from shorthand.utils.logging import setup_logging
+
+from utils import setup_environment, setup_notes_copy, TEMP_DIR
+
+
+CONFIG = setup_environment()
+setup_logging(CONFIG)
+log = logging.getLogger(__name__)
+
+INDEX_NOTES_DIR = TEMP_DIR + '/index_notes'
+INDEX_CACHE_DIR = TEMP_DIR + '/index_cache'
+
+
+class TestElementIndex(unittest.TestCase):
+    """Test the persistent element index"""
+
+    maxDiff = None
+
+    def setUp(self):
+        self.index = setup_notes_copy(INDEX_NOTES_DIR, INDEX_CACHE_DIR)
+
+    def assertElementsEqual(self, first, second):
+        for element_type in ELEMENT_TYPES:
+            self.assertCountEqual(first[element_type], second[element_type])
+
+    def test_matches_scan(self):
+        self.assertElementsEqual(self.index.get_elements(),
+                                 scan_notes(INDEX_NOTES_DIR))
+        self.assertElementsEqual(
+            self.index.get_elements(directory_filter='section'),
+            scan_notes(INDEX_NOTES_DIR, directory_filter='section'))
+
+    def test_element_types(self):
+        elements = self.index.get_elements(element_types=['todos'])
+        assert elements['todos']
+        assert not elements['questions']
+
+    def test_serves_tools(self):
+        elements = self.index.get_elements()
+        self.assertCountEqual(
+            get_todos(INDEX_NOTES_DIR, elements=elements),
+            get_todos(INDEX_NOTES_DIR, grep_path=CONFIG['grep_path']))
+        self.assertCountEqual(
+            get_questions(INDEX_NOTES_DIR, elements=elements),
+            get_questions(INDEX_NOTES_DIR, grep_path=CONFIG['grep_path']))
+        self.assertEqual(
+            get_calendar(INDEX_NOTES_DIR, elements=elements),
+            get_calendar(INDEX_NOTES_DIR, grep_path=CONFIG['grep_path']))
+
+    def test_incremental_refresh(self):
+        updated, removed = self.index.refresh()
+        assert len(updated) == 7
+        assert not removed
+        sequence = self.index.get_sequence()
+
+        # Nothing is re-parsed if no files have changed
+        assert self.index.refresh() == ([], [])
+
+        # Only modified files are re-parsed
+        time.sleep(0.01)
+        with open(INDEX_NOTES_DIR + '/todos.note', 'a') as note_file:
+            note_file.write('\n[] A brand new todo\n')
+        os.remove(INDEX_NOTES_DIR + '/bugs.note')
+        assert self.index.refresh() == (['/todos.note'], ['/bugs.note'])
+
+        new_sequence, updated, removed = self.index.get_changes(sequence)
+        assert new_sequence > sequence
+        assert updated == ['/todos.note']
+        assert removed == ['/bugs.note']
+
+        todo_texts = [todo['todo_text']
+                      for todo in self.index.get_elements()['todos']]
+        assert 'A brand new todo' in todo_texts
+        assert not self.index.get_file_elements('/bugs.note')['todos']
+
+    def test_persistence(self):
+        self.index.refresh()
+        reopened_index = ElementIndex(INDEX_NOTES_DIR, INDEX_CACHE_DIR)
+        assert reopened_index.refresh() == ([], [])
+        self.assertElementsEqual(reopened_index.get_elements(refresh=False),
+                                 scan_notes(INDEX_NOTES_DIR))
+
+    def test_calendar_view(self):
+        scanned_elements = scan_notes(INDEX_NOTES_DIR)
+        self.assertEqual(
+            get_calendar(INDEX_NOTES_DIR, element_index=self.index),
+            get_calendar(INDEX_NOTES_DIR, elements=scanned_elements))
+        for start, end in [('2019-06-01', '2019-06-03'),
+                           ('2019-06-04', None), (None, '2019-05-30')]:
+            self.assertEqual(
+                get_calendar(INDEX_NOTES_DIR, element_index=self.index,
+                             start=start, end=end),
+                get_calendar(INDEX_NOTES_DIR, elements=scanned_elements,
+                             start=start, end=end))
+        assert get_calendar(INDEX_NOTES_DIR, element_index=self.index,
+                            directory_filter='section') == {}
+
+    def test_watched_calendar_view(self):
+        calendar = get_calendar(INDEX_NOTES_DIR, element_index=self.index)
+        # A watched index is not checked for changes on every lookup
+        with mock.patch('shorthand.utils.element_index.get_file_stats') \
+                as mock_get_file_stats:
+            watched_calendar = get_calendar(INDEX_NOTES_DIR,
+                                            element_index=self.index,
+                                            refresh=False)
+        mock_get_file_stats.assert_not_called()
+        self.assertEqual(watched_calendar, calendar)
+
+    def test_incremental_calendar_view(self):
+        self.index.refresh()
+        time.sleep(0.01)
+        with open(INDEX_NOTES_DIR + '/todos.note', 'a') as note_file:
+            note_file.write('\n## A dated heading 2019-06-05\n')
+        events = self.index.get_calendar_events(start='2019-06-05',
+                                                end='2019-06-05')
+        assert [event['event'] for event in events] == ['A dated heading']
+        assert events[0]['type'] == 'section'
+
+    def test_schema_upgrade(self):
+        self.index.refresh()
+        with self.index.connect() as connection:
+            connection.execute('DELETE FROM calendar_events')
+            connection.execute('PRAGMA user_version = 0')
+        upgraded_index = ElementIndex(INDEX_NOTES_DIR, INDEX_CACHE_DIR)
+        assert upgraded_index.get_calendar_events()
+
+    def test_tag_index(self):
+        scanned_elements = scan_notes(INDEX_NOTES_DIR)
+        for directory_filter in [None, 'section']:
+            self.assertEqual(
+                get_tag_counts(INDEX_NOTES_DIR, directory_filter,
+                               element_index=self.index),
+                get_tag_counts(INDEX_NOTES_DIR, directory_filter,
+                               elements=scanned_elements))
+            self.assertEqual(
+                get_tags(INDEX_NOTES_DIR, directory_filter,
+                         element_index=self.index),
+                get_tags(INDEX_NOTES_DIR, directory_filter,
+                         grep_path=CONFIG['grep_path']))
+
+        occurrences = self.index.get_tag_occurrences('food')
+        assert len(occurrences) == 2
+        assert set([occurrence['element_type']
+                    for occurrence in occurrences]) == \
+            set(['todos', 'questions'])
+
+    def test_tag_on_several_elements(self):
+        file_elements = get_empty_elements()
+        file_elements['todos'].append({'line_number': '1'})
+        file_elements['definitions'].append({'line_number': '1'})
+        file_elements['tags'].append({'line_number': '1', 'tag': 'garden'})
+        with self.index.connect() as connection:
+            self.index.update_tag_occurrences(connection, '/garden.note',
+                                              file_elements)
+
+        occurrences = self.index.get_tag_occurrences('garden',
+                                                     refresh=False)
+        self.assertCountEqual(
+            [occurrence['element_type'] for occurrence in occurrences],
+            ['todos', 'definitions'])
+        assert self.index.get_tag_counts(refresh=False)['garden'] == 1
+
+    def test_watched_tag_index(self):
+        tags = get_tags(INDEX_NOTES_DIR, element_index=self.index)
+        tag_counts = get_tag_counts(INDEX_NOTES_DIR, element_index=self.index)
+        # A watched index is not checked for changes on every lookup
+        with mock.patch('shorthand.utils.element_index.get_file_stats') \
+                as mock_get_file_stats:
+            self.assertEqual(get_tags(INDEX_NOTES_DIR,
+                                      element_index=self.index,
+                                      refresh=False), tags)
+            self.assertEqual(get_tag_counts(INDEX_NOTES_DIR,
+                                            element_index=self.index,
+                                            refresh=False), tag_counts)
+        mock_get_file_stats.assert_not_called()
+
+    def test_tagged_elements(self):
+        for tag in ['baking', 'food', 'nested', 'not-a-tag']:
+            tagged_elements = self.index.get_elements(tag=tag)
+            self.assertCountEqual(
+                get_todos(INDEX_NOTES_DIR, tag=tag,
+                          elements=tagged_elements),
+                get_todos(INDEX_NOTES_DIR, tag=tag,
+                          grep_path=CONFIG['grep_path']))
+            self.assertCountEqual(
+                get_questions(INDEX_NOTES_DIR, tag=tag,
+                              elements=tagged_elements),
+                get_questions(INDEX_NOTES_DIR, tag=tag,
+                              grep_path=CONFIG['grep_path']))
+        assert not self.index.get_elements(tag='baking')['tags']
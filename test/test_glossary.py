@@ -0,0 +1,90 @@
+import os
+import time
+import logging
+import unittest
+from unittest import mock
+
+from shorthand.definition_tools import get_definitions, get_definition
+from shorthand.utils.glossary import Glossary
+from shorthand.utils.scanner import scan_notes
+from shorthand.utils.logging import setup_logging
+
+from utils import setup_environment, setup_notes_copy, TEMP_DIR
+from results_unstamped import ALL_DEFINITIONS
+
+
+CONFIG = setup_environment()
+setup_logging(CONFIG)
+log = logging.getLogger(__name__)
+
+GLOSSARY_NOTES_DIR = TEMP_DIR + '/glossary_notes'
+GLOSSARY_CACHE_DIR = TEMP_DIR + '/glossary_cache'
+
+
+class TestGlossary(unittest.TestCase):
+    """Test term and prefix lookups from the glossary"""
+
+    def setUp(self):
+        self.index = setup_notes_copy(GLOSSARY_NOTES_DIR,
+                                      GLOSSARY_CACHE_DIR)
+        self.glossary = Glossary(self.index)
+        self.glossary.update()
+
+    def test_all_definitions(self):
+        definitions = get_definitions(GLOSSARY_NOTES_DIR,
+                                      glossary=self.glossary)
+        self.assertCountEqual(definitions, ALL_DEFINITIONS)
+        terms = [definition['term'] for definition in definitions]
+        assert terms == sorted(terms)
+
+        # Loading from a scan gives the same glossary
+        scanned_glossary = Glossary()
+        scanned_glossary.load(scan_notes(GLOSSARY_NOTES_DIR))
+        assert get_definitions(GLOSSARY_NOTES_DIR,
+                               glossary=scanned_glossary) == definitions
+
+    def test_lookup(self):
+        definitions = get_definition(GLOSSARY_NOTES_DIR, ' Software',
+                                     glossary=self.glossary)
+        assert [definition['line_number']
+                for definition in definitions] == ['6']
+        assert get_definition(GLOSSARY_NOTES_DIR, 'soft',
+                              glossary=self.glossary) == []
+
+        # The same results come from a search of the notes
+        assert get_definition(GLOSSARY_NOTES_DIR, 'software',
+                              grep_path=CONFIG['grep_path']) == definitions
+
+    def test_lookup_prefix(self):
+        for prefix, directory_filter in [('F', None), ('c', None),
+                                         ('', 'section'), ('d', 'section'),
+                                         ('zz', None)]:
+            definitions = get_definitions(GLOSSARY_NOTES_DIR,
+                                          directory_filter=directory_filter,
+                                          prefix=prefix,
+                                          glossary=self.glossary)
+            expected = get_definitions(GLOSSARY_NOTES_DIR,
+                                       directory_filter=directory_filter,
+                                       grep_path=CONFIG['grep_path'],
+                                       prefix=prefix)
+            self.assertCountEqual(definitions, expected)
+
+        assert len(self.glossary.lookup_prefix('', limit=2)) == 2
+
+    def test_update(self):
+        time.sleep(0.01)
+        with open(GLOSSARY_NOTES_DIR + '/definitions.note', 'a') as note_file:
+            note_file.write('\n{Fork} A tool for eating food\n')
+        os.remove(GLOSSARY_NOTES_DIR + '/section/mixed.note')
+
+        with mock.patch.object(self.index, 'get_file_elements',
+                               wraps=self.index.get_file_elements) as \
+                mock_get_file_elements:
+            assert self.glossary.update()
+        # Only the changed file is loaded again
+        assert mock_get_file_elements.call_count == 1
+        assert not self.glossary.update()
+
+        assert [definition['term'] for definition in
+                self.glossary.lookup_prefix('f')] == ['food', 'Fork']
+        assert self.glossary.lookup('crust') == []
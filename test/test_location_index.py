@@ -0,0 +1,141 @@
+import time
+import random
+import logging
+import unittest
+
+from shorthand.gps_tools import get_locations, get_nearest_locations, \
+                               get_location_clusters
+from shorthand.utils.location_index import LocationIndex, MAX_ZOOM
+from shorthand.utils.logging import setup_logging
+
+from utils import setup_environment, setup_notes_copy, TEMP_DIR
+from results_unstamped import ALL_LOCATIONS
+
+
+CONFIG = setup_environment()
+setup_logging(CONFIG)
+log = logging.getLogger(__name__)
+
+LOCATION_NOTES_DIR = TEMP_DIR + '/location_notes'
+LOCATION_CACHE_DIR = TEMP_DIR + '/location_cache'
+
+
+class TestLocationIndex(unittest.TestCase):
+    """Test bounding box and nearest location queries"""
+
+    def setUp(self):
+        self.index = setup_notes_copy(LOCATION_NOTES_DIR,
+                                      LOCATION_CACHE_DIR)
+        self.location_index = LocationIndex(self.index)
+        self.location_index.update()
+
+    def test_all_locations(self):
+        locations = get_locations(LOCATION_NOTES_DIR,
+                                  location_index=self.location_index)
+        self.assertCountEqual(locations, ALL_LOCATIONS)
+
+    def test_bounds(self):
+        # North America, and everything outside it across the antimeridian
+        for bounds, names in [((20, -130, 50, -60),
+                               ['Times Square', 'The Grand Canyon']),
+                              ((0, 0, 90, -100),
+                               ['The Great Pyramid', 'The Grand Canyon',
+                                ''])]:
+            locations = get_locations(LOCATION_NOTES_DIR, bounds=bounds,
+                                      location_index=self.location_index)
+            self.assertCountEqual([location['name']
+                                   for location in locations], names)
+            searched_locations = get_locations(
+                LOCATION_NOTES_DIR, bounds=bounds,
+                grep_path=CONFIG['grep_path'])
+            self.assertCountEqual(locations, searched_locations)
+
+        with self.assertRaises(ValueError):
+            get_locations(LOCATION_NOTES_DIR, bounds=(50, 0, 20, 10),
+                          location_index=self.location_index)
+
+    def test_nearest(self):
+        # From London
+        locations = get_nearest_locations(LOCATION_NOTES_DIR, 51.507, -0.128,
+                                          count=2,
+                                          location_index=self.location_index)
+        assert [location['name'] for location in locations] == \
+            ['', 'The Great Pyramid']
+        assert 300 < locations[0]['distance'] < 400
+
+        searched_locations = get_nearest_locations(
+            LOCATION_NOTES_DIR, 51.507, -0.128, count=2,
+            grep_path=CONFIG['grep_path'])
+        assert searched_locations == locations
+
+    def test_nearest_matches_exhaustive(self):
+        generator = random.Random(7)
+        elements = {'locations': []}
+        for idx in range(500):
+            elements['locations'].append({
+                'latitude': str(generator.uniform(-80, 80)),
+                'longitude': str(generator.uniform(-180, 180)),
+                'name': f'Point {idx}',
+                'file_path': f'/points-{idx % 10}.note',
+                'line_number': str(idx + 1)
+            })
+        location_index = LocationIndex(cell_size=5.0)
+        location_index.load(elements)
+
+        for _ in range(20):
+            latitude = generator.uniform(-80, 80)
+            longitude = generator.uniform(-180, 180)
+            nearest = location_index.get_nearest(latitude, longitude, 5)
+            expected = get_nearest_locations(LOCATION_NOTES_DIR, latitude,
+                                             longitude, count=5,
+                                             elements=elements)
+            assert [location['name'] for location in nearest] == \
+                [location['name'] for location in expected]
+
+    def test_update(self):
+        time.sleep(0.01)
+        with open(LOCATION_NOTES_DIR + '/locations.note', 'w') as note_file:
+            note_file.write('- GPS[51.507, -0.128, London]\n')
+
+        assert self.location_index.update()
+        locations = get_locations(LOCATION_NOTES_DIR,
+                                  location_index=self.location_index)
+        assert [location['name'] for location in locations] == ['London']
+        assert self.location_index.get_locations(
+            bounds=(0, -10, 40, 10)) == []
+
+    def test_clusters(self):
+        # Locations are grouped when zoomed out and kept separate
+        # when zoomed in
+        for zoom, cluster_counts in [(0, [1, 1, 2]), (10, [1, 1, 1, 1])]:
+            clusters = self.location_index.get_clusters(zoom)
+            assert sorted(cluster['count']
+                          for cluster in clusters) == cluster_counts
+            for cluster in clusters:
+                assert len(cluster['locations']) == min(cluster['count'], 3)
+
+            searched_clusters = get_location_clusters(
+                LOCATION_NOTES_DIR, zoom, grep_path=CONFIG['grep_path'])
+            assert searched_clusters == clusters
+
+        assert len(self.location_index.get_clusters(
+            10, bounds=(20, -130, 50, -60))) == 2
+        with self.assertRaises(ValueError):
+            self.location_index.get_clusters(MAX_ZOOM + 1)
+
+    def test_clusters_cached(self):
+        clusters = self.location_index.get_clusters(3)
+        assert self.location_index.get_clusters(3) is clusters
+
+        # Changes to notes without locations keep the cached clusters
+        time.sleep(0.01)
+        with open(LOCATION_NOTES_DIR + '/todos.note', 'a') as note_file:
+            note_file.write('\n[] A brand new todo\n')
+        assert self.location_index.update()
+        assert self.location_index.get_clusters(3) is clusters
+
+        with open(LOCATION_NOTES_DIR + '/locations.note', 'a') as note_file:
+            note_file.write('\n- GPS[51.507, -0.128, London]\n')
+        assert self.location_index.update()
+        new_clusters = self.location_index.get_clusters(3)
+        assert sum(cluster['count'] for cluster in new_clusters) == 5
@@ -1,15 +1,21 @@
 import os
 import re
+import random
 import json
 import logging
 import unittest
+from unittest import mock
 
 import pytest
 
 from shorthand.utils.logging import setup_logging
-from shorthand.rec_tools import get_record_set, get_record_sets
-from shorthand.utils.rec import load_from_string
-from utils import setup_environment
+from shorthand.rec_tools import get_record_set, get_record_sets, \
+                                get_record_set_aggregates, iter_chunks
+from shorthand.utils.rec import load_from_string, load_from_lines, \
+                                load_from_file, load_summary, \
+                                parse_records
+from shorthand.utils.rec_select import parse_expression
+from utils import setup_environment, setup_notes_copy, TEMP_DIR
 
 
 CONFIG = setup_environment()
@@ -75,6 +81,63 @@ class TestRecordParsing(unittest.TestCase):
             assert str(e.value)
 
 
+class TestStreamingParser(unittest.TestCase):
+    """Test parsing rec data in a single pass from a stream of lines"""
+
+    def test_load_from_lines(self):
+        with open('rec_data/valid_records.rec', 'r') as f:
+            valid_record_data = f.read()
+        valid_record_sets = [record_set for record_set
+                             in re.split(r'#.*?\n', valid_record_data)
+                             if record_set.strip()]
+        for valid_record_set in valid_record_sets:
+            lines = (line for line in valid_record_set.split('\n'))
+            record_set = load_from_lines(lines)
+            expected = load_from_string(valid_record_set)
+            assert record_set.get_json() == expected.get_json()
+            assert record_set.get_config() == expected.get_config()
+
+        record_set = load_from_file('rec_data/base_config_with_pk.rec')
+        assert record_set.get_record_count() == 3
+
+    def test_records_yielded_incrementally(self):
+        def generate_lines():
+            yield '%rec: Reading\n'
+            yield '%type: Id int\n'
+            yield '\n'
+            for idx in range(1000000):
+                yield f'Id: {idx}\n'
+                yield 'Note: first line\n'
+                yield '+ second line\n'
+                yield '\n'
+
+        items = parse_records(generate_lines())
+        item_type, config = next(items)
+        assert item_type == 'config'
+        assert config['rec'] == {'name': 'Reading'}
+        assert next(items) == ('record', {
+            'Id': ['0'], 'Note': ['first line\n second line']})
+        assert next(items) == ('record', {
+            'Id': ['1'], 'Note': ['first line\n second line']})
+
+    def test_trailing_record(self):
+        record_set = load_from_string('%rec: Notes\n\nA: 1\n\nA: 2\n+ more')
+        assert list(record_set.all()) == [{'A': ['1']},
+                                          {'A': ['2\n more']}]
+
+    def test_load_summary(self):
+        with open('rec_data/base_config_with_pk.rec', 'r') as f:
+            summary = load_summary(f)
+        assert summary['config']['key'] == 'Id'
+        assert summary['record_count'] == 3
+
+        # Records are only counted, not validated
+        summary = load_summary(['%type: A int', '', 'A: x', '', 'A: y'])
+        assert summary['record_count'] == 2
+        with pytest.raises(ValueError):
+            load_summary(['%rec: A', 'A: 1'])
+
+
 class TestRecordLoad(unittest.TestCase):
     """Test Loading new records into a record set"""
 
@@ -135,6 +198,54 @@ class TestRecordLoad(unittest.TestCase):
         assert len(record_set.records) == 5
 
 
+class TestRecordImport(unittest.TestCase):
+    """Test streaming imports which report errors for each row"""
+
+    def setUp(self):
+        with open('rec_data/base_config_with_pk.rec', 'r') as f:
+            self.record_set = load_from_string(f.read())
+
+    def test_import_csv(self):
+        with open('rec_data/import_data.csv', 'r') as f:
+            report = self.record_set.import_csv(f)
+        assert report == {'inserted': 3, 'failed': 0, 'errors': []}
+        assert len(self.record_set.records) == 5
+
+    def test_import_csv_errors(self):
+        csv_lines = ['Id,Date,Temp,Location\n']
+        for idx in range(10, 2010):
+            temp = 'cold' if idx % 100 == 0 else '50.5'
+            csv_lines.append(f'{idx},2020-01-01,{temp},Boston\n')
+
+        report = self.record_set.import_csv(iter(csv_lines), max_errors=5)
+        assert report['inserted'] == 1980
+        assert report['failed'] == 20
+        assert [error['row'] for error in report['errors']] == \
+            [91, 191, 291, 391, 491]
+        assert 'to a float' in report['errors'][0]['message']
+        assert len(self.record_set.records) == 1983
+
+    def test_import_json_lines(self):
+        json_lines = ['{"Id": "10", "Temp": "1.5"}\n',
+                      '\n',
+                      '{"Id": "11", "Temp": 2}\n',
+                      'not json\n',
+                      '["Id", "12"]\n',
+                      '{"Id": "13", "Other": "field"}\n',
+                      '{"Id": "14", "Date": "2020-01-01"}']
+        report = self.record_set.import_json_lines(json_lines)
+        assert report['inserted'] == 2
+        assert [error['row'] for error in report['errors']] == [3, 4, 5, 6]
+        assert set(self.record_set.records.keys()) == \
+            set(['0', '1', '2', '10', '14'])
+
+    def test_import_size_constraint(self):
+        record_set = load_from_string('%rec: Sized\n%size: 1\n\nA: 1\n')
+        report = record_set.import_json_lines(['{"A": "2"}'])
+        assert report['inserted'] == 1
+        assert report['errors'][0]['row'] is None
+
+
 class TestRecordExport(unittest.TestCase):
     """Test Exporting a record set to various formats"""
 
@@ -182,6 +293,28 @@ class TestRecordExport(unittest.TestCase):
         assert record_set.get_rec() == 'Id: 0\nA: test\nB: test\n\n'\
                                        'Id: 1\nA: test\nB: test'
 
+    def test_json_lines_export(self):
+        '''Test exporting a record set to JSON lines format
+        '''
+        record_set = load_from_file('rec_data/export_test.rec')
+        exported_lines = record_set.get_json_lines().split('\n')
+        assert exported_lines[-1] == ''
+        assert [json.loads(line) for line in exported_lines[:-1]] == \
+            json.loads(record_set.get_json())
+
+    def test_streamed_export(self):
+        '''Test that each format is serialized one record at a time
+        '''
+        record_set = load_from_file('rec_data/base_config_with_pk.rec')
+        assert len(list(record_set.iter_json())) == 5
+        assert len(list(record_set.iter_json_lines())) == 3
+        assert len(list(record_set.iter_csv())) == 3
+        assert len(list(record_set.iter_rec())) == 3
+
+        chunks = list(iter_chunks(record_set.iter_json(), chunk_size=100))
+        assert [len(chunk) >= 100 for chunk in chunks] == [True, False]
+        assert ''.join(chunks) == record_set.get_json()
+
 
 class TestFiltering(object):
     """Test filtering, querying, and sorting record set results"""
@@ -217,7 +350,12 @@ class TestAPI(unittest.TestCase):
                                      grep_path=CONFIG['grep_path'])
         all_sets = [{'display_path': 'rec.note',
                      'file_path': '/rec.note',
-                     'line_number': '4'}]
+                     'line_number': '4',
+                     'start_offset': 77,
+                     'end_offset': 530,
+                     'name': 'SampleRecordSet',
+                     'fields': ['Id', 'Date', 'Temp', 'Location'],
+                     'record_count': 3}]
 
         assert sets_found == all_sets
 
@@ -233,3 +371,386 @@ class TestAPI(unittest.TestCase):
         loaded_record_set = json.loads(loaded_record_set)
 
         assert len(loaded_record_set) == 3
+
+    def test_get_mapped_record_set(self):
+        '''Test that a memory-mapped note gives the same record set
+        '''
+        args = {
+            'file_path': '/rec.note',
+            'line_number': 4,
+            'parse': False
+        }
+        read_record_set = get_record_set(CONFIG['notes_directory'], **args)
+        with mock.patch('shorthand.utils.files.MMAP_MIN_BYTES', 0):
+            mapped_record_set = get_record_set(CONFIG['notes_directory'],
+                                               **args)
+
+        assert mapped_record_set == read_record_set
+        assert mapped_record_set.startswith('%rec')
+
+    def test_get_record_set_wrong_line(self):
+        '''Test getting a record set from a line which doesn't start one
+        '''
+        with pytest.raises(ValueError):
+            get_record_set(CONFIG['notes_directory'], file_path='/rec.note',
+                           line_number=5, parse=False)
+
+    def test_include_config_formats(self):
+        '''Test that config can only be included with the json format
+        '''
+        for parse_format in ['json_lines', 'csv', 'rec']:
+            with pytest.raises(ValueError):
+                get_record_set(CONFIG['notes_directory'],
+                               file_path='/rec.note', line_number=4,
+                               parse_format=parse_format,
+                               include_config=True)
+
+        # Unparsed record sets have no config to include
+        raw_record_set = get_record_set(CONFIG['notes_directory'],
+                                        file_path='/rec.note',
+                                        line_number=4, parse=False,
+                                        parse_format='csv',
+                                        include_config=True)
+        assert raw_record_set.startswith('%rec')
+
+    def test_record_set_catalog(self):
+        '''Test that the listed record sets describe their contents
+        '''
+        record_sets = get_record_sets(CONFIG['notes_directory'],
+                                      grep_path=CONFIG['grep_path'])
+        record_set = [record_set for record_set in record_sets
+                      if record_set['file_path'] == '/rec.note'][0]
+        loaded_record_set = get_record_set(
+            CONFIG['notes_directory'], file_path='/rec.note',
+            line_number=4, include_config=True)
+
+        assert record_set['name'] == 'SampleRecordSet'
+        assert record_set['fields'] == loaded_record_set['fields']
+        assert record_set['record_count'] == \
+            len(loaded_record_set['records'])
+
+        with open(CONFIG['notes_directory'] + '/rec.note', 'rb') as f:
+            note_content = f.read()
+        record_set_content = note_content[record_set['start_offset']:
+                                          record_set['end_offset']]
+        assert record_set_content.startswith(b'```rec-data\n')
+        assert record_set_content.rstrip(b'\n').endswith(b'\n```')
+
+    def test_get_record_set_from_offset(self):
+        '''Test getting a record set by seeking straight to its offset
+        '''
+        record_sets = get_record_sets(CONFIG['notes_directory'],
+                                      grep_path=CONFIG['grep_path'])
+        for record_set in record_sets:
+            args = {
+                'file_path': record_set['file_path'],
+                'line_number': int(record_set['line_number']),
+                'parse': False
+            }
+            assert get_record_set(
+                CONFIG['notes_directory'],
+                start_offset=record_set['start_offset'], **args) == \
+                get_record_set(CONFIG['notes_directory'], **args)
+
+        with pytest.raises(ValueError):
+            get_record_set(CONFIG['notes_directory'], file_path='/rec.note',
+                           line_number=4, parse=False, start_offset=1)
+
+    def test_get_record_set_from_stale_offset(self):
+        '''Test that an offset which starts a different record set than
+        the requested line isn't used to load it
+        '''
+        notes_directory = TEMP_DIR + '/rec_offset_notes'
+        setup_notes_copy(notes_directory)
+        with open(notes_directory + '/two_sets.note', 'w') as note_file:
+            note_file.write('```rec-data\n%rec: First\n\nA: 1\n```\n\n'
+                            '```rec-data\n%rec: Second\n\nB: 2\n```\n')
+        record_sets = [record_set for record_set in get_record_sets(
+                           notes_directory, grep_path=CONFIG['grep_path'])
+                       if record_set['file_path'] == '/two_sets.note']
+        first_set, second_set = sorted(
+            record_sets, key=lambda record_set: record_set['start_offset'])
+
+        assert get_record_set(notes_directory, file_path='/two_sets.note',
+                              line_number=int(second_set['line_number']),
+                              parse=False,
+                              start_offset=second_set['start_offset']) == \
+            '%rec: Second\n\nB: 2'
+        with pytest.raises(ValueError):
+            get_record_set(notes_directory, file_path='/two_sets.note',
+                           line_number=int(first_set['line_number']),
+                           parse=False,
+                           start_offset=second_set['start_offset'])
+
+    def test_select_record_set(self):
+        '''Test selecting and projecting records within a record set
+        '''
+        loaded_record_set = get_record_set(CONFIG['notes_directory'],
+                                           file_path='/rec.note',
+                                           line_number=4,
+                                           parse_format='csv',
+                                           select='Temp > 50',
+                                           fields=['Id', 'Temp'])
+        assert loaded_record_set.split('\r\n')[0] == 'Id,Temp'
+        assert len(loaded_record_set.split('\r\n')) == 4
+
+    def test_record_set_aggregates(self):
+        '''Test aggregating the records within a record set
+        '''
+        aggregates = get_record_set_aggregates(
+            CONFIG['notes_directory'], file_path='/rec.note',
+            line_number=4, aggregations=['count', 'max(Temp)'],
+            select='Temp < 70')
+        assert aggregates == [{'count': 2, 'max(Temp)': 65.2}]
+
+        with pytest.raises(ValueError):
+            get_record_set_aggregates(CONFIG['notes_directory'],
+                                      file_path='/rec.note', line_number=4,
+                                      aggregations=[])
+
+    def test_stream_record_set(self):
+        '''Test streaming a record set in each format
+        '''
+        for parse_format in ['json', 'json_lines', 'csv', 'rec']:
+            args = {
+                'file_path': '/rec.note',
+                'line_number': 4,
+                'parse_format': parse_format
+            }
+            chunks = get_record_set(CONFIG['notes_directory'], stream=True,
+                                    **args)
+            assert not isinstance(chunks, str)
+            assert ''.join(chunks) == \
+                get_record_set(CONFIG['notes_directory'], **args)
+
+        with pytest.raises(ValueError):
+            get_record_set(CONFIG['notes_directory'], file_path='/rec.note',
+                           line_number=4, parse_format='xml', stream=True)
+
+
+class TestSelection(unittest.TestCase):
+    """Test selecting records with recsel style expressions"""
+
+    def setUp(self):
+        self.record_set = load_from_file('rec_data/base_config_with_pk.rec')
+
+    def get_ids(self, expression, record_set=None):
+        record_set = record_set or self.record_set
+        return [record['Id'][0] for record in record_set.select(expression)]
+
+    def test_select(self):
+        for expression, ids in [
+                ('Temp >= 50', [0, 2]),
+                ('Temp>50&&Temp<70', [2]),
+                ("Id = 1 || Location ~ 'TX$'", [1, 2]),
+                ('!(Id < 1) && Temp < 70', [1, 2]),
+                ('Date > 2019-03-01', [1, 2]),
+                ('Date = "2019-03-12T00:00:00"', [1]),
+                ('Location = "New York, NY"', [1]),
+                ('Location != "New York, NY"', [0, 2]),
+                ('Other = 1', [])]:
+            assert self.get_ids(expression) == ids, expression
+
+        for expression in ['Temp >', 'Id = x', '(Id = 1', '= 3',
+                           'Id = 1 Temp', 'Location ~ "("']:
+            with pytest.raises(ValueError):
+                self.record_set.select(expression)
+
+    def test_projection(self):
+        records = self.record_set.select('Temp > 60',
+                                         fields=['Location', 'Temp'])
+        assert list(records) == [
+            {'Location': ['San Francisco, CA'], 'Temp': [73.1]},
+            {'Location': ['Austin, TX'], 'Temp': [65.2]}]
+
+    def test_indexes(self):
+        assert self.record_set.get_index_type('Id') == 'hash'
+        assert self.record_set.get_index_type('Temp') == 'sorted'
+        assert self.record_set.get_index_type('Location') is None
+
+        self.record_set.create_index('Location')
+        assert self.get_ids('Location = "Austin, TX"') == [2]
+        assert set(self.record_set.indexes.keys()) == set(['Location'])
+        with pytest.raises(ValueError):
+            self.record_set.create_index('Location', 'bitmap')
+
+        # Indexes are rebuilt after records are inserted
+        self.record_set.insert_record({'Id': ['3'], 'Temp': ['90.5'],
+                                       'Location': ['Austin, TX']})
+        assert self.record_set.indexes == {}
+        assert self.get_ids('Location = "Austin, TX" && Temp > 70') == [3]
+
+    def test_indexes_match_scan(self):
+        generator = random.Random(11)
+        lines = ['%rec: Reading', '%key: Id', '%unique: Code',
+                 '%type: Id int', '%type: Value real', '%type: Day date']
+        for idx in range(300):
+            lines += ['', f'Id: {idx}', f'Code: C{idx % 50}',
+                      f'Value: {generator.uniform(0, 100):.1f}',
+                      f'Day: 2020-01-{generator.randint(1, 28):02d}',
+                      f'Tag: {generator.choice(["a", "b", "c"])}']
+        for columnar in [False, True]:
+            record_set = load_from_lines(lines, columnar=columnar)
+            for _ in range(50):
+                comparisons = [
+                    f'Value {generator.choice(["<", "<=", ">", ">="])} '
+                    f'{generator.uniform(0, 100):.1f}',
+                    f'Day = 2020-01-{generator.randint(1, 28):02d}',
+                    f'Code = C{generator.randint(0, 49)}',
+                    f'Tag = {generator.choice(["a", "b"])}']
+                expression = f'({generator.choice(comparisons)} || ' \
+                             f'{generator.choice(comparisons)}) && ' \
+                             f'!{generator.choice(comparisons)}'
+
+                condition = parse_expression(expression)
+                condition.prepare(record_set)
+                expected = [record['Id'][0]
+                            for record in record_set.all()
+                            if condition.matches(record)]
+                assert self.get_ids(expression, record_set) == expected
+
+
+class TestAggregation(unittest.TestCase):
+    """Test aggregating records into summary values"""
+
+    def setUp(self):
+        lines = ['%rec: Expense', '%type: Amount real', '%type: Items int']
+        for category, amount, items in [('Food', 12.5, 2), ('Rent', 900, 1),
+                                        ('Food', 7.5, 4), ('Fun', 30, 3),
+                                        ('Food', 20, 1)]:
+            lines += ['', f'Category: {category}', f'Amount: {amount}',
+                      f'Items: {items}']
+        lines += ['', 'Category: Fun']
+        self.lines = lines
+
+    def test_aggregate(self):
+        for columnar in [False, True]:
+            record_set = load_from_lines(self.lines, columnar=columnar)
+            assert record_set.aggregate(
+                ['count', 'sum(Amount)', 'avg(Amount)', 'min(Items)',
+                 'max(Items)', 'p50(Amount)', 'p25(Amount)',
+                 'count(Amount)']) == [{
+                    'count': 6, 'sum(Amount)': 970.0, 'avg(Amount)': 194.0,
+                    'min(Items)': 1, 'max(Items)': 4, 'p50(Amount)': 20.0,
+                    'p25(Amount)': 12.5, 'count(Amount)': 5}]
+
+    def test_group_by(self):
+        for columnar in [False, True]:
+            record_set = load_from_lines(self.lines, columnar=columnar)
+            assert record_set.aggregate(
+                ['count', 'sum(Amount)', 'max(Amount)'],
+                group_by=['Category']) == [
+                    {'Category': 'Food', 'count': 3, 'sum(Amount)': 40.0,
+                     'max(Amount)': 20.0},
+                    {'Category': 'Rent', 'count': 1, 'sum(Amount)': 900.0,
+                     'max(Amount)': 900.0},
+                    {'Category': 'Fun', 'count': 2, 'sum(Amount)': 30.0,
+                     'max(Amount)': 30.0}]
+
+            assert record_set.aggregate(
+                ['count', 'avg(Amount)'], group_by=['Category', 'Items'],
+                expression='Amount < 100 && Category = Food') == [
+                    {'Category': 'Food', 'Items': 2, 'count': 1,
+                     'avg(Amount)': 12.5},
+                    {'Category': 'Food', 'Items': 4, 'count': 1,
+                     'avg(Amount)': 7.5},
+                    {'Category': 'Food', 'Items': 1, 'count': 1,
+                     'avg(Amount)': 20.0}]
+
+    def test_empty(self):
+        record_set = load_from_lines(self.lines)
+        assert record_set.aggregate(['count', 'sum(Amount)', 'p90(Amount)'],
+                                    expression='Amount > 1000') == [
+            {'count': 0, 'sum(Amount)': 0, 'p90(Amount)': None}]
+        assert record_set.aggregate(['count'], group_by=['Category'],
+                                    expression='Amount > 1000') == []
+
+    def test_invalid_aggregations(self):
+        record_set = load_from_lines(self.lines)
+        for aggregation in ['sum(Category)', 'sum', 'median(Amount)',
+                            'p101(Amount)', 'sum(Amount']:
+            with pytest.raises(ValueError):
+                record_set.aggregate([aggregation])
+
+
+class TestColumnarStorage(unittest.TestCase):
+    """Test that columnar record sets give the same output"""
+
+    def assert_same_output(self, record_data):
+        record_set = load_from_string(record_data)
+        columnar_record_set = load_from_string(record_data, columnar=True)
+        assert list(columnar_record_set.all()) == list(record_set.all())
+        assert columnar_record_set.get_json() == record_set.get_json()
+        assert columnar_record_set.get_csv() == record_set.get_csv()
+        assert columnar_record_set.get_rec() == record_set.get_rec()
+        assert columnar_record_set.get_fields() == record_set.get_fields()
+
+    def test_valid_records(self):
+        with open('rec_data/valid_records.rec', 'r') as f:
+            valid_record_data = f.read()
+        valid_record_sets = re.split(r'#.*?\n', valid_record_data)
+        for valid_record_set in valid_record_sets:
+            if valid_record_set.strip():
+                self.assert_same_output(valid_record_set)
+
+    def test_mixed_records(self):
+        '''Test records with missing, repeated, reordered, and
+        replaced fields
+        '''
+        self.assert_same_output(
+            '%rec: Mixed\n%key: Id\n%type: Id int\n%type: Score real\n'
+            '%type: Big int\n\n'
+            'Id: 1\nScore: 1.5\nTag: a\nTag: b\n\n'
+            'Tag: c\nId: 2\n\n'
+            'Id: 3\nScore: 2\nBig: 99999999999999999999\n\n'
+            'Id: 1\nScore: 3.25\n')
+
+
+class TestValidators(unittest.TestCase):
+    """Test the validators compiled from the record set config"""
+
+    def test_custom_type_chain(self):
+        '''Test that fields of custom types defined as other custom
+        types are validated as the type at the end of the chain
+        '''
+        record_set = load_from_string(
+            '%rec: Chain\n%typedef: small range 0 10\n'
+            '%typedef: score small\n%type: Score score\n\n'
+            'Score: 0x5\n')
+        assert list(record_set.all()) == [{'Score': [5]}]
+
+        with pytest.raises(ValueError) as e:
+            load_from_string(
+                '%rec: Chain\n%typedef: small range 0 10\n'
+                '%typedef: score small\n%type: Score score\n\n'
+                'Score: 11\n')
+        assert 'exceeds the maximum range value 10' in str(e.value)
+
+    def test_dates(self):
+        '''Test that ISO and other dates are both accepted
+        '''
+        record_set = load_from_string(
+            '%rec: Dates\n%type: Date date\n\n'
+            'Date: 2024-02-09\n\nDate: 2024-02-09 10:30\n\n'
+            'Date: Feb 9 2024\n')
+        assert len(record_set.records) == 3
+
+        with pytest.raises(ValueError) as e:
+            load_from_string('%rec: Dates\n%type: Date date\n\n'
+                             'Date: not a date\n')
+        assert 'cannot parse date value "not a date"' in str(e.value)
+
+    def test_validators_compiled_once(self):
+        '''Test that types are looked up once rather than per record
+        '''
+        record_set = load_from_string(
+            '%rec: Compiled\n%type: Code regexp /^[A-Z]+$/\n\n'
+            'Code: ABC\n')
+        with mock.patch.object(record_set, 'get_field_type') as \
+                mock_get_field_type:
+            record_set.insert_json('[{"Code": "DEF"}, {"Code": "GHI"}]')
+        assert mock_get_field_type.call_count == 0
+        assert len(record_set.records) == 3
+
+        with pytest.raises(ValueError):
+            record_set.insert_json('[{"Code": "lower"}]')
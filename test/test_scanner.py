@@ -0,0 +1,157 @@
+import os
+import logging
+import unittest
+from unittest import mock
+
+from shorthand.todo_tools import get_todos
+from shorthand.question_tools import get_questions
+from shorthand.tag_tools import get_tags
+from shorthand.definition_tools import get_definitions
+from shorthand.gps_tools import get_locations
+from shorthand.rec_tools import get_record_sets
+from shorthand.calendar_tools import get_calendar
+from shorthand.utils.scanner import scan_notes, scan_content, \
+    ELEMENT_TYPES
+from shorthand.utils.logging import setup_logging
+
+from utils import setup_environment
+from model import ShorthandModel
+from results_unstamped import ALL_DEFINITIONS, ALL_LOCATIONS
+
+
+CONFIG = setup_environment()
+setup_logging(CONFIG)
+log = logging.getLogger(__name__)
+MODEL = ShorthandModel()
+
+
+class TestScanner(unittest.TestCase):
+    """Test serving all tools from a single scan of the notes"""
+
+    maxDiff = None
+
+    def setUp(self):
+        self.elements = scan_notes(CONFIG['notes_directory'])
+
+    def test_setup(self):
+
+        test_dir = CONFIG['notes_directory']
+        assert os.path.exists(test_dir)
+
+    def test_element_types(self):
+        assert set(self.elements.keys()) == set(ELEMENT_TYPES)
+
+    def test_parallel_scan(self):
+        with mock.patch('shorthand.utils.scanner.PARALLEL_SCAN_MIN_FILES', 0):
+            parallel_elements = scan_notes(CONFIG['notes_directory'],
+                                           workers=2)
+        self.assertEqual(parallel_elements, self.elements)
+
+    def test_mapped_scan(self):
+        with mock.patch('shorthand.utils.files.MMAP_MIN_BYTES', 0):
+            mapped_elements = scan_notes(CONFIG['notes_directory'],
+                                         workers=1)
+        self.assertEqual(mapped_elements, self.elements)
+
+    def test_directory_filter(self):
+        filtered_elements = scan_notes(CONFIG['notes_directory'],
+                                       directory_filter='section')
+        for element_type in ELEMENT_TYPES:
+            for element in filtered_elements[element_type]:
+                assert element['file_path'].startswith('/section/')
+
+    def test_scanned_todos(self):
+        for todo_status in ['incomplete', 'skipped', 'complete']:
+            for directory_filter in [None, 'section']:
+                for query_string in [None, 'cooking', '"follow up"']:
+                    args = {
+                        'todo_status': todo_status,
+                        'directory_filter': directory_filter,
+                        'query_string': query_string
+                    }
+                    library_results = get_todos(
+                        notes_directory=CONFIG['notes_directory'],
+                        suppress_future=False, elements=self.elements,
+                        **args)
+                    self.assertCountEqual(library_results,
+                                          MODEL.search_todos(**args))
+
+    def test_scanned_todo_regex_query(self):
+        # Query components are grep basic regexes for both sources, which
+        # match the whole line including its stamps and status marker
+        for query_string in ['cook.*times', 'spec[a-z]*c', 'Some.*do$',
+                             '"follow.up"', "'tim\\(e\\|es\\)'",
+                             '2019-05-30', "'^ *\\[\\] '", ':future:$']:
+            for case_sensitive in [False, True]:
+                args = {
+                    'todo_status': 'incomplete',
+                    'query_string': query_string,
+                    'case_sensitive': case_sensitive,
+                    'suppress_future': False
+                }
+                scanned_results = get_todos(
+                    notes_directory=CONFIG['notes_directory'],
+                    elements=self.elements, **args)
+                searched_results = get_todos(
+                    notes_directory=CONFIG['notes_directory'],
+                    grep_path=CONFIG['grep_path'], **args)
+                assert scanned_results, query_string
+                self.assertCountEqual(scanned_results, searched_results)
+
+    def test_scanned_questions(self):
+        for question_status in ['all', 'answered', 'unanswered']:
+            for directory_filter in [None, 'section']:
+                library_results = get_questions(
+                    notes_directory=CONFIG['notes_directory'],
+                    question_status=question_status,
+                    directory_filter=directory_filter,
+                    elements=self.elements)
+                model_results = MODEL.search_questions(
+                    question_status=question_status,
+                    directory_filter=directory_filter)
+                self.assertCountEqual(library_results, model_results)
+
+    def test_scanned_tags(self):
+        self.assertCountEqual(
+            get_tags(CONFIG['notes_directory'], elements=self.elements),
+            get_tags(CONFIG['notes_directory'],
+                     grep_path=CONFIG['grep_path']))
+
+    def test_scanned_definitions(self):
+        self.assertCountEqual(
+            get_definitions(CONFIG['notes_directory'],
+                            elements=self.elements),
+            ALL_DEFINITIONS)
+
+    def test_scanned_locations(self):
+        self.assertCountEqual(
+            get_locations(CONFIG['notes_directory'], elements=self.elements),
+            ALL_LOCATIONS)
+
+    def test_scanned_record_sets(self):
+        self.assertCountEqual(
+            get_record_sets(CONFIG['notes_directory'],
+                            elements=self.elements),
+            get_record_sets(CONFIG['notes_directory'],
+                            grep_path=CONFIG['grep_path']))
+
+    def test_scanned_calendar(self):
+        self.assertEqual(
+            get_calendar(CONFIG['notes_directory'], elements=self.elements),
+            get_calendar(CONFIG['notes_directory'],
+                         grep_path=CONFIG['grep_path']))
+
+    def test_prose_is_skipped(self):
+        prose = b'Plain prose, with no elements in it\n\xff\xfe\n'
+        self.assertEqual(scan_content('/prose.note', prose),
+                         {element_type: [] for element_type in ELEMENT_TYPES})
+
+    def test_prefiltered_lines(self):
+        content = b'Some prose\n[] Caf\xc3\xa9 visit :food:\n' \
+                  b'? Why\n@ Because\n# Trip 2020-01-02\n'
+        elements = scan_content('/mixed.note', content)
+        self.assertEqual([todo['todo_text'] for todo in elements['todos']],
+                         ['Caf\u00e9 visit'])
+        self.assertEqual([tag['tag'] for tag in elements['tags']], ['food'])
+        self.assertEqual(elements['questions'][0]['answer'], 'Because')
+        self.assertEqual(elements['headings'][0]['line_number'], '5')
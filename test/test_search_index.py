@@ -0,0 +1,142 @@
+import os
+import logging
+import unittest
+from unittest import mock
+
+from shorthand.search_tools import search_notes
+from shorthand.utils.search_index import SearchIndex, parse_query
+from shorthand.utils.logging import setup_logging
+
+from utils import setup_environment, setup_notes_copy, TEMP_DIR
+
+
+CONFIG = setup_environment()
+setup_logging(CONFIG)
+log = logging.getLogger(__name__)
+
+SEARCH_NOTES_DIR = TEMP_DIR + '/search_index_notes'
+
+
+class TestSearchIndex(unittest.TestCase):
+    """Test the positional inverted search index"""
+
+    def setUp(self):
+        setup_notes_copy(SEARCH_NOTES_DIR)
+        self.index = SearchIndex(SEARCH_NOTES_DIR)
+
+    def search(self, query_string, case_sensitive=False):
+        return search_notes(SEARCH_NOTES_DIR, query_string,
+                            case_sensitive=case_sensitive,
+                            search_index=self.index)
+
+    def search_ranked(self, query_string, rank=False, limit=None):
+        return search_notes(SEARCH_NOTES_DIR, query_string,
+                            search_index=self.index, rank=rank, limit=limit)
+
+    def test_parse_query(self):
+        self.assertEqual(parse_query('food "balanced diet"'), [
+            {'type': 'phrase', 'tokens': ['food']},
+            {'type': 'phrase', 'tokens': ['balanced', 'diet']}])
+        self.assertEqual(parse_query('food NEAR/3 diet'), [
+            {'type': 'near', 'operands': [['food'], ['diet']],
+             'distance': 3}])
+        with self.assertRaises(ValueError):
+            parse_query('NEAR/3 diet')
+
+    def test_matches_grep(self):
+        for query_string in ['food', 'cereal', 'balanced diet']:
+            index_results = self.search(query_string)
+            grep_results = search_notes(SEARCH_NOTES_DIR, query_string,
+                                        grep_path=CONFIG['grep_path'])
+            self.assertCountEqual(index_results['items'],
+                                  grep_results['items'])
+            self.assertEqual(index_results['count'], grep_results['count'])
+
+    def test_case_sensitive(self):
+        results = self.search('Food', case_sensitive=True)
+        self.assertEqual([item['match_content'] for item in results['items']],
+                         ['Food is an essential part of a balanced diet'])
+
+    def test_phrase(self):
+        assert self.search('"balanced diet"')['count'] == 1
+        assert self.search('"diet balanced"')['count'] == 0
+
+    def test_near(self):
+        assert self.search('food NEAR/8 diet')['count'] == 1
+        assert self.search('food NEAR/7 diet')['count'] == 0
+        assert self.search('diet NEAR/8 food')['count'] == 1
+
+    def test_refresh(self):
+        assert self.search('zucchini')['count'] == 0
+
+        note_path = SEARCH_NOTES_DIR + '/section/mixed.note'
+        with open(note_path, 'a') as note_file_object:
+            note_file_object.write('\nGrow some zucchini this year\n')
+        assert self.search('zucchini')['count'] == 1
+
+        os.remove(note_path)
+        assert self.search('zucchini')['count'] == 0
+        assert self.search('baking')['count'] == 0
+
+    def test_watched_refresh(self):
+        # A watched index is only refreshed with the changed paths
+        self.index.refresh()
+        note_path = SEARCH_NOTES_DIR + '/section/mixed.note'
+        with open(note_path, 'a') as note_file_object:
+            note_file_object.write('\nGrow some zucchini this year\n')
+
+        with mock.patch('shorthand.utils.search_index.get_file_stats') \
+                as get_file_stats:
+            results = search_notes(SEARCH_NOTES_DIR, 'zucchini',
+                                   search_index=self.index, refresh=False)
+            assert results['count'] == 0
+            get_file_stats.assert_not_called()
+
+        self.index.refresh(paths=[note_path])
+        results = search_notes(SEARCH_NOTES_DIR, 'zucchini',
+                               search_index=self.index, refresh=False)
+        assert results['count'] == 1
+
+    def test_rank(self):
+        results = self.search_ranked('food', rank=True)
+        self.assertEqual(results['count'], self.search('food')['count'])
+        scores = [item['score'] for item in results['items']]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+        # Shorter lines with the same term are more relevant
+        shortest_line = min([item['match_content']
+                             for item in results['items']], key=len)
+        self.assertEqual(results['items'][0]['match_content'], shortest_line)
+
+    def test_limit(self):
+        all_results = self.search_ranked('food', rank=True)
+        top_results = self.search_ranked('food', rank=True, limit=2)
+        self.assertEqual(top_results['count'], all_results['count'])
+        self.assertEqual(top_results['items'], all_results['items'][:2])
+
+        unranked_results = self.search_ranked('food', limit=1)
+        self.assertEqual(len(unranked_results['items']), 1)
+        self.assertEqual(unranked_results['count'], all_results['count'])
+
+    def test_rank_requires_index(self):
+        with self.assertRaises(ValueError):
+            search_notes(SEARCH_NOTES_DIR, 'food', rank=True)
+
+    def test_incremental_statistics(self):
+        self.index.refresh()
+        total_lines = self.index.total_lines
+        total_line_tokens = self.index.total_line_tokens
+        line_frequencies = dict(self.index.line_frequencies)
+
+        # Re-indexing a file leaves the corpus statistics unchanged
+        for file_path in list(self.index.file_lines.keys()):
+            self.index.add_file(file_path, self.index.file_lines[file_path])
+        self.assertEqual(self.index.total_lines, total_lines)
+        self.assertEqual(self.index.total_line_tokens, total_line_tokens)
+        self.assertEqual(self.index.line_frequencies, line_frequencies)
+
+        for file_path in list(self.index.file_lines.keys()):
+            self.index.remove_file(file_path)
+        self.assertEqual(self.index.total_lines, 0)
+        self.assertEqual(self.index.total_line_tokens, 0)
+        self.assertEqual(self.index.line_frequencies, {})
@@ -1,9 +1,13 @@
 import os
 import logging
+import tempfile
 import unittest
+from unittest import mock
 
 from shorthand.utils.logging import setup_logging
-from shorthand.todo_tools import get_todos
+from shorthand.todo_tools import get_todos, iter_todos, mark_todo
+from shorthand.backends import PythonBackend
+from shorthand.utils.scanner import scan_notes
 from shorthand.stamping import stamp_notes
 
 from utils import setup_environment
@@ -113,6 +117,81 @@ class TestTodoStamping(unittest.TestCase):
         pass
 
 
+class TestPaginatedTodos(unittest.TestCase):
+    """Test getting a single page of todos"""
+
+    def get_sources(self):
+        return [
+            {'grep_path': CONFIG['grep_path']},
+            {'backend': PythonBackend()},
+            {'elements': scan_notes(CONFIG['notes_directory'])}
+        ]
+
+    def test_unsorted_pages(self):
+        for source in self.get_sources():
+            all_todos = get_todos(CONFIG['notes_directory'], 'incomplete',
+                                  suppress_future=False, **source)
+            for offset in [0, 2, len(all_todos)]:
+                page = get_todos(CONFIG['notes_directory'], 'incomplete',
+                                 suppress_future=False, limit=3,
+                                 offset=offset, **source)
+                assert page == all_todos[offset:offset + 3]
+
+    def test_sorted_pages(self):
+        for source in self.get_sources():
+            all_todos = get_todos(CONFIG['notes_directory'], 'complete',
+                                  sort_by='start_date',
+                                  suppress_future=False, **source)
+            page = get_todos(CONFIG['notes_directory'], 'complete',
+                             sort_by='start_date', suppress_future=False,
+                             limit=2, offset=1, **source)
+            assert page == all_todos[1:3]
+
+    def test_early_termination(self):
+        todos = iter_todos(CONFIG['notes_directory'], 'incomplete',
+                           suppress_future=False,
+                           grep_path=CONFIG['grep_path'])
+        first_todo = next(todos)
+        todos.close()
+        assert first_todo['status'] == 'incomplete'
+
+    def test_invalid_sort(self):
+        with self.assertRaises(ValueError):
+            get_todos(CONFIG['notes_directory'], sort_by='todo_text',
+                      limit=1, grep_path=CONFIG['grep_path'])
+
+
+class TestMarkTodo(unittest.TestCase):
+    """Test changing the status of a single todo"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.note_path = self.temp_dir.name + '/todos.note'
+        with open(self.note_path, 'w') as note_file_object:
+            note_file_object.write('# Todos\n[ ] Mow the lawn\n'
+                                   '[] Water the plants\nLast line\n')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def read_note(self):
+        with open(self.note_path, 'r') as note_file_object:
+            return note_file_object.read()
+
+    def test_mark_in_place(self):
+        line = mark_todo(self.note_path, 2, 'complete')
+        assert line == '[X] Mow the lawn'
+        assert self.read_note() == '# Todos\n[X] Mow the lawn\n' \
+                                   '[] Water the plants\nLast line\n'
+
+    def test_mark_resized(self):
+        with mock.patch('shorthand.utils.files.MMAP_MIN_BYTES', 0):
+            line = mark_todo(self.note_path, 3, 'skipped')
+        assert line == '[S] Water the plants'
+        assert self.read_note() == '# Todos\n[ ] Mow the lawn\n' \
+                                   '[S] Water the plants\nLast line\n'
+
+
 class TestStampedTodos(unittest.TestCase):
     """Repeat all tests for unstamped todos to ensure that
        nothing unexpected has changed.
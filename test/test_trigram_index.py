@@ -0,0 +1,116 @@
+import os
+import logging
+import unittest
+from unittest import mock
+
+from shorthand.search_tools import search_notes
+from shorthand.utils.trigram_index import TrigramIndex, \
+    translate_grep_pattern, get_required_literals
+from shorthand.utils.logging import setup_logging
+
+from utils import setup_environment, setup_notes_copy, TEMP_DIR
+
+
+CONFIG = setup_environment()
+setup_logging(CONFIG)
+log = logging.getLogger(__name__)
+
+TRIGRAM_NOTES_DIR = TEMP_DIR + '/trigram_index_notes'
+
+GREP_QUERIES = [
+    'food',
+    'Food',
+    'ood',
+    'balanced diet',
+    '"balanced diet"',
+    'cook.*time',
+    'GPS[',
+    ':food:',
+    '^#',
+    '^[^ ]*$',
+    'the$',
+    'a\\|b',
+    'co\\{2\\}',
+    '[[:digit:]]\\{4\\}-',
+    'notes? (',
+    '[]',
+    'x*',
+    'definitely not in the notes',
+]
+
+
+class TestTrigramIndex(unittest.TestCase):
+    """Test the trigram search index"""
+
+    maxDiff = None
+
+    def setUp(self):
+        setup_notes_copy(TRIGRAM_NOTES_DIR)
+        self.index = TrigramIndex(TRIGRAM_NOTES_DIR)
+
+    def test_translate_grep_pattern(self):
+        self.assertEqual(translate_grep_pattern('a+b?(c)'),
+                         'a\\+b\\?\\(c\\)')
+        self.assertEqual(translate_grep_pattern('\\(ab\\)\\{2\\}'),
+                         '(ab){2}')
+        self.assertEqual(translate_grep_pattern('*a^b$c$'), '\\*a\\^b\\$c$')
+
+    def test_required_literals(self):
+        self.assertEqual(get_required_literals('abc.*def'), ['abc', 'def'])
+        self.assertEqual(get_required_literals('abcd?e'), ['abc', 'e'])
+        self.assertEqual(get_required_literals('ab(cd)*ef'), ['ab', 'ef'])
+        self.assertEqual(get_required_literals('[xyz]abc{1,2}'), ['ab'])
+        self.assertEqual(get_required_literals('abc|def'), [])
+
+    def test_matches_grep(self):
+        for case_sensitive in [False, True]:
+            for query_string in GREP_QUERIES:
+                index_results = search_notes(
+                    TRIGRAM_NOTES_DIR, query_string,
+                    case_sensitive=case_sensitive, search_index=self.index)
+                grep_results = search_notes(
+                    TRIGRAM_NOTES_DIR, query_string,
+                    case_sensitive=case_sensitive,
+                    grep_path=CONFIG['grep_path'])
+                self.assertCountEqual(index_results['items'],
+                                      grep_results['items'],
+                                      msg=query_string)
+                self.assertEqual(index_results['count'],
+                                 grep_results['count'])
+
+    def test_refresh(self):
+        assert search_notes(TRIGRAM_NOTES_DIR, 'zucchini',
+                            search_index=self.index)['count'] == 0
+
+        note_path = TRIGRAM_NOTES_DIR + '/section/mixed.note'
+        with open(note_path, 'a') as note_file_object:
+            note_file_object.write('\nGrow some zucchini this year\n')
+        assert search_notes(TRIGRAM_NOTES_DIR, 'zucchini',
+                            search_index=self.index)['count'] == 1
+
+        os.remove(note_path)
+        assert search_notes(TRIGRAM_NOTES_DIR, 'zucchini',
+                            search_index=self.index)['count'] == 0
+
+    def test_watched_refresh(self):
+        self.index.refresh()
+        note_path = TRIGRAM_NOTES_DIR + '/section/mixed.note'
+        with open(note_path, 'a') as note_file_object:
+            note_file_object.write('\nGrow some zucchini this year\n')
+
+        with mock.patch('shorthand.utils.search_index.get_file_stats') \
+                as get_file_stats:
+            results = search_notes(TRIGRAM_NOTES_DIR, 'zucc.*ini',
+                                   search_index=self.index, refresh=False)
+            assert results['count'] == 0
+            get_file_stats.assert_not_called()
+
+        self.index.refresh(paths=[note_path])
+        results = search_notes(TRIGRAM_NOTES_DIR, 'zucc.*ini',
+                               search_index=self.index, refresh=False)
+        assert results['count'] == 1
+
+    def test_no_ranking(self):
+        with self.assertRaises(ValueError):
+            search_notes(TRIGRAM_NOTES_DIR, 'food', search_index=self.index,
+                         rank=True)
@@ -0,0 +1,100 @@
+import os
+import time
+import logging
+import unittest
+import threading
+
+from shorthand.stamping import stamp_notes
+from shorthand.utils.watcher import NotesWatcher
+from shorthand.utils.logging import setup_logging
+
+from utils import setup_environment, setup_notes_copy, TEMP_DIR
+
+
+CONFIG = setup_environment()
+setup_logging(CONFIG)
+log = logging.getLogger(__name__)
+
+WATCH_NOTES_DIR = TEMP_DIR + '/watch_notes'
+
+
+class TestWatcher(unittest.TestCase):
+    """Test watching the notes directory for changes"""
+
+    def setUp(self):
+        setup_notes_copy(WATCH_NOTES_DIR)
+        self.batches = []
+        self.batch_event = threading.Event()
+
+    def record_batch(self, changed_paths):
+        self.batches.append(changed_paths)
+        self.batch_event.set()
+
+    def start_watcher(self):
+        watcher = NotesWatcher(WATCH_NOTES_DIR, self.record_batch,
+                               debounce_seconds=0.1)
+        watcher.start()
+        thread = threading.Thread(target=watcher.run,
+                                  kwargs={'poll_seconds': 0.1})
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(watcher.stop)
+        return watcher
+
+    def test_stamp_paths(self):
+        stamped_path = WATCH_NOTES_DIR + '/todos.note'
+        other_path = WATCH_NOTES_DIR + '/questions.note'
+        with open(other_path, 'r') as other_file_object:
+            other_content = other_file_object.read()
+
+        changes = stamp_notes(WATCH_NOTES_DIR, paths=['/todos.note'])
+        self.assertEqual(list(changes.keys()), [stamped_path])
+
+        # Files which weren't passed in are left alone
+        with open(other_path, 'r') as other_file_object:
+            self.assertEqual(other_file_object.read(), other_content)
+
+        # Nothing is left to stamp, and the file is not rewritten
+        modified_time = os.stat(stamped_path).st_mtime_ns
+        self.assertEqual(stamp_notes(WATCH_NOTES_DIR, paths=[stamped_path]),
+                         {})
+        self.assertEqual(os.stat(stamped_path).st_mtime_ns, modified_time)
+
+    def test_debounced_changes(self):
+        self.start_watcher()
+
+        note_path = WATCH_NOTES_DIR + '/section/mixed.note'
+        for idx in range(5):
+            with open(note_path, 'a') as note_file_object:
+                note_file_object.write(f'\nLine {idx}\n')
+        with open(WATCH_NOTES_DIR + '/section/ignored.txt', 'w') as \
+                text_file_object:
+            text_file_object.write('Not a note')
+
+        assert self.batch_event.wait(5)
+        self.assertEqual(self.batches, [[note_path]])
+
+    def test_new_directory(self):
+        self.start_watcher()
+
+        new_directory = WATCH_NOTES_DIR + '/new_section'
+        os.makedirs(new_directory)
+        # Give the watcher time to start watching the new directory
+        time.sleep(0.3)
+        self.batch_event.clear()
+
+        note_path = new_directory + '/new.note'
+        with open(note_path, 'w') as note_file_object:
+            note_file_object.write('[] A new todo\n')
+
+        assert self.batch_event.wait(5)
+        self.assertIn(note_path, self.batches[-1])
+
+    def test_removed_note(self):
+        self.start_watcher()
+
+        note_path = WATCH_NOTES_DIR + '/locations.note'
+        os.remove(note_path)
+
+        assert self.batch_event.wait(5)
+        self.assertEqual(self.batches, [[note_path]])
@@ -2,6 +2,8 @@ import os
 import shutil
 from pathlib import Path
 
+from shorthand.utils.element_index import ElementIndex
+
 
 SAMPLE_DATA_DIR = 'sample_data'
 TEMP_DIR = os.path.dirname(os.path.realpath(__file__)) + '/temp'
@@ -25,3 +27,17 @@ def setup_environment():
         Path(CACHE_DIR + '/recent_files.txt').touch()
         shutil.copytree(SAMPLE_DATA_DIR, NOTES_DIR)
     return TEST_CONFIG
+
+
+def setup_notes_copy(notes_directory, cache_directory=None):
+    # Work on a separate copy of the notes so that other tests are not
+    # affected by changes, along with an element index over the copy
+    # when a cache directory is given
+    for directory in [notes_directory, cache_directory]:
+        if directory and os.path.exists(directory):
+            shutil.rmtree(directory)
+    shutil.copytree(SAMPLE_DATA_DIR, notes_directory)
+    if cache_directory is None:
+        return None
+    os.makedirs(cache_directory)
+    return ElementIndex(notes_directory, cache_directory)
@@ -7,22 +7,36 @@ Shorthand Web API
 import os
 import json
 import logging
+import threading
+from datetime import date
 
 from werkzeug.exceptions import HTTPException
-from flask import Flask, request, render_template, send_from_directory
+from flask import Flask, Response, request, render_template, \
+                  send_from_directory
 
 from shorthand.todo_tools import get_todos, mark_todo, analyze_todos
 from shorthand.stamping import stamp_notes
 from shorthand.search_tools import search_notes, get_note, filename_search, \
                                    record_file_view
 from shorthand.question_tools import get_questions
-from shorthand.definition_tools import get_definitions
-from shorthand.tag_tools import get_tags
+from shorthand.definition_tools import get_definitions, get_definition
+from shorthand.tag_tools import get_tags, get_tag_counts
 from shorthand.calendar_tools import get_calendar
 from shorthand.toc_tools import get_toc
-from shorthand.rec_tools import get_record_sets, get_record_set
-from shorthand.gps_tools import get_locations
+from shorthand.rec_tools import get_record_sets, get_record_set, \
+                                get_record_set_aggregates
+from shorthand.gps_tools import get_locations, get_nearest_locations, \
+                               get_location_clusters
+from shorthand.backends import get_backend
 from shorthand.utils.config import get_notes_config
+from shorthand.utils.scanner import scan_notes
+from shorthand.utils.element_index import ElementIndex
+from shorthand.utils.dashboard import DashboardSummary, DEFAULT_EVENT_SPAN
+from shorthand.utils.glossary import Glossary
+from shorthand.utils.location_index import LocationIndex
+from shorthand.utils.search_index import SearchIndex
+from shorthand.utils.trigram_index import TrigramIndex
+from shorthand.utils.watcher import NotesWatcher
 from shorthand.utils.logging import setup_logging
 from shorthand.utils.render import get_file_content, get_rendered_markdown
 from shorthand.utils.typeahead import get_typeahead_suggestions
@@ -35,10 +49,130 @@ from static_elements import static_content
 
 app = Flask(__name__)
 
+# Content types of the formats which parsed record sets are streamed in
+RECORD_SET_MIMETYPES = {
+    'json': 'application/json',
+    'json_lines': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'rec': 'text/plain'
+}
+
 SHORTHAND_CONFIG = get_notes_config()
 setup_logging(SHORTHAND_CONFIG)
 log = logging.getLogger(__name__)
 
+BACKEND = get_backend(SHORTHAND_CONFIG)
+
+# The web server can skip refreshing the element and search indexes on
+# each request when the notes are being watched, which keeps them current
+INDEX_REFRESH = not SHORTHAND_CONFIG.get('element_index_watched', False)
+
+if SHORTHAND_CONFIG.get('element_source') == 'index':
+    ELEMENT_INDEX = ElementIndex(SHORTHAND_CONFIG['notes_directory'],
+                                 SHORTHAND_CONFIG['cache_directory'])
+else:
+    ELEMENT_INDEX = None
+
+if ELEMENT_INDEX is not None:
+    DASHBOARD = DashboardSummary(
+        ELEMENT_INDEX,
+        directory_filter=SHORTHAND_CONFIG.get('default_directory'))
+    GLOSSARY = Glossary(ELEMENT_INDEX)
+    LOCATION_INDEX = LocationIndex(ELEMENT_INDEX)
+else:
+    DASHBOARD = None
+    GLOSSARY = None
+    LOCATION_INDEX = None
+
+if SHORTHAND_CONFIG.get('search_engine') == 'index':
+    SEARCH_INDEX = SearchIndex(SHORTHAND_CONFIG['notes_directory'])
+elif SHORTHAND_CONFIG.get('search_engine') == 'trigram':
+    SEARCH_INDEX = TrigramIndex(SHORTHAND_CONFIG['notes_directory'])
+else:
+    SEARCH_INDEX = None
+
+
+def watch_search_index():
+    '''Keep the in-memory search index current by refreshing only the
+    notes which change. The watcher process only keeps the element
+    index on disk current, so the search index needs its own watcher
+    within the web server
+    '''
+    watcher = NotesWatcher(
+        SHORTHAND_CONFIG['notes_directory'],
+        lambda changed_paths: SEARCH_INDEX.refresh(paths=changed_paths),
+        debounce_seconds=SHORTHAND_CONFIG.get('watch_debounce_seconds',
+                                              0.5))
+    watcher.run()
+
+
+if SEARCH_INDEX is not None and not INDEX_REFRESH:
+    # Searches skip checking every note for changes, so the index is
+    # built once up front and then only updated by the watcher
+    SEARCH_INDEX.refresh()
+    threading.Thread(target=watch_search_index, daemon=True).start()
+
+
+def get_elements(directory_filter=None, element_types=None, tag=None):
+    '''Get the elements to serve the shorthand tools from based on the
+    configured `element_source`. Returns None if each tool should run
+    its own search instead
+
+    `element_types` lists the element types which are needed, which
+        allows the element index to skip loading the others
+    `tag` allows the element index to only load the elements with
+        that tag, which the tools still filter on themselves
+    '''
+
+    element_source = SHORTHAND_CONFIG.get('element_source', 'scan')
+    if element_source == 'scan':
+        return scan_notes(SHORTHAND_CONFIG['notes_directory'],
+                          directory_filter=directory_filter)
+    elif element_source == 'index':
+        return ELEMENT_INDEX.get_elements(directory_filter=directory_filter,
+                                          element_types=element_types,
+                                          refresh=INDEX_REFRESH, tag=tag)
+    elif element_source == 'grep':
+        return None
+    else:
+        raise ValueError(f'Unknown element source {element_source}')
+
+
+def get_element_source(directory_filter=None, element_types=None):
+    '''Get the arguments for tools which can query the element index
+    directly, such as through its calendar view or tag index. Other
+    sources provide all elements for the tool to filter
+    '''
+
+    if ELEMENT_INDEX is not None:
+        return {'element_index': ELEMENT_INDEX}
+    return {'elements': get_elements(directory_filter,
+                                     element_types=element_types)}
+
+
+def get_definition_source(directory_filter=None):
+    '''Get the arguments for the definition tools, which look terms up
+    from the glossary when the element index is in use
+    '''
+
+    if GLOSSARY is not None:
+        GLOSSARY.update(refresh=INDEX_REFRESH)
+        return {'glossary': GLOSSARY}
+    return {'elements': get_elements(directory_filter,
+                                     element_types=['definitions'])}
+
+
+def get_location_source(directory_filter=None):
+    '''Get the arguments for the location tools, which look locations
+    up from the location index when the element index is in use
+    '''
+
+    if LOCATION_INDEX is not None:
+        LOCATION_INDEX.update(refresh=INDEX_REFRESH)
+        return {'location_index': LOCATION_INDEX}
+    return {'elements': get_elements(directory_filter,
+                                     element_types=['locations'])}
+
 
 @app.errorhandler(Exception)
 def handle_exception(e):
@@ -80,45 +214,73 @@ def pull_notes_repo():
 @app.route('/', methods=['GET'])
 def show_home_page():
     default_directory = SHORTHAND_CONFIG.get('default_directory')
-    todos = get_todos(
-        notes_directory=SHORTHAND_CONFIG['notes_directory'],
-        todo_status='incomplete',
-        directory_filter=default_directory,
-        grep_path=SHORTHAND_CONFIG.get('grep_path', 'grep'))
-    questions = get_questions(
-        notes_directory=SHORTHAND_CONFIG['notes_directory'],
-        question_status='unanswered',
-        directory_filter=default_directory,
-        grep_path=SHORTHAND_CONFIG.get('grep_path', 'grep'))
-    summary = get_calendar(SHORTHAND_CONFIG['notes_directory'])
+
+    if DASHBOARD is not None:
+        summary = DASHBOARD.get_summary(refresh=INDEX_REFRESH)
+        num_todos = summary['incomplete_todos']
+        num_questions = summary['unanswered_questions']
+        calendar_events = summary['events']
+    else:
+        # Serve everything on the home page from a single scan
+        elements = get_elements(
+            element_types=['todos', 'questions', 'headings'])
+        todos = get_todos(
+            notes_directory=SHORTHAND_CONFIG['notes_directory'],
+            todo_status='incomplete',
+            directory_filter=default_directory,
+            grep_path=SHORTHAND_CONFIG.get('grep_path', 'grep'),
+            backend=BACKEND,
+            elements=elements)
+        questions = get_questions(
+            notes_directory=SHORTHAND_CONFIG['notes_directory'],
+            question_status='unanswered',
+            directory_filter=default_directory,
+            grep_path=SHORTHAND_CONFIG.get('grep_path', 'grep'),
+            backend=BACKEND,
+            elements=elements)
+        num_todos = len(todos)
+        num_questions = len(questions)
+        # The home page calendar only shows the weeks around today
+        today = date.today()
+        calendar = get_calendar(
+            SHORTHAND_CONFIG['notes_directory'],
+            directory_filter=default_directory,
+            grep_path=SHORTHAND_CONFIG.get('grep_path', 'grep'),
+            backend=BACKEND,
+            start=(today - DEFAULT_EVENT_SPAN).isoformat(),
+            end=(today + DEFAULT_EVENT_SPAN).isoformat(),
+            elements=elements)
+        calendar_events = []
+        for year, year_data in calendar.items():
+            for month, month_data in year_data.items():
+                for day, day_data in month_data.items():
+                    calendar_events.extend(day_data)
+
     events = []
-    for year, year_data in summary.items():
-        for month, month_data in year_data.items():
-            for day, day_data in month_data.items():
-                for event in day_data:
-                    formatted_event = {
-                        'title': event['event'],
-                        'start': f'{year}-{month}-{day}',
-                        'url': f'/render?path={event["file_path"]}'
-                               f'#line-number-{event["line_number"]}',
-                        'type': event['type']
-                    }
-                    if formatted_event['type'] == 'section':
-                        formatted_event['color'] = 'black'
-                    elif formatted_event['type'] == 'incomplete_todo':
-                        formatted_event['color'] = 'red'
-                    elif formatted_event['type'] == 'completed_todo':
-                        formatted_event['color'] = 'blue'
-                    elif formatted_event['type'] == 'skipped_todo':
-                        formatted_event['color'] = 'grey'
-                    elif formatted_event['type'] == 'question':
-                        formatted_event['color'] = 'purple'
-                    elif formatted_event['type'] == 'answer':
-                        formatted_event['color'] = 'green'
-                    events.append(formatted_event)
-
-    return render_template('home.j2', num_todos=len(todos),
-                           num_questions=len(questions),
+    for event in calendar_events:
+        formatted_event = {
+            'title': event['event'],
+            'start': event['date'],
+            'url': f'/render?path={event["file_path"]}'
+                   f'#line-number-{event["line_number"]}',
+            'type': event['type']
+        }
+        if formatted_event['type'] == 'section':
+            formatted_event['color'] = 'black'
+        elif formatted_event['type'] == 'incomplete_todo':
+            formatted_event['color'] = 'red'
+        elif formatted_event['type'] == 'completed_todo':
+            formatted_event['color'] = 'blue'
+        elif formatted_event['type'] == 'skipped_todo':
+            formatted_event['color'] = 'grey'
+        elif formatted_event['type'] == 'question':
+            formatted_event['color'] = 'purple'
+        elif formatted_event['type'] == 'answer':
+            formatted_event['color'] = 'green'
+        events.append(formatted_event)
+
+    return render_template('home.j2', num_todos=num_todos,
+                           num_questions=num_questions,
                            events=json.dumps(events),
                            static_content=static_content)
 
@@ -137,7 +299,10 @@ def show_todos_page():
             all_directories.append(subdir_path)
     default_directory = SHORTHAND_CONFIG.get('default_directory')
     tags = get_tags(SHORTHAND_CONFIG['notes_directory'],
-                    grep_path=SHORTHAND_CONFIG.get('grep_path', 'grep'))
+                    grep_path=SHORTHAND_CONFIG.get('grep_path', 'grep'),
+                    backend=BACKEND,
+                    refresh=INDEX_REFRESH,
+                    **get_element_source(element_types=['tags']))
 
     log.info('Showing the home page')
     return render_template('todos.j2', all_directories=all_directories,
@@ -159,7 +324,10 @@ def show_questions():
             all_directories.append(subdir_path)
     default_directory = SHORTHAND_CONFIG.get('default_directory')
     tags = get_tags(SHORTHAND_CONFIG['notes_directory'],
-                    grep_path=SHORTHAND_CONFIG.get('grep_path', 'grep'))
+                    grep_path=SHORTHAND_CONFIG.get('grep_path', 'grep'),
+                    backend=BACKEND,
+                    refresh=INDEX_REFRESH,
+                    **get_element_source(element_types=['tags']))
 
     log.info('Showing the questions search page')
     return render_template('questions.j2', all_directories=all_directories,
@@ -171,7 +339,9 @@ def show_questions():
 def show_databases():
     record_sets = get_record_sets(
                     notes_directory=SHORTHAND_CONFIG['notes_directory'],
-                    grep_path=SHORTHAND_CONFIG.get('grep_path', 'grep'))
+                    grep_path=SHORTHAND_CONFIG.get('grep_path', 'grep'),
+                    backend=BACKEND,
+                    elements=get_elements(element_types=['record_sets']))
     return render_template('record_sets.j2', record_sets=record_sets,
                            static_content=static_content)
 
@@ -186,10 +356,62 @@ def get_gps_locations():
 
     directory_filter = request.args.get('directory_filter')
 
+    # Bounding boxes are of the form `west,south,east,north`, which
+    # matches the `toBBoxString` of map bounds
+    bbox = request.args.get('bbox')
+    if bbox:
+        bbox_parts = bbox.split(',')
+        if len(bbox_parts) != 4:
+            raise ValueError(f'Invalid bounding box {bbox}')
+        west, south, east, north = bbox_parts
+        bounds = (south, west, north, east)
+    else:
+        bounds = None
+
+    # With a zoom level the locations are grouped into map clusters
+    zoom = request.args.get('zoom')
+    if zoom is not None:
+        clusters = get_location_clusters(
+            notes_directory=SHORTHAND_CONFIG['notes_directory'],
+            zoom=int(zoom),
+            directory_filter=directory_filter,
+            grep_path=SHORTHAND_CONFIG.get('grep_path', 'grep'),
+            backend=BACKEND,
+            bounds=bounds,
+            **get_location_source(directory_filter))
+        return json.dumps(wrap_response_data(clusters))
+
     locations = get_locations(
         notes_directory=SHORTHAND_CONFIG['notes_directory'],
         directory_filter=directory_filter,
-        grep_path=SHORTHAND_CONFIG.get('grep_path', 'grep'))
+        grep_path=SHORTHAND_CONFIG.get('grep_path', 'grep'),
+        backend=BACKEND,
+        bounds=bounds,
+        **get_location_source(directory_filter))
+
+    wrapped_response = wrap_response_data(locations)
+    return json.dumps(wrapped_response)
+
+
+@app.route('/api/v1/locations/nearest', methods=['GET'])
+def get_nearest_gps_locations():
+
+    latitude = request.args.get('latitude')
+    longitude = request.args.get('longitude')
+    if latitude is None or longitude is None:
+        raise ValueError('Both latitude and longitude must be provided')
+    count = int(request.args.get('count', 10))
+    directory_filter = request.args.get('directory_filter')
+
+    locations = get_nearest_locations(
+        notes_directory=SHORTHAND_CONFIG['notes_directory'],
+        latitude=latitude,
+        longitude=longitude,
+        count=count,
+        directory_filter=directory_filter,
+        grep_path=SHORTHAND_CONFIG.get('grep_path', 'grep'),
+        backend=BACKEND,
+        **get_location_source(directory_filter))
 
     wrapped_response = wrap_response_data(locations)
     return json.dumps(wrapped_response)
@@ -247,21 +469,41 @@ def get_current_todos():
     query_string = request.args.get('query_string')
     sort_by = request.args.get('sort_by')
     tag = request.args.get('tag')
+    limit = request.args.get('limit')
+    offset = int(request.args.get('offset', 0))
 
     if directory_filter == 'ALL':
         directory_filter = None
     if tag == 'ALL':
         tag = None
 
+    # Fetch one extra todo to tell whether there is another page
+    page_limit = None
+    if limit is not None:
+        limit = int(limit)
+        page_limit = limit + 1
+
     todos = get_todos(notes_directory=SHORTHAND_CONFIG['notes_directory'],
                       todo_status=status, directory_filter=directory_filter,
                       query_string=query_string, sort_by=sort_by,
                       suppress_future=True, tag=tag,
-                      grep_path=SHORTHAND_CONFIG.get('grep_path', 'grep'))
+                      grep_path=SHORTHAND_CONFIG.get('grep_path', 'grep'),
+                      backend=BACKEND,
+                      elements=get_elements(directory_filter,
+                                            element_types=['todos'],
+                                            tag=tag),
+                      limit=page_limit, offset=offset)
+
+    next_offset = None
+    if limit is not None and len(todos) > limit:
+        todos = todos[:limit]
+        next_offset = offset + limit
     log.info(f'Returning {len(todos)} todo results')
 
     wrapped_response = wrap_response_data(todos)
     wrapped_response['meta'] = analyze_todos(todos)
+    if limit is not None:
+        wrapped_response['next_offset'] = next_offset
     return json.dumps(wrapped_response)
 
 
@@ -286,12 +528,18 @@ def fetch_questions():
     directory_filter = request.args.get('directory_filter')
     if directory_filter == 'ALL':
         directory_filter = None
+    tag = request.args.get('tag')
+    if tag == 'ALL':
+        tag = None
     log.info(f'Getting {status} questions in directory {directory_filter}')
 
     questions = get_questions(
         notes_directory=SHORTHAND_CONFIG['notes_directory'],
         question_status=status, directory_filter=directory_filter,
-        grep_path=SHORTHAND_CONFIG.get('grep_path', 'grep'))
+        grep_path=SHORTHAND_CONFIG.get('grep_path', 'grep'),
+        backend=BACKEND, tag=tag,
+        elements=get_elements(directory_filter,
+                              element_types=['questions'], tag=tag))
     log.info(f'Returning {len(questions)} question results')
     return json.dumps(wrap_response_data(questions))
 
@@ -303,11 +551,17 @@ def fetch_tags():
     if directory_filter == 'ALL':
         directory_filter = None
 
-    tags = get_tags(
+    # Tags are listed along with how often they are used
+    tag_counts = get_tag_counts(
         notes_directory=SHORTHAND_CONFIG['notes_directory'],
         directory_filter=directory_filter,
-        grep_path=SHORTHAND_CONFIG.get('grep_path', 'grep'))
-    return json.dumps(wrap_response_data(tags))
+        grep_path=SHORTHAND_CONFIG.get('grep_path', 'grep'),
+        backend=BACKEND,
+        refresh=INDEX_REFRESH,
+        **get_element_source(directory_filter, element_types=['tags']))
+    wrapped_response = wrap_response_data(sorted(tag_counts.keys()))
+    wrapped_response['meta'] = {'tag_counts': tag_counts}
+    return json.dumps(wrapped_response)
 
 
 @app.route('/api/v1/calendar', methods=['GET'])
@@ -316,11 +570,19 @@ def fetch_calendar():
     directory_filter = request.args.get('directory_filter')
     if directory_filter == 'ALL':
         directory_filter = None
+    start = request.args.get('start')
+    end = request.args.get('end')
 
     calendar = get_calendar(
         notes_directory=SHORTHAND_CONFIG['notes_directory'],
         directory_filter=directory_filter,
-        grep_path=SHORTHAND_CONFIG.get('grep_path', 'grep'))
+        grep_path=SHORTHAND_CONFIG.get('grep_path', 'grep'),
+        backend=BACKEND,
+        start=start, end=end,
+        refresh=INDEX_REFRESH,
+        **get_element_source(
+            directory_filter,
+            element_types=['todos', 'questions', 'headings']))
     return json.dumps(calendar)
 
 
@@ -337,7 +599,10 @@ def show_glossary():
             all_directories.append(subdir_path)
     default_directory = SHORTHAND_CONFIG.get('default_directory')
     tags = get_tags(SHORTHAND_CONFIG['notes_directory'],
-                    grep_path=SHORTHAND_CONFIG.get('grep_path', 'grep'))
+                    grep_path=SHORTHAND_CONFIG.get('grep_path', 'grep'),
+                    backend=BACKEND,
+                    refresh=INDEX_REFRESH,
+                    **get_element_source(element_types=['tags']))
 
     log.info('Showing the Definitions search page')
     return render_template('glossary.j2',
@@ -356,7 +621,31 @@ def fetch_definitions():
     definitions = get_definitions(
         notes_directory=SHORTHAND_CONFIG['notes_directory'],
         directory_filter=directory_filter,
-        grep_path=SHORTHAND_CONFIG.get('grep_path', 'grep'))
+        grep_path=SHORTHAND_CONFIG.get('grep_path', 'grep'),
+        backend=BACKEND,
+        prefix=request.args.get('prefix'),
+        **get_definition_source(directory_filter))
+    return json.dumps(wrap_response_data(definitions))
+
+
+@app.route('/api/v1/definition', methods=['GET'])
+def fetch_definition():
+
+    term = request.args.get('term')
+    if not term:
+        raise ValueError('No term provided')
+
+    directory_filter = request.args.get('directory_filter')
+    if directory_filter == 'ALL':
+        directory_filter = None
+
+    definitions = get_definition(
+        notes_directory=SHORTHAND_CONFIG['notes_directory'],
+        term=term,
+        directory_filter=directory_filter,
+        grep_path=SHORTHAND_CONFIG.get('grep_path', 'grep'),
+        backend=BACKEND,
+        **get_definition_source(directory_filter))
     return json.dumps(wrap_response_data(definitions))
 
 
@@ -370,7 +659,9 @@ def fetch_record_sets():
     record_sets = get_record_sets(
         notes_directory=SHORTHAND_CONFIG['notes_directory'],
         directory_filter=None,
-        grep_path=SHORTHAND_CONFIG.get('grep_path', 'grep'))
+        grep_path=SHORTHAND_CONFIG.get('grep_path', 'grep'),
+        backend=BACKEND,
+        elements=get_elements(element_types=['record_sets']))
     return json.dumps(wrap_response_data(record_sets))
 
 
@@ -396,14 +687,67 @@ def fetch_record_set():
         raise ValueError(f'Argument include_config must be either "true" or '
                          f'"false", found "{include_config}"')
     parse_format = request.args.get('parse_format', 'json')
+    # The offset from the record set catalog skips counting lines
+    start_offset = request.args.get('start_offset')
+    if start_offset:
+        start_offset = int(start_offset)
+    else:
+        start_offset = None
+    # Records can be selected and projected on the server
+    select = request.args.get('select')
+    fields = request.args.get('fields')
+    if fields:
+        fields = [field.strip() for field in fields.split(',')
+                  if field.strip()]
+    else:
+        fields = None
 
-    return get_record_set(
+    record_set = get_record_set(
         notes_directory=SHORTHAND_CONFIG['notes_directory'],
         file_path=file_path,
         line_number=line_number,
         parse=parse,
         parse_format=parse_format,
-        include_config=include_config)
+        include_config=include_config,
+        start_offset=start_offset,
+        stream=True,
+        select=select,
+        fields=fields)
+    if not parse or (parse_format == 'json' and include_config):
+        return record_set
+    # Parsed record sets are sent as they are serialized
+    return Response(record_set,
+                    mimetype=RECORD_SET_MIMETYPES[parse_format])
+
+
+@app.route('/api/v1/record_set/aggregate', methods=['GET'])
+def fetch_record_set_aggregates():
+
+    file_path = request.args.get('file_path')
+    line_number = int(request.args.get('line_number'))
+    start_offset = request.args.get('start_offset')
+    if start_offset:
+        start_offset = int(start_offset)
+    else:
+        start_offset = None
+    # Aggregations such as `count,sum(Amount),p90(Amount)`
+    aggregations = [aggregation.strip() for aggregation
+                    in request.args.get('aggregations', '').split(',')
+                    if aggregation.strip()]
+    group_by = [field.strip() for field
+                in request.args.get('group_by', '').split(',')
+                if field.strip()]
+    select = request.args.get('select')
+
+    aggregates = get_record_set_aggregates(
+        notes_directory=SHORTHAND_CONFIG['notes_directory'],
+        file_path=file_path,
+        line_number=line_number,
+        aggregations=aggregations,
+        group_by=group_by,
+        select=select,
+        start_offset=start_offset)
+    return json.dumps(wrap_response_data(aggregates))
 
 
 @app.route('/search', methods=['GET'])
@@ -417,12 +761,34 @@ def get_search_results():
 
     query_string = request.args.get('query_string')
     case_sensitive = request.args.get('case_sensitive')
+    # Rank results by relevance by default whenever a search index
+    # is available to rank them with
+    if isinstance(SEARCH_INDEX, SearchIndex):
+        default_rank = 'true'
+    else:
+        default_rank = 'false'
+    rank = request.args.get('rank', default_rank)
+    if rank.lower() == 'true':
+        rank = True
+    elif rank.lower() == 'false':
+        rank = False
+    else:
+        raise ValueError(f'Invalid value {rank} for `rank`')
+    limit = request.args.get('limit',
+                             SHORTHAND_CONFIG.get('search_result_limit'))
+    if limit is not None:
+        limit = int(limit)
 
     search_results = search_notes(
         notes_directory=SHORTHAND_CONFIG['notes_directory'],
         query_string=query_string,
         case_sensitive=case_sensitive,
-        grep_path=SHORTHAND_CONFIG.get('grep_path', 'grep'))
+        grep_path=SHORTHAND_CONFIG.get('grep_path', 'grep'),
+        backend=BACKEND,
+        search_index=SEARCH_INDEX,
+        rank=rank,
+        limit=limit,
+        refresh=INDEX_REFRESH)
     return json.dumps(wrap_response_data(search_results))
 
 
@@ -516,7 +882,8 @@ def stamp():
     return stamp_notes(
         notes_directory=SHORTHAND_CONFIG['notes_directory'],
         stamp_todos=True, stamp_today=True,
-        grep_path=SHORTHAND_CONFIG.get('grep_path', 'grep'))
+        grep_path=SHORTHAND_CONFIG.get('grep_path', 'grep'),
+        backend=BACKEND)
 
 
 if __name__ == "__main__":
@@ -12,36 +12,75 @@ document.addEventListener('DOMContentLoaded', function() {
         subdomains:['mt0','mt1','mt2','mt3']
     }).addTo(map);
 
-    $.ajax({
-        url: '/api/v1/locations',
-        type: 'GET',
-        success: function(responseData) {
-            loadedResponse = JSON.parse(responseData);
-            console.log(loadedResponse);
-            for (var i = loadedResponse.items.length - 1; i >= 0; i--) {
-
-                var locLat = loadedResponse.items[i]['latitude']
-                var locLon = loadedResponse.items[i]['longitude']
-                var locName = loadedResponse.items[i]['name']
-                var locPath = loadedResponse.items[i]['file_path']
-                var locDisp = loadedResponse.items[i]['display_path']
-                var locLine = loadedResponse.items[i]['line_number']
-
-                var popupHtml = `${locName}<br /><br />
-                                <a target="_blank" href="/render?path=${locPath}#line-number-${locLine}">
-                                    ${locDisp}
-                                </a><br /><br />
-                                <a target="_blank" href="https://www.google.com/maps/place/${locLat},${locLon}">Google Link</a>`
-
-                L.marker([loadedResponse.items[i]['latitude'], loadedResponse.items[i]['longitude']]).addTo(map)
-                    .bindPopup(popupHtml)
-                    .openPopup();
-            }
-        },
-        error: function(responseData) {
-            var loadedResponse = JSON.parse(responseData.responseText);
-            showModal(loadedResponse.error);
+    // Only the locations within the visible part of the map are loaded,
+    // grouped into clusters by the server for the current zoom level,
+    // and they are replaced each time the map is moved
+    var markers = L.layerGroup().addTo(map);
+
+    function getPopupHtml(location) {
+        var locLat = location['latitude']
+        var locLon = location['longitude']
+        var locName = location['name']
+        var locPath = location['file_path']
+        var locDisp = location['display_path']
+        var locLine = location['line_number']
+
+        return `${locName}<br /><br />
+                <a target="_blank" href="/render?path=${locPath}#line-number-${locLine}">
+                    ${locDisp}
+                </a><br /><br />
+                <a target="_blank" href="https://www.google.com/maps/place/${locLat},${locLon}">Google Link</a>`
+    }
+
+    function addCluster(cluster) {
+        if (cluster['count'] == 1) {
+            var location = cluster['locations'][0];
+            L.marker([location['latitude'], location['longitude']]).addTo(markers)
+                .bindPopup(getPopupHtml(location));
+            return;
         }
-    });
+
+        var clusterIcon = L.divIcon({
+            html: `<div class="shorthand-map-cluster">${cluster['count']}</div>`,
+            className: '',
+            iconSize: [36, 36]
+        });
+        var sampleNames = cluster['locations'].map(function(location) {
+            return location['name'] || location['display_path'];
+        });
+        L.marker([cluster['latitude'], cluster['longitude']], {
+            icon: clusterIcon,
+            title: sampleNames.join(', ')
+        }).addTo(markers).on('click', function() {
+            map.setView([cluster['latitude'], cluster['longitude']],
+                        map.getZoom() + 2);
+        });
+    }
+
+    function loadVisibleLocations() {
+        $.ajax({
+            url: '/api/v1/locations',
+            type: 'GET',
+            data: {
+                'bbox': map.getBounds().toBBoxString(),
+                'zoom': map.getZoom()
+            },
+            success: function(responseData) {
+                loadedResponse = JSON.parse(responseData);
+                console.log(loadedResponse);
+                markers.clearLayers();
+                for (var i = loadedResponse.items.length - 1; i >= 0; i--) {
+                    addCluster(loadedResponse.items[i]);
+                }
+            },
+            error: function(responseData) {
+                var loadedResponse = JSON.parse(responseData.responseText);
+                showModal(loadedResponse.error);
+            }
+        });
+    }
+
+    map.on('moveend', loadVisibleLocations);
+    loadVisibleLocations();
 
 });
@@ -2,6 +2,7 @@ $('.showRec').click( function (ev) {
     var parentElement = $(ev.currentTarget.parentElement.parentElement.parentElement)
     var lineNumber = parentElement.find('.lineNumber').text()
     var filePath = parentElement.find('.filePath').text()
+    var startOffset = parentElement.find('.startOffset').text()
     var tableElement = parentElement.find('.record-set-table')
     ev.currentTarget.remove()
     $.ajax({
@@ -9,6 +10,7 @@ $('.showRec').click( function (ev) {
         url: '/api/v1/record_set?' + $.param({
             file_path: filePath,
             line_number: lineNumber,
+            start_offset: startOffset,
             parse: 'true',
             parse_format: 'json',
             include_config: 'true'
@@ -40,11 +42,13 @@ $('.getCsv').click( function (ev) {
     var parentElement = $(ev.currentTarget.parentElement.parentElement)
     var lineNumber = parentElement.find('.lineNumber').text()
     var filePath = parentElement.find('.filePath').text()
+    var startOffset = parentElement.find('.startOffset').text()
     $.ajax({
         type: 'GET',
         url: '/api/v1/record_set?' + $.param({
             file_path: filePath,
             line_number: lineNumber,
+            start_offset: startOffset,
             parse: 'true',
             parse_format: 'csv'
         }),